@@ -0,0 +1,146 @@
+import contextlib
+import contextvars
+import functools
+import logging
+import os
+
+from asgiref.sync import iscoroutinefunction
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from dotenv import load_dotenv
+
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Alias do banco de leitura, usado pelas views marcadas com @somente_leitura e nos trechos
+# sob leitura_replica()
+BANCO_LEITURA = 'replica'
+
+# Pragmas aplicados a cada conexão SQLite aberta. Com o WAL, leituras não bloqueiam a gravação
+# (e vice-versa); com synchronous=NORMAL, cada commit deixa de esperar o fsync do arquivo
+# principal, que passa a ocorrer apenas nos checkpoints; busy_timeout faz uma conexão aguardar a
+# trava de gravação em vez de falhar na hora com "database is locked".
+PRAGMAS_SQLITE = {
+    'journal_mode': os.getenv('DB_SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.getenv('DB_SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.getenv('DB_SQLITE_BUSY_TIMEOUT_MS', 20000)),
+    'cache_size': -int(os.getenv('DB_SQLITE_CACHE_KB', 20000)),
+    'temp_store': 'MEMORY',
+    'mmap_size': int(os.getenv('DB_SQLITE_MMAP_BYTES', 134217728)),
+    'foreign_keys': 'ON',
+}
+
+# Escopo somente de leitura em andamento: None fora de uma view marcada com @somente_leitura ou
+# de um leitura_replica(); dentro deles, um dicionário que registra se o escopo já gravou algo.
+_escopo_leitura = contextvars.ContextVar('escopo_leitura', default=None)
+
+
+def configurar_sqlite(sender, connection, **kwargs):
+    """
+    Receptor do sinal connection_created: aplica os PRAGMAS_SQLITE às novas conexões SQLite.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, valor in PRAGMAS_SQLITE.items():
+            cursor.execute(f'PRAGMA {pragma} = {valor}')
+
+
+@contextlib.contextmanager
+def leitura_replica():
+    """
+    Envia as consultas do bloco ao banco de leitura (BANCO_LEITURA), pelo RoteadorBancos.
+
+    Se o bloco gravar algo, as leituras seguintes dele voltam ao banco principal, para que
+    enxerguem o que acabou de ser gravado. O escopo vale apenas durante o bloco: consultas feitas
+    depois dele, como as de uma resposta em streaming, vão ao banco principal.
+    """
+    token = _escopo_leitura.set({'gravou': False})
+    try:
+        yield
+    finally:
+        _escopo_leitura.reset(token)
+
+
+def somente_leitura(view):
+    """
+    Marca uma view (síncrona ou assíncrona) que apenas lê o banco: suas consultas rodam sob
+    leitura_replica(). Views que podem gravar (uma sincronização inicial, por exemplo) ou que
+    respondem em streaming devem usar leitura_replica() só nos trechos de leitura.
+    """
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def view_somente_leitura(*args, **kwargs):
+            with leitura_replica():
+                return await view(*args, **kwargs)
+    else:
+        @functools.wraps(view)
+        def view_somente_leitura(*args, **kwargs):
+            with leitura_replica():
+                return view(*args, **kwargs)
+    return view_somente_leitura
+
+
+@contextlib.contextmanager
+def transacao_escrita(using=DEFAULT_DB_ALIAS):
+    """
+    transaction.atomic para blocos que gravam. No SQLite, a transação é aberta com
+    BEGIN IMMEDIATE, que obtém a trava de gravação logo no início.
+
+    Com o BEGIN padrão (DEFERRED), a transação começa lendo e só pede a trava na primeira
+    gravação; se outra conexão gravou nesse meio tempo, o SQLite falha na hora com
+    "database is locked", sem esperar o busy_timeout. Dentro de outra transação, o bloco vira
+    um savepoint, como no atomic.
+
+    :param using: Alias do banco.
+    :type using: str
+    """
+    conexao = connections[using]
+    if conexao.vendor != 'sqlite' or conexao.in_atomic_block:
+        with transaction.atomic(using=using):
+            yield
+        return
+
+    # O Django 5.0 não permite escolher o modo da transação do SQLite: o atomic a abre com
+    # _start_transaction_under_autocommit, substituído apenas nesta conexão e neste bloco
+    def begin_immediate():
+        conexao.cursor().execute('BEGIN IMMEDIATE')
+
+    conexao._start_transaction_under_autocommit = begin_immediate
+    try:
+        with transaction.atomic(using=using):
+            del conexao._start_transaction_under_autocommit
+            yield
+    finally:
+        conexao.__dict__.pop('_start_transaction_under_autocommit', None)
+
+
+class RoteadorBancos:
+    """
+    Envia as gravações ao banco principal (default) e as leituras das views marcadas com
+    @somente_leitura, ou feitas sob leitura_replica(), ao banco de leitura. As demais leituras, e todas as que ocorrem dentro de
+    uma transação no banco principal, continuam no principal.
+
+    Por padrão o banco de leitura é o mesmo arquivo SQLite do principal; em um banco servidor,
+    DB_LEITURA_* apontam para a réplica.
+    """
+
+    def db_for_read(self, model, **hints):
+        escopo = _escopo_leitura.get()
+        if (escopo is None or escopo['gravou'] or BANCO_LEITURA not in connections
+                or connections[DEFAULT_DB_ALIAS].in_atomic_block):
+            return DEFAULT_DB_ALIAS
+        return BANCO_LEITURA
+
+    def db_for_write(self, model, **hints):
+        escopo = _escopo_leitura.get()
+        if escopo is not None:
+            escopo['gravou'] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # O banco de leitura é uma cópia do principal: objetos de ambos se relacionam
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -31,6 +31,8 @@ DEBUG = False
 ALLOWED_HOSTS = ['*']
 
 CORS_ALLOW_ALL_ORIGINS = True
+CORS_EXPOSE_HEADERS = ['X-Vendas-Idade', 'X-Vendas-Sincronizado-Em',
+                       'X-Vendas-Atualizando', 'X-Vendas-Proximo-Cursor', 'ETag', 'Last-Modified']
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
@@ -96,12 +98,38 @@ WSGI_APPLICATION = 'backend_rocinante.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# As conexões ficam abertas entre requisições por DB_CONN_MAX_AGE segundos (0 fecha ao fim de
+# cada requisição) e são verificadas antes de reutilizadas. Cada conexão SQLite recebe os pragmas
+# de backend_rocinante.banco (WAL, synchronous=NORMAL, busy_timeout).
+# O banco 'replica' atende as views somente de leitura (backend_rocinante.banco.RoteadorBancos);
+# sem DB_LEITURA_*, é o próprio banco principal.
+
+DB_ENGINE = os.getenv('DB_ENGINE', 'django.db.backends.sqlite3')
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', 60))
+
+
+def _banco(prefixo, padrao=None):
+    padrao = padrao or {}
+    return {
+        'ENGINE': os.getenv(f'{prefixo}_ENGINE', padrao.get('ENGINE', DB_ENGINE)),
+        'NAME': os.getenv(f'{prefixo}_NAME', padrao.get('NAME', BASE_DIR / 'db.sqlite3')),
+        'USER': os.getenv(f'{prefixo}_USER', padrao.get('USER', '')),
+        'PASSWORD': os.getenv(f'{prefixo}_PASSWORD', padrao.get('PASSWORD', '')),
+        'HOST': os.getenv(f'{prefixo}_HOST', padrao.get('HOST', '')),
+        'PORT': os.getenv(f'{prefixo}_PORT', padrao.get('PORT', '')),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
     }
+
+
+DATABASES = {
+    'default': _banco('DB'),
+}
+DATABASES['replica'] = {
+    **_banco('DB_LEITURA', DATABASES['default']),
+    'TEST': {'MIRROR': 'default'},
 }
+DATABASE_ROUTERS = ['backend_rocinante.banco.RoteadorBancos']
 
 
 # Password validation
@@ -184,5 +212,10 @@ LOGGING = {
             'level': 'ERROR',
             'propagate': True,
         },
+        'vendas_class': {
+            'handlers': ['file', 'console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
     },
 }
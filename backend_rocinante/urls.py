@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.urls import path
 from auth_class.views import AuthView, index
-from vendas_class import views
+from vendas_class import async_views, views
 from recuperar_senha.views import PasswordResetView
 from log import views as log_views
 from django.urls import path, re_path
@@ -20,6 +20,17 @@ urlpatterns = [
          views.set_adiantamentos_view, name='set_adiantamentos'),
     path('log/', log_views.log_from_frontend, name='log_from_frontend'),
     path('webhook-omie/', views.webhook_omie, name='webhook_omie'),
+    path('omie_vendas/status/', views.status_omie_view, name='status_omie'),
+    path('omie_vendas/resumo/', views.resumo_vendas_view, name='resumo_vendas'),
+    path('omie_vendas/busca/', views.buscar_vendas_view, name='buscar_vendas'),
+    path('omie_vendas/async/get_vendas/',
+         async_views.get_vendas_view, name='get_vendas_async'),
+    path('omie_vendas/async/alterar_pedido/',
+         async_views.alterar_pedido_view, name='alterar_pedido_async'),
+    path('omie_vendas/async/set_adiantamentos/',
+         async_views.set_adiantamentos_view, name='set_adiantamentos_async'),
+    path('webhook-omie/async/', async_views.webhook_omie,
+         name='webhook_omie_async'),
     path('', index, name='index'),
     re_path(r'^.*$', TemplateView.as_view(template_name='index.html')),
     path('get-csrf-token/', csrf_token)
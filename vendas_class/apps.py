@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class VendasClassConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'vendas_class'
+
+    def ready(self):
+        from backend_rocinante.banco import configurar_sqlite
+        connection_created.connect(configurar_sqlite, dispatch_uid='configurar_sqlite')
+        # Registra o receptor que gera o snapshot da listagem após cada alteração das vendas
+        from . import snapshot  # noqa: F401
@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import os
+
+from asgiref.sync import sync_to_async
+from dotenv import load_dotenv
+
+from .services import OmieVendasBase
+from .transport import get_async_transport
+
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Número máximo de requisições à Omie em andamento ao mesmo tempo por cliente
+OMIE_ASYNC_CONCORRENCIA = int(os.getenv('OMIE_ASYNC_CONCORRENCIA', 20))
+
+
+class AsyncOmieVendas(OmieVendasBase):
+    def __init__(self, app_key, app_secret, max_concorrencia=OMIE_ASYNC_CONCORRENCIA, transport=None):
+        """
+        Cliente assíncrono da API de pedidos da Omie, com os mesmos métodos e erros do OmieVendas.
+
+        :param max_concorrencia: Limite de requisições simultâneas feitas por este cliente.
+        :type max_concorrencia: int
+        :param transport: Transporte a ser usado; por padrão o AsyncOmieTransport do event loop
+                          (veja get_async_transport). Quem o passa é responsável por fechá-lo.
+        :type transport: AsyncOmieTransport
+        """
+        super().__init__(app_key, app_secret)
+        self.max_concorrencia = max_concorrencia
+        self._transport = transport
+        self._semaforo = asyncio.Semaphore(max_concorrencia)
+
+    @property
+    def transport(self):
+        return self._transport or get_async_transport()
+
+    async def _post(self, payload):
+        async with self._semaforo:
+            return await self.transport.post(self.url, payload)
+
+    async def _buscar_pagina(self, pagina, alterados_desde=None):
+        try:
+            response = await self._post(
+                self._payload_pagina(pagina, alterados_desde))
+        except Exception as e:
+            logger.critical(
+                f'Erro no response de na busca das vendas: {e}', exc_info=True)
+            raise e
+
+        return self._tratar_resposta_pagina(response, pagina)
+
+    async def get_vendas(self, alterados_desde=None):
+        """
+        Recupera as vendas não faturadas pela API 'ListarPedidos', buscando as páginas
+        restantes ao mesmo tempo e mantendo a ordem das páginas.
+
+        :param alterados_desde: Se informado, busca apenas pedidos incluídos ou alterados a partir desse instante.
+        :type alterados_desde: datetime
+        :return: Uma lista de dicionarios de venda.
+        :rtype: list[dict]
+        :raises: Exception em caso de erro HTTP, resposta inválida da API ou erro geral durante o processo.
+        """
+        try:
+            primeira_pagina = await self._buscar_pagina(1, alterados_desde)
+            total_paginas = primeira_pagina.get("total_de_paginas", 1)
+
+            demais_paginas = await asyncio.gather(*(
+                self._buscar_pagina(pagina, alterados_desde)
+                for pagina in range(2, total_paginas + 1)))
+
+            return self._vendas_nao_faturadas([primeira_pagina, *demais_paginas])
+        except Exception as e:
+            logger.critical(
+                f'Erro no TRY/EXCEPT geral de buscar vendas: {e}', exc_info=True)
+            raise e
+
+    async def consultar_pedido(self, numero_pedido):
+        """
+        Consulta um pedido de venda por meio da API de "ConsultarPedido" da Omie.
+
+        :param numero_pedido: O número do pedido de venda a ser consultado.
+        :ptype numero_pedido: int ou str
+        :return: Um dicionário contendo informações sobre o pedido de venda.
+        :rtype: dict
+        :raises: Exception em caso de erro HTTP ou KeyError se 'pedido_venda_produto' não estiver na resposta.
+        """
+        pedido = self.cache.obter(numero_pedido)
+        if pedido is not None:
+            return pedido
+
+        payload = self._payload(
+            'ConsultarPedido', {"numero_pedido": numero_pedido})
+        response = await self._post(payload)
+        pedido = self._tratar_resposta_consulta(response)
+        self.cache.guardar(numero_pedido, pedido)
+        return pedido
+
+    async def alterar_pedido(self, pedido):
+        """
+        Altera um pedido de venda por meio da API de 'AlterarPedidoVenda' da Omie.
+
+        :param pedido: Um dicionário contendo detalhes do pedido a ser alterado.
+        :type pedido: dict
+        :return: Um JSON com a resposta da API.
+        :rtype: dict
+        :raises: Exception em caso de erro HTTP, resposta inválida da API ou erro geral durante o processo.
+        """
+        try:
+            payload = self._payload('AlterarPedidoVenda', pedido)
+            try:
+                response = await self._post(payload)
+            finally:
+                self._invalidar_cache(pedido)
+            return self._tratar_resposta_alteracao(response)
+        except Exception as e:
+            logger.critical(
+                f'Erro no TRY/EXCEPT geral de alterar pedido: {e}', exc_info=True)
+            raise e
+
+    async def consultar_pedidos(self, numeros_pedido):
+        """
+        Consulta vários pedidos ao mesmo tempo.
+
+        :param numeros_pedido: Os números dos pedidos a consultar.
+        :type numeros_pedido: list[int ou str]
+        :return: Os pedidos na mesma ordem da entrada; a exceção no lugar de cada consulta que falhou.
+        :rtype: list[dict ou Exception]
+        """
+        return await asyncio.gather(*(
+            self.consultar_pedido(numero_pedido) for numero_pedido in numeros_pedido),
+            return_exceptions=True)
+
+    async def alterar_pedidos(self, pedidos):
+        """
+        Altera vários pedidos ao mesmo tempo.
+
+        :param pedidos: Os pedidos a alterar, no formato do alterar_pedido.
+        :type pedidos: list[dict]
+        :return: As respostas na mesma ordem da entrada; a exceção no lugar de cada alteração que falhou.
+        :rtype: list[dict ou Exception]
+        """
+        return await asyncio.gather(*(
+            self.alterar_pedido(pedido) for pedido in pedidos),
+            return_exceptions=True)
+
+    async def set_adiantamentos(self, dados):
+        """
+        Adianta as parcelas das vendas informadas, como o OmieVendas.set_adiantamentos, enviando
+        as alterações à Omie ao mesmo tempo (limitadas por 'max_concorrencia').
+
+        :param dados: Um dicionário com 'numerosVendas' e 'dataVencimento' ('%d/%m/%Y').
+        :type dados: dict
+        :return: Um dicionário com 'status_code', 'message' e, se houver, 'erros'.
+        :rtype: dict
+        :raises: Exception em caso de erro geral durante o processo.
+        """
+        try:
+            vendas_a_adiantar, resultados, a_alterar = await sync_to_async(
+                self._preparar_adiantamentos)(dados)
+
+            respostas = await self.alterar_pedidos(
+                [self._detalhes_adiantamento(venda) for _, venda in a_alterar])
+            for (indice, _), resposta in zip(a_alterar, respostas):
+                resultados[indice] = self._erro_adiantamento(
+                    vendas_a_adiantar[indice], resposta)
+
+            return await sync_to_async(self._concluir_adiantamentos)(vendas_a_adiantar, resultados)
+        except Exception as e:
+            logger.critical(
+                f'Erro ao adiantar pedidos: {e}', exc_info=True)
+            raise e
+
+    async def excluir_pedidos(self, pedidos):
+        """
+        Exclui vendas do banco de dados com base em uma lista de números de pedido.
+
+        :param pedidos: Uma lista de números de pedidos.
+        """
+        await sync_to_async(self._excluir_pedidos)(pedidos)
@@ -0,0 +1,151 @@
+import json
+import logging
+import os
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from dotenv import load_dotenv
+
+from backend_rocinante.banco import leitura_replica
+from .async_services import AsyncOmieVendas
+from .fila import aenfileirar_evento
+from .listagem import ConsultaVendas, ParametroInvalidoError
+from .models import Venda
+from .resiliencia import CircuitoAbertoError, circuito_omie
+from .sincronizacao import aestado_vendas, sincronizacao_inicial
+from .snapshot import obter_snapshot, snapshot_em_memoria
+from .views import (_atualizar_se_antigo, _idade_vendas, _nao_modificado, _omie_indisponivel,
+                    _parametro_invalido, _resposta_adiantamentos, _resposta_snapshot,
+                    _resposta_vendas, _sincronizacao_em_andamento)
+
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+APP_KEY = os.getenv('APP_KEY')
+APP_SECRET = os.getenv('APP_SECRET')
+
+# Versões assíncronas das rotas que dependem da Omie: sob ASGI, uma requisição aguardando a Omie
+# não ocupa uma thread, e um único worker atende várias delas ao mesmo tempo.
+
+
+def _sincronizacao_inicial_em_executor():
+    # Roda em uma thread do executor do asgiref, reaproveitada entre requisições e fora do ciclo
+    # de requisição do Django: as conexões abertas aqui são fechadas ao fim, como em
+    # atualizar_em_segundo_plano, para não acumularem com o CONN_MAX_AGE
+    try:
+        return sincronizacao_inicial()
+    finally:
+        connections.close_all()
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+async def get_vendas_view(request):
+    try:
+        consulta = ConsultaVendas(request.GET)
+        if not await Venda.objects.aexists():
+            if not circuito_omie.disponivel():
+                return _omie_indisponivel()
+            # A sincronização inicial bloqueia enquanto espera a Omie ou outra requisição,
+            # por isso roda fora da thread do event loop
+            if not await sync_to_async(_sincronizacao_inicial_em_executor, thread_sensitive=False)():
+                return _sincronizacao_em_andamento()
+
+        estado = await aestado_vendas()
+        idade = _idade_vendas(estado['ultima_sincronizacao'])
+        atualizando = _atualizar_se_antigo(idade)
+
+        nao_modificado = _nao_modificado(request, estado, idade, atualizando)
+        if nao_modificado is not None:
+            return nao_modificado
+
+        if consulta.padrao:
+            versao = estado['versao'] or 0
+            snapshot = snapshot_em_memoria(versao) or await sync_to_async(obter_snapshot)(versao)
+            if snapshot[0] >= versao:
+                return _resposta_snapshot(request, snapshot, estado, idade, atualizando)
+            # Snapshot anterior à última gravação: a listagem é lida na hora (veja a view síncrona)
+            return _resposta_vendas(consulta.ajson_em_fluxo(), estado, idade, atualizando)
+        if consulta.streaming:
+            return _resposta_vendas(consulta.ajson_em_fluxo(), estado, idade, atualizando)
+        # Só a página vai ao banco de leitura (veja a view síncrona)
+        with leitura_replica():
+            vendas_data, proximo_cursor = consulta.pagina(
+                [linha async for linha in consulta.queryset()])
+
+        return _resposta_vendas(vendas_data, estado, idade, atualizando, proximo_cursor)
+
+    except ParametroInvalidoError as e:
+        return _parametro_invalido(e)
+    except CircuitoAbertoError:
+        return _omie_indisponivel()
+    except Exception as e:
+        logger.critical(f'Erro na rota de buscar vendas: {e}', exc_info=True)
+        return HttpResponse(str(e), status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def alterar_pedido_view(request):
+    try:
+        pedido = json.loads(request.body)
+        if not circuito_omie.disponivel():
+            return _omie_indisponivel()
+        omie_vendas = AsyncOmieVendas(APP_KEY, APP_SECRET)
+        try:
+            resposta = await omie_vendas.alterar_pedido(pedido)
+            return JsonResponse(resposta, status=200)
+
+        except CircuitoAbertoError:
+            return _omie_indisponivel()
+        except Exception as e:
+            logger.error(
+                f'Erro na resposta do serviço de alterar pedidos: {e}', exc_info=True)
+            return HttpResponse(str(e), status=500)
+    except Exception as e:
+        logger.critical(f'Erro na rota de alterar pedidos: {e}', exc_info=True)
+        return HttpResponse(str(e), status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def set_adiantamentos_view(request):
+    try:
+        vendas_a_adiantar = json.loads(request.body)
+
+        if not circuito_omie.disponivel():
+            return _omie_indisponivel()
+        omie_vendas = AsyncOmieVendas(APP_KEY, APP_SECRET)
+        resultado = await omie_vendas.set_adiantamentos(vendas_a_adiantar)
+
+        return _resposta_adiantamentos(resultado)
+
+    except Exception as e:
+        logger.critical(
+            f'Erro na rota de adiantar pedidos: {e}', exc_info=True)
+        return HttpResponse(str(e), status=500)
+
+
+@csrf_exempt
+async def webhook_omie(request):
+    """
+    Versão assíncrona do webhook da Omie: apenas enfileira o evento.
+    """
+    try:
+        data = json.loads(request.body)
+        numero_pedido = data.get('numero_pedido')
+
+        if numero_pedido is None:
+            raise ValueError("Número do pedido não fornecido")
+
+        await aenfileirar_evento(numero_pedido, data.get('messageId'))
+
+        return JsonResponse({"message": "Evento recebido"}, status=200)
+    except Exception as e:
+        logger.critical(
+            f'Erro no webhook de vendas: {e}', exc_info=True)
+        return JsonResponse({"status": "error", "message": str(e)}, status=500)
@@ -0,0 +1,105 @@
+import re
+
+from django.apps import apps
+from django.db import connections, router
+
+
+# Índice FTS5 do SQLite com o número do pedido do cliente e a descrição e o código dos produtos
+# de cada venda; o rowid é o id da Venda. Criado pela migração 0016.
+TABELA_BUSCA = 'vendas_class_busca_venda'
+
+_TERMO = re.compile(r'\w+')
+# Bancos em que o índice já foi encontrado, para não consultar o catálogo a cada gravação
+_bancos_com_indice = set()
+
+
+def _conexao(leitura=False):
+    # O índice acompanha a tabela de vendas: a conexão vem do roteador, como nas consultas do ORM
+    venda = apps.get_model('vendas_class', 'Venda')
+    return connections[router.db_for_read(venda) if leitura else router.db_for_write(venda)]
+
+
+def disponivel(leitura=False):
+    """
+    Indica se o índice de busca existe no banco (SQLite com FTS5).
+
+    :param leitura: Se verifica o banco de leitura das vendas, em vez do de gravação.
+    :type leitura: bool
+    :rtype: bool
+    """
+    connection = _conexao(leitura)
+    if connection.vendor != 'sqlite':
+        return False
+    banco = connection.settings_dict['NAME']
+    if banco not in _bancos_com_indice and TABELA_BUSCA in connection.introspection.table_names():
+        _bancos_com_indice.add(banco)
+    return banco in _bancos_com_indice
+
+
+def _documento(venda):
+    produtos = venda.produtos or []
+    return (venda.pk, venda.numero_pedido_cliente or '',
+            ' '.join(str(produto.get('descricao') or '') for produto in produtos),
+            ' '.join(str(produto.get('codigo') or '') for produto in produtos))
+
+
+def indexar(vendas):
+    """
+    Grava (ou substitui) as vendas no índice de busca.
+
+    :param vendas: Vendas já gravadas, com pk.
+    :type vendas: list[Venda]
+    """
+    if not vendas or not disponivel():
+        return
+    with _conexao().cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {TABELA_BUSCA} WHERE rowid = %s', [(venda.pk,) for venda in vendas])
+        cursor.executemany(
+            f'INSERT INTO {TABELA_BUSCA} (rowid, numero_pedido_cliente, descricoes, codigos) '
+            f'VALUES (%s, %s, %s, %s)', [_documento(venda) for venda in vendas])
+
+
+def remover(ids):
+    """
+    Remove as vendas do índice de busca.
+
+    :param ids: Os ids das vendas.
+    :type ids: list[int]
+    """
+    if not ids or not disponivel():
+        return
+    with _conexao().cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {TABELA_BUSCA} WHERE rowid = %s', [(id_venda,) for id_venda in ids])
+
+
+def termos(texto):
+    """
+    :return: As palavras do texto buscado, sem pontuação nem operadores.
+    :rtype: list[str]
+    """
+    return _TERMO.findall(texto or '')
+
+
+def buscar(texto, limite):
+    """
+    Busca as vendas cujo número do pedido do cliente, descrição ou código de produto contêm
+    palavras que começam com cada um dos termos do texto, ordenadas pela relevância (bm25).
+
+    :param texto: O texto buscado.
+    :type texto: str
+    :param limite: Quantidade máxima de resultados.
+    :type limite: int
+    :return: Os ids das vendas encontradas, da mais para a menos relevante.
+    :rtype: list[int]
+    """
+    palavras = termos(texto)
+    if not palavras:
+        return []
+    consulta = ' '.join(f'"{palavra}"*' for palavra in palavras)
+    with _conexao(leitura=True).cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {TABELA_BUSCA} WHERE {TABELA_BUSCA} MATCH %s '
+            f'ORDER BY rank LIMIT %s', [consulta, limite])
+        return [linha[0] for linha in cursor.fetchall()]
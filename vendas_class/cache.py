@@ -0,0 +1,100 @@
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+OMIE_CACHE_PEDIDOS_TTL = float(os.getenv('OMIE_CACHE_PEDIDOS_TTL', 60))
+OMIE_CACHE_PEDIDOS_TAMANHO = int(os.getenv('OMIE_CACHE_PEDIDOS_TAMANHO', 1000))
+
+
+class CacheTTL:
+    def __init__(self, tamanho_maximo=OMIE_CACHE_PEDIDOS_TAMANHO, ttl=OMIE_CACHE_PEDIDOS_TTL):
+        """
+        Cache em memória, seguro entre threads, com expiração por TTL e descarte do item
+        menos usado recentemente (LRU) quando atinge 'tamanho_maximo'.
+
+        Os valores são copiados ao entrar e ao sair, para que quem usa o valor não altere o cache.
+
+        :param tamanho_maximo: Quantidade máxima de itens.
+        :type tamanho_maximo: int
+        :param ttl: Segundos até um item expirar.
+        :type ttl: float
+        """
+        self.tamanho_maximo = tamanho_maximo
+        self.ttl = ttl
+        self.acertos = 0
+        self.falhas = 0
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _chave(chave):
+        return str(chave)
+
+    def obter(self, chave):
+        """
+        :return: O valor guardado, ou None se não existir ou tiver expirado.
+        """
+        chave = self._chave(chave)
+        with self._lock:
+            item = self._itens.get(chave)
+            if item is None or item[0] <= time.monotonic():
+                if item is not None:
+                    del self._itens[chave]
+                self.falhas += 1
+                return None
+            self._itens.move_to_end(chave)
+            self.acertos += 1
+            valor = item[1]
+        return copy.deepcopy(valor)
+
+    def guardar(self, chave, valor):
+        valor = copy.deepcopy(valor)
+        with self._lock:
+            self._itens[self._chave(chave)] = (
+                time.monotonic() + self.ttl, valor)
+            self._itens.move_to_end(self._chave(chave))
+            while len(self._itens) > self.tamanho_maximo:
+                self._itens.popitem(last=False)
+
+    def invalidar(self, chave):
+        with self._lock:
+            self._itens.pop(self._chave(chave), None)
+
+    def invalidar_se(self, predicado):
+        """
+        Remove os itens cujo valor satisfaz o predicado.
+        """
+        with self._lock:
+            for chave in [chave for chave, (_, valor) in self._itens.items() if predicado(valor)]:
+                del self._itens[chave]
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self.acertos = 0
+            self.falhas = 0
+
+    def estatisticas(self):
+        """
+        :return: Acertos, falhas, quantidade de itens e a taxa de acerto do cache.
+        :rtype: dict
+        """
+        with self._lock:
+            consultas = self.acertos + self.falhas
+            return {
+                "acertos": self.acertos,
+                "falhas": self.falhas,
+                "itens": len(self._itens),
+                "taxa_acerto": round(self.acertos / consultas, 3) if consultas else None,
+            }
+
+
+# Respostas do 'ConsultarPedido', por numero_pedido
+cache_pedidos = CacheTTL()
\ No newline at end of file
@@ -0,0 +1,150 @@
+import logging
+import os
+import uuid
+from datetime import timedelta
+
+from django.db.models import F, Min
+from django.utils import timezone
+from dotenv import load_dotenv
+
+from .models import EventoWebhook, SincronizacaoOmie, Venda
+from .resiliencia import CircuitoAbertoError
+from .snapshot import gerar_snapshot
+
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Segundos que um evento aguarda na fila, para que os eventos repetidos do mesmo pedido
+# recebidos nesse intervalo sejam processados com uma única consulta à Omie
+WEBHOOK_JANELA_COALESCENCIA = float(
+    os.getenv('WEBHOOK_JANELA_COALESCENCIA', 5))
+WEBHOOK_MAX_TENTATIVAS = int(os.getenv('WEBHOOK_MAX_TENTATIVAS', 5))
+# Validade da trava da fila, renovada a cada pedido; expira sozinha se o processo morrer
+WEBHOOK_TRAVA_SEGUNDOS = int(os.getenv('WEBHOOK_TRAVA_SEGUNDOS', 5 * 60))
+
+
+def enfileirar_evento(numero_pedido, message_id=''):
+    """
+    Grava um evento de webhook da Omie na fila para processamento em segundo plano.
+
+    :param numero_pedido: O número do pedido alterado na Omie.
+    :type numero_pedido: int ou str
+    :param message_id: O 'messageId' do webhook, para rastreio.
+    :type message_id: str
+    :rtype: EventoWebhook
+    """
+    return EventoWebhook.objects.create(
+        numero_pedido=str(numero_pedido), message_id=message_id or '')
+
+
+async def aenfileirar_evento(numero_pedido, message_id=''):
+    """
+    Versão assíncrona do enfileirar_evento, para a view assíncrona do webhook.
+
+    :rtype: EventoWebhook
+    """
+    return await EventoWebhook.objects.acreate(
+        numero_pedido=str(numero_pedido), message_id=message_id or '')
+
+
+def processar_fila(omie_vendas, janela=WEBHOOK_JANELA_COALESCENCIA, limite=100):
+    """
+    Processa os eventos pendentes da fila. Os eventos do mesmo pedido são agrupados: o pedido
+    é processado quando seu evento mais antigo completa a janela, com uma única consulta à Omie
+    que atende a todos os eventos dele recebidos até então. Pedidos não faturados são gravados
+    em lote na Venda e pedidos faturados são removidos.
+
+    Um pedido com erro volta para a fila até atingir WEBHOOK_MAX_TENTATIVAS; com o circuito da
+    Omie aberto o processamento para e os eventos continuam pendentes.
+
+    Apenas um processo consome a fila por vez, sob a trava de banco SincronizacaoOmie.FILA_WEBHOOKS,
+    para que dois workers não consultem nem gravem os mesmos pedidos.
+
+    :param omie_vendas: Cliente da Omie usado nas consultas.
+    :type omie_vendas: OmieVendas
+    :param janela: Segundos de espera para agrupar os eventos de um pedido.
+    :type janela: float
+    :param limite: Quantidade máxima de pedidos processados por chamada.
+    :type limite: int
+    :return: As quantidades de pedidos processados, eventos atendidos e erros (todas zero se
+             outro processo estiver consumindo a fila).
+    :rtype: dict
+    """
+    dono = uuid.uuid4().hex
+    duracao = timedelta(seconds=WEBHOOK_TRAVA_SEGUNDOS)
+    if not SincronizacaoOmie.adquirir_trava(SincronizacaoOmie.FILA_WEBHOOKS, dono, duracao):
+        logger.info('Fila de webhooks já em processamento em outro processo')
+        return {"pedidos": 0, "eventos": 0, "erros": 0}
+
+    def renovar_trava():
+        return SincronizacaoOmie.renovar_trava(SincronizacaoOmie.FILA_WEBHOOKS, dono, duracao)
+
+    try:
+        return _processar_pendentes(omie_vendas, janela, limite, renovar_trava)
+    finally:
+        SincronizacaoOmie.liberar_trava(SincronizacaoOmie.FILA_WEBHOOKS, dono)
+
+
+def _processar_pendentes(omie_vendas, janela, limite, renovar_trava):
+    inicio = timezone.now()
+    pendentes = EventoWebhook.objects.filter(processado_em__isnull=True)
+    numeros = list(
+        pendentes.values('numero_pedido')
+        .annotate(primeiro=Min('recebido_em'))
+        .filter(primeiro__lte=inicio - timedelta(seconds=janela))
+        .order_by('primeiro')
+        .values_list('numero_pedido', flat=True)[:limite])
+
+    resultado = {"pedidos": 0, "eventos": 0, "erros": 0}
+    vendas_api = []
+    numeros_processados = []
+    codigos_faturados = []
+    for numero_pedido in numeros:
+        if not renovar_trava():
+            logger.warning('Trava da fila de webhooks perdida, processamento interrompido')
+            break
+        eventos = pendentes.filter(
+            numero_pedido=numero_pedido, recebido_em__lte=inicio)
+        try:
+            # Cada evento indica que o pedido mudou desde a última consulta
+            omie_vendas.cache.invalidar(numero_pedido)
+            dados_pedido = omie_vendas.consultar_pedido(numero_pedido)
+        except CircuitoAbertoError:
+            logger.warning(
+                'Circuito da Omie aberto, eventos de webhook continuam na fila')
+            break
+        except Exception as e:
+            logger.error(
+                f'Erro ao processar webhook do pedido {numero_pedido}: {e}', exc_info=True)
+            eventos.update(tentativas=F('tentativas') + 1, erro=str(e))
+            eventos.filter(tentativas__gte=WEBHOOK_MAX_TENTATIVAS).update(
+                processado_em=timezone.now())
+            resultado["erros"] += 1
+            continue
+
+        if dados_pedido.get('infoCadastro', {}).get('faturado') == 'S':
+            codigos_faturados.append(
+                dados_pedido['cabecalho']['codigo_pedido'])
+        else:
+            vendas_api.append(dados_pedido)
+        numeros_processados.append(numero_pedido)
+
+    if vendas_api:
+        resultado["erros"] += Venda.upsert_de_api(vendas_api)["rejeitadas"]
+    if codigos_faturados:
+        Venda.excluir(Venda.objects.filter(
+            codigo_pedido__in=codigos_faturados))
+
+    if vendas_api or codigos_faturados:
+        try:
+            gerar_snapshot()
+        except Exception as e:
+            logger.error(
+                f'Erro ao gerar o snapshot de vendas: {e}', exc_info=True)
+
+    resultado["pedidos"] = len(numeros_processados)
+    resultado["eventos"] = pendentes.filter(
+        numero_pedido__in=numeros_processados, recebido_em__lte=inicio
+    ).update(processado_em=timezone.now())
+    return resultado
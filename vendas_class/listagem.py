@@ -0,0 +1,365 @@
+import base64
+import binascii
+import json
+import os
+from datetime import datetime
+from decimal import Decimal, InvalidOperation
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F, Q
+from dotenv import load_dotenv
+
+from . import busca
+from .models import Venda
+
+
+load_dotenv()
+
+# Tamanho de página usado quando a listagem é paginada sem 'limit', e o maior aceito
+VENDAS_LIMITE_PADRAO = int(os.getenv('VENDAS_LIMITE_PADRAO', 100))
+VENDAS_LIMITE_MAXIMO = int(os.getenv('VENDAS_LIMITE_MAXIMO', 1000))
+# Linhas lidas do banco (e escritas na resposta) por vez na exportação em streaming
+VENDAS_STREAM_LOTE = int(os.getenv('VENDAS_STREAM_LOTE', 500))
+
+# Campos que a listagem de vendas pode devolver, na ordem da resposta
+CAMPOS_VENDA = ('numero_pedido', 'numero_pedido_cliente', 'data_vencimento',
+                'data_emissao', 'valor_total_pedido', 'produtos')
+CAMPOS_DATA = ('data_vencimento', 'data_emissao')
+# Campos aceitos em 'sort' (com '-' para ordem decrescente); todos têm índice com numero_pedido
+CAMPOS_ORDENACAO = ('numero_pedido', 'numero_pedido_cliente', 'data_vencimento',
+                    'data_emissao', 'valor_total_pedido')
+FORMATOS_DATA = ('%d/%m/%Y', '%Y-%m-%d')
+
+
+class ParametroInvalidoError(ValueError):
+    """
+    Parâmetro inválido na listagem de vendas; as views respondem 400.
+    """
+
+
+def codificar_cursor(valores):
+    """
+    Codifica a posição da última venda de uma página em um cursor opaco.
+
+    :param valores: Os valores da chave de ordenação da última venda.
+    :type valores: list
+    :rtype: str
+    """
+    return base64.urlsafe_b64encode(
+        json.dumps(valores, cls=DjangoJSONEncoder).encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor):
+    """
+    :return: Os valores codificados pelo codificar_cursor.
+    :rtype: list
+    :raises: ParametroInvalidoError se o cursor não for válido.
+    """
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(
+            cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise ParametroInvalidoError('Cursor inválido')
+    if not isinstance(valores, list) or not valores:
+        raise ParametroInvalidoError('Cursor inválido')
+    return valores
+
+
+def ler_campos(fields):
+    """
+    :param fields: Os campos pedidos, separados por vírgula; vazio para todos.
+    :type fields: str ou None
+    :return: Os campos, na ordem da resposta.
+    :rtype: tuple[str]
+    :raises: ParametroInvalidoError se algum campo não existir.
+    """
+    if not fields:
+        return CAMPOS_VENDA
+    campos = [campo.strip() for campo in fields.split(',') if campo.strip()]
+    invalidos = [campo for campo in campos if campo not in CAMPOS_VENDA]
+    if invalidos or not campos:
+        raise ParametroInvalidoError(
+            f'Campos inválidos: {", ".join(invalidos) or fields}')
+    return tuple(campo for campo in CAMPOS_VENDA if campo in campos)
+
+
+def ler_limite(limit):
+    """
+    :return: O tamanho de página pedido, ou None se não informado.
+    :rtype: int ou None
+    :raises: ParametroInvalidoError se não for um inteiro entre 1 e VENDAS_LIMITE_MAXIMO.
+    """
+    if limit is None or limit == '':
+        return None
+    try:
+        limite = int(limit)
+    except ValueError:
+        raise ParametroInvalidoError(f'limit inválido: {limit}')
+    if not 1 <= limite <= VENDAS_LIMITE_MAXIMO:
+        raise ParametroInvalidoError(
+            f'limit deve estar entre 1 e {VENDAS_LIMITE_MAXIMO}')
+    return limite
+
+
+def serializar_venda(linha, campos=CAMPOS_VENDA):
+    """
+    :param linha: Uma venda como dicionário (.values()).
+    :type linha: dict
+    :return: Os campos pedidos da venda, com as datas no formato '%d/%m/%Y'.
+    :rtype: dict
+    """
+    dados = {campo: linha[campo] for campo in campos}
+    for campo in CAMPOS_DATA:
+        if dados.get(campo) is not None:
+            dados[campo] = dados[campo].strftime('%d/%m/%Y')
+    return dados
+
+
+def buscar_vendas(params):
+    """
+    Busca de vendas pelo número do pedido do cliente e pela descrição e código dos produtos.
+
+    - q: o texto buscado; cada palavra deve ser o início de uma palavra da venda;
+    - limit: quantidade máxima de vendas (padrão VENDAS_LIMITE_PADRAO);
+    - fields: os campos da resposta, como na listagem.
+
+    Usa o índice FTS5 (vendas_class.busca), com as vendas mais relevantes primeiro; em bancos
+    sem o índice, recorre a consultas com icontains, em ordem de numero_pedido.
+
+    :param params: Os parâmetros da query string (request.GET).
+    :type params: QueryDict
+    :return: As vendas encontradas, serializadas.
+    :rtype: list[dict]
+    :raises: ParametroInvalidoError se algum parâmetro for inválido.
+    """
+    palavras = busca.termos(params.get('q'))
+    if not palavras:
+        raise ParametroInvalidoError('Informe o texto da busca em q')
+    campos = ler_campos(params.get('fields'))
+    limite = ler_limite(params.get('limit')) or VENDAS_LIMITE_PADRAO
+
+    if busca.disponivel(leitura=True):
+        ids = busca.buscar(params.get('q'), limite)
+    else:
+        vendas = Venda.objects.all()
+        for palavra in palavras:
+            vendas = vendas.filter(
+                Q(numero_pedido_cliente__icontains=palavra)
+                | Q(produtos_venda__descricao__icontains=palavra)
+                | Q(produtos_venda__codigo__icontains=palavra))
+        ids = list(vendas.order_by('numero_pedido').values_list(
+            'id', flat=True).distinct()[:limite])
+
+    linhas = {linha['id']: linha for linha in Venda.objects.filter(
+        id__in=ids).values('id', *campos)}
+    return [serializar_venda(linhas[id_venda], campos) for id_venda in ids if id_venda in linhas]
+
+
+class ConsultaVendas:
+    def __init__(self, params):
+        """
+        Consulta da listagem de vendas a partir dos parâmetros da requisição.
+
+        - fields: campos da resposta separados por vírgula, levados até o SELECT com .values();
+        - limit: tamanho da página; com 'limit' ou 'cursor' a listagem é paginada por keyset em
+          (ordenação, numero_pedido) e o cursor da próxima página vai no cabeçalho X-Vendas-Proximo-Cursor;
+        - cursor: o cursor devolvido pela página anterior;
+        - data_vencimento_de / data_vencimento_ate, data_emissao_de / data_emissao_ate: intervalos
+          de datas, inclusivos ('%d/%m/%Y' ou '%Y-%m-%d');
+        - valor_total_pedido_de / valor_total_pedido_ate: intervalo de valores, inclusivo;
+        - adiantado: 'true' ou 'false';
+        - numero_pedido_cliente: prefixo do número do pedido do cliente;
+        - sort: campo de ordenação, com '-' na frente para ordem decrescente (padrão numero_pedido);
+        - stream: com 'true', exporta todas as vendas em uma resposta em streaming, lendo o banco
+          em lotes; não pode ser combinado com 'limit' ou 'cursor'.
+
+        Sem 'limit' nem 'cursor' a listagem devolve todas as vendas, como antes.
+
+        :param params: Os parâmetros da query string (request.GET).
+        :type params: QueryDict
+        :raises: ParametroInvalidoError se algum parâmetro for inválido.
+        """
+        self.campos = ler_campos(params.get('fields'))
+        self.filtros = self._filtros(params)
+        self.ordenacao = params.get('sort') or 'numero_pedido'
+        self.campo_ordenacao = self.ordenacao.removeprefix('-')
+        self.decrescente = self.ordenacao.startswith('-')
+        if self.campo_ordenacao not in CAMPOS_ORDENACAO:
+            raise ParametroInvalidoError(f'sort inválido: {self.ordenacao}')
+        self.cursor = params.get('cursor') or None
+        self.posicao = None
+        if self.cursor is not None:
+            ordenacao, *self.posicao = decodificar_cursor(self.cursor)
+            if ordenacao != self.ordenacao or len(self.posicao) != 2:
+                raise ParametroInvalidoError(
+                    'Cursor não corresponde à ordenação pedida')
+        self.limite = ler_limite(params.get('limit'))
+        self.paginada = self.limite is not None or self.cursor is not None
+        self.streaming = params.get('stream', '').lower() in ('1', 'true')
+        if self.streaming and self.paginada:
+            raise ParametroInvalidoError(
+                'stream não pode ser combinado com limit ou cursor')
+        if self.paginada and self.limite is None:
+            self.limite = VENDAS_LIMITE_PADRAO
+
+    @property
+    def padrao(self):
+        """
+        Indica se é a listagem completa, sem filtros, projeção, ordenação ou paginação,
+        que é servida a partir do snapshot pré-serializado.
+
+        :rtype: bool
+        """
+        return (self.campos == CAMPOS_VENDA and not self.filtros and self.ordenacao == 'numero_pedido'
+                and not self.paginada and not self.streaming)
+
+    @staticmethod
+    def _data(params, parametro):
+        valor = params.get(parametro)
+        if not valor:
+            return None
+        for formato in FORMATOS_DATA:
+            try:
+                return datetime.strptime(valor, formato).date()
+            except ValueError:
+                pass
+        raise ParametroInvalidoError(f'{parametro} inválido: {valor}')
+
+    @staticmethod
+    def _valor(params, parametro):
+        valor = params.get(parametro)
+        if not valor:
+            return None
+        try:
+            return Decimal(valor)
+        except InvalidOperation:
+            raise ParametroInvalidoError(f'{parametro} inválido: {valor}')
+
+    @classmethod
+    def _filtros(cls, params):
+        """
+        :return: As condições do WHERE correspondentes aos filtros da requisição.
+        :rtype: Q
+        """
+        filtros = Q()
+        for campo in ('data_vencimento', 'data_emissao', 'valor_total_pedido'):
+            converter = cls._valor if campo == 'valor_total_pedido' else cls._data
+            inicio = converter(params, f'{campo}_de')
+            fim = converter(params, f'{campo}_ate')
+            if inicio is not None:
+                filtros &= Q(**{f'{campo}__gte': inicio})
+            if fim is not None:
+                filtros &= Q(**{f'{campo}__lte': fim})
+
+        adiantado = params.get('adiantado')
+        if adiantado:
+            if adiantado.lower() not in ('true', 'false', '1', '0'):
+                raise ParametroInvalidoError(f'adiantado inválido: {adiantado}')
+            filtros &= Q(adiantado=adiantado.lower() in ('true', '1'))
+
+        prefixo = params.get('numero_pedido_cliente')
+        if prefixo:
+            # Intervalo em vez de LIKE, para que o SQLite percorra apenas o trecho do índice
+            filtros &= Q(numero_pedido_cliente__gte=prefixo,
+                         numero_pedido_cliente__lt=prefixo + '\U0010ffff')
+        return filtros
+
+    def _apos_cursor(self):
+        """
+        :return: A condição das vendas posteriores à posição do cursor na ordenação pedida,
+                 com os nulos por último e numero_pedido como desempate.
+        :rtype: Q
+        """
+        valor, numero_pedido = self.posicao
+        posterior = 'lt' if self.decrescente else 'gt'
+        if self.campo_ordenacao == 'numero_pedido':
+            return Q(**{f'numero_pedido__{posterior}': numero_pedido})
+        if valor is None:
+            return Q(**{f'{self.campo_ordenacao}__isnull': True,
+                        f'numero_pedido__{posterior}': numero_pedido})
+        return (Q(**{f'{self.campo_ordenacao}__{posterior}': valor})
+                | Q(**{self.campo_ordenacao: valor, f'numero_pedido__{posterior}': numero_pedido})
+                | Q(**{f'{self.campo_ordenacao}__isnull': True}))
+
+    def _ordem(self):
+        if self.decrescente:
+            return (F(self.campo_ordenacao).desc(nulls_last=True), '-numero_pedido')
+        return (F(self.campo_ordenacao).asc(nulls_last=True), 'numero_pedido')
+
+    def queryset(self):
+        """
+        :return: As linhas da página (uma a mais que o limite, para saber se há próxima)
+                 como dicionários apenas com os campos pedidos e a chave do cursor.
+        :rtype: QuerySet
+        """
+        vendas = Venda.objects.filter(self.filtros).order_by(*self._ordem())
+        if self.posicao is not None:
+            vendas = vendas.filter(self._apos_cursor())
+        vendas = vendas.values(*dict.fromkeys(
+            ('numero_pedido', self.campo_ordenacao, *self.campos)))
+        if self.paginada:
+            vendas = vendas[:self.limite + 1]
+        return vendas
+
+    def pagina(self, linhas):
+        """
+        Separa a linha extra buscada pelo queryset e serializa a página.
+
+        :param linhas: As linhas retornadas pelo queryset.
+        :type linhas: list[dict]
+        :return: As vendas serializadas e o cursor da próxima página (None se for a última).
+        :rtype: tuple[list[dict], str ou None]
+        """
+        proximo_cursor = None
+        if self.paginada and len(linhas) > self.limite:
+            linhas = linhas[:self.limite]
+            ultima = linhas[-1]
+            proximo_cursor = codificar_cursor(
+                [self.ordenacao, ultima[self.campo_ordenacao], ultima['numero_pedido']])
+        return [self.serializar(linha) for linha in linhas], proximo_cursor
+
+    def serializar(self, linha):
+        return serializar_venda(linha, self.campos)
+
+    def _lote_json(self, linhas, primeiro):
+        return (',' if not primeiro else '') + ','.join(
+            json.dumps(self.serializar(linha), cls=DjangoJSONEncoder) for linha in linhas)
+
+    def json_em_fluxo(self, tamanho_lote=VENDAS_STREAM_LOTE):
+        """
+        Gera o array JSON das vendas aos pedaços, lendo o banco com .iterator() para que a
+        memória usada não dependa da quantidade de vendas.
+
+        :rtype: Iterator[str]
+        """
+        yield '['
+        lote = []
+        primeiro = True
+        for linha in self.queryset().iterator(chunk_size=tamanho_lote):
+            lote.append(linha)
+            if len(lote) >= tamanho_lote:
+                yield self._lote_json(lote, primeiro)
+                lote = []
+                primeiro = False
+        if lote:
+            yield self._lote_json(lote, primeiro)
+        yield ']'
+
+    async def ajson_em_fluxo(self, tamanho_lote=VENDAS_STREAM_LOTE):
+        """
+        Versão assíncrona do json_em_fluxo, para a view assíncrona.
+
+        :rtype: AsyncIterator[str]
+        """
+        yield '['
+        lote = []
+        primeiro = True
+        async for linha in self.queryset().aiterator(chunk_size=tamanho_lote):
+            lote.append(linha)
+            if len(lote) >= tamanho_lote:
+                yield self._lote_json(lote, primeiro)
+                lote = []
+                primeiro = False
+        if lote:
+            yield self._lote_json(lote, primeiro)
+        yield ']'
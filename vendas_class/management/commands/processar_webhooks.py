@@ -0,0 +1,44 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from vendas_class.fila import WEBHOOK_JANELA_COALESCENCIA, processar_fila
+from vendas_class.services import APP_KEY, APP_SECRET, OmieVendas
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Processa a fila de eventos de webhook da Omie e atualiza as vendas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true',
+                            help='Continua processando a fila até ser interrompido.')
+        parser.add_argument('--intervalo', type=float, default=1,
+                            help='Segundos entre as leituras da fila no modo --loop.')
+        parser.add_argument('--janela', type=float, default=WEBHOOK_JANELA_COALESCENCIA,
+                            help='Segundos para agrupar os eventos repetidos do mesmo pedido.')
+
+    def handle(self, *args, **options):
+        omie_vendas = OmieVendas(APP_KEY, APP_SECRET)
+
+        while True:
+            try:
+                resultado = processar_fila(
+                    omie_vendas, janela=options['janela'])
+                if resultado['eventos'] or resultado['erros']:
+                    logger.info(f'Fila de webhooks processada: {resultado}')
+                    self.stdout.write(
+                        f"{resultado['pedidos']} pedidos atualizados a partir de "
+                        f"{resultado['eventos']} eventos, {resultado['erros']} erros")
+            except Exception as e:
+                if not options['loop']:
+                    raise
+                logger.error(
+                    f'Erro ao processar a fila de webhooks: {e}', exc_info=True)
+
+            if not options['loop']:
+                return
+            time.sleep(options['intervalo'])
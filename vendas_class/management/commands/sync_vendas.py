@@ -0,0 +1,44 @@
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+
+from vendas_class.sincronizacao import executar_sincronizacao
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Sincroniza a tabela de vendas com a Omie, uma vez ou continuamente.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--completo', action='store_true',
+                            help='Busca todos os pedidos em vez de apenas os alterados desde a última sincronização.')
+        parser.add_argument('--loop', action='store_true',
+                            help='Continua sincronizando até ser interrompido.')
+        parser.add_argument('--intervalo', type=float, default=300,
+                            help='Segundos entre as sincronizações no modo --loop.')
+
+    def handle(self, *args, **options):
+        while True:
+            try:
+                resultado = executar_sincronizacao(
+                    incremental=not options['completo'])
+                if resultado is None:
+                    self.stdout.write(
+                        'Outra sincronização está em andamento, nada a fazer.')
+                else:
+                    self.stdout.write(
+                        f"Sincronização concluída em {resultado['duracao']}s: {resultado['paginas']} páginas, "
+                        f"{resultado['inseridas']} inseridas, {resultado['atualizadas']} atualizadas, "
+                        f"{resultado['removidas']} removidas, {resultado['rejeitadas']} rejeitadas")
+            except Exception as e:
+                if not options['loop']:
+                    raise
+                logger.error(
+                    f'Erro na sincronização de vendas: {e}', exc_info=True)
+
+            if not options['loop']:
+                return
+            time.sleep(options['intervalo'])
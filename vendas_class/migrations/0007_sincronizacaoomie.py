@@ -0,0 +1,21 @@
+# Generated by Django 5.0 on 2026-10-18 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas_class', '0006_alter_venda_numero_pedido_cliente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SincronizacaoOmie',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave', models.CharField(max_length=50, unique=True)),
+                ('ultima_sincronizacao', models.DateTimeField(null=True)),
+            ],
+        ),
+    ]
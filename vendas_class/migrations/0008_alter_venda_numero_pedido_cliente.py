@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-18 11:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas_class', '0007_sincronizacaoomie'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='venda',
+            name='numero_pedido_cliente',
+            field=models.CharField(db_index=True, default='', max_length=20),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.0 on 2026-10-18 11:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas_class', '0008_alter_venda_numero_pedido_cliente'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoWebhook',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero_pedido', models.CharField(max_length=30)),
+                ('message_id', models.CharField(blank=True, default='', max_length=100)),
+                ('recebido_em', models.DateTimeField(auto_now_add=True)),
+                ('processado_em', models.DateTimeField(null=True)),
+                ('tentativas', models.IntegerField(default=0)),
+                ('erro', models.TextField(blank=True, default='')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['processado_em', 'recebido_em'], name='vendas_clas_process_c080fc_idx'), models.Index(fields=['numero_pedido', 'processado_em'], name='vendas_clas_numero__630f48_idx')],
+            },
+        ),
+    ]
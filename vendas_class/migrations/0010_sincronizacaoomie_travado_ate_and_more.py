@@ -0,0 +1,23 @@
+# Generated by Django 5.0 on 2026-10-18 11:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas_class', '0009_eventowebhook'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sincronizacaoomie',
+            name='travado_ate',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='sincronizacaoomie',
+            name='travado_por',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
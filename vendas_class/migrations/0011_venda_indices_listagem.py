@@ -0,0 +1,33 @@
+# Generated by Django 5.0 on 2026-10-18 11:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas_class', '0010_sincronizacaoomie_travado_ate_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['data_vencimento', 'numero_pedido'], name='vendas_clas_data_ve_e7dc52_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['data_emissao', 'numero_pedido'], name='vendas_clas_data_em_5d04fc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['valor_total_pedido', 'numero_pedido'], name='vendas_clas_valor_t_bb121e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['numero_pedido_cliente', 'numero_pedido'], name='vendas_clas_numero__973104_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='venda',
+            index=models.Index(fields=['adiantado', 'data_vencimento'], name='vendas_clas_adianta_c7a065_idx'),
+        ),
+    ]
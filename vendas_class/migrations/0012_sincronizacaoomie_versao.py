@@ -0,0 +1,23 @@
+# Generated by Django 5.0 on 2026-10-18 11:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas_class', '0011_venda_indices_listagem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sincronizacaoomie',
+            name='alterado_em',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='sincronizacaoomie',
+            name='versao',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas_class', '0012_sincronizacaoomie_versao'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SnapshotVendas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chave', models.CharField(max_length=50, unique=True)),
+                ('versao', models.PositiveBigIntegerField(default=0)),
+                ('conteudo', models.BinaryField()),
+                ('conteudo_gzip', models.BinaryField()),
+                ('gerado_em', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.0 on 2026-10-18 11:42
+
+from datetime import datetime
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def popular_itens(apps, schema_editor):
+    """
+    Preenche as tabelas normalizadas a partir dos JSONs das vendas já gravadas.
+    """
+    Venda = apps.get_model('vendas_class', 'Venda')
+    ParcelaVenda = apps.get_model('vendas_class', 'ParcelaVenda')
+    ProdutoVenda = apps.get_model('vendas_class', 'ProdutoVenda')
+
+    parcelas, produtos = [], []
+    for venda in Venda.objects.only('id', 'parcelas', 'produtos').iterator(chunk_size=500):
+        for indice, parcela in enumerate(venda.parcelas or []):
+            data_vencimento = parcela.get('data_vencimento')
+            parcelas.append(ParcelaVenda(
+                venda_id=venda.id,
+                numero_parcela=int(parcela.get('numero_parcela') or indice + 1),
+                data_vencimento=datetime.strptime(
+                    data_vencimento, '%d/%m/%Y').date() if data_vencimento else None,
+                valor=Decimal(str(parcela.get('valor') or 0)),
+                adiantada=parcela.get('parcela_adiantamento') == 'S'))
+        for produto in venda.produtos or []:
+            produtos.append(ProdutoVenda(
+                venda_id=venda.id, codigo=str(produto.get('codigo', '')),
+                descricao=produto.get('descricao') or '',
+                valor=Decimal(str(produto.get('valor') or 0))))
+    ParcelaVenda.objects.bulk_create(parcelas, batch_size=500)
+    ProdutoVenda.objects.bulk_create(produtos, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas_class', '0013_snapshotvendas'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProdutoVenda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('codigo', models.CharField(db_index=True, max_length=60)),
+                ('descricao', models.CharField(blank=True, default='', max_length=255)),
+                ('valor', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('venda', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='produtos_venda', to='vendas_class.venda')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ParcelaVenda',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero_parcela', models.IntegerField()),
+                ('data_vencimento', models.DateField(null=True)),
+                ('valor', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('adiantada', models.BooleanField(default=False)),
+                ('venda', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parcelas_venda', to='vendas_class.venda')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['data_vencimento', 'adiantada'], name='vendas_clas_data_ve_17245b_idx')],
+            },
+        ),
+        migrations.RunPython(popular_itens, migrations.RunPython.noop),
+    ]
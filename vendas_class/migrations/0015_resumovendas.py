@@ -0,0 +1,58 @@
+# Generated by Django 5.0 on 2026-10-18 11:45
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import TruncMonth
+
+
+def popular_resumo(apps, schema_editor):
+    """
+    Monta o resumo inicial a partir das parcelas e produtos já gravados.
+    """
+    ParcelaVenda = apps.get_model('vendas_class', 'ParcelaVenda')
+    ProdutoVenda = apps.get_model('vendas_class', 'ProdutoVenda')
+    ResumoVendas = apps.get_model('vendas_class', 'ResumoVendas')
+
+    resumos = []
+    for linha in ParcelaVenda.objects.annotate(mes=TruncMonth('data_vencimento')).values('mes').annotate(
+            quantidade=Count('id'), total=Sum('valor')).order_by():
+        resumos.append(ResumoVendas(
+            dimensao='mes', chave=linha['mes'].strftime('%Y-%m') if linha['mes'] else '',
+            quantidade=linha['quantidade'], valor=linha['total']))
+    for linha in ParcelaVenda.objects.values('adiantada').annotate(
+            quantidade=Count('id'), total=Sum('valor')).order_by():
+        resumos.append(ResumoVendas(
+            dimensao='adiantamento', chave='S' if linha['adiantada'] else 'N',
+            quantidade=linha['quantidade'], valor=linha['total']))
+    for linha in ProdutoVenda.objects.values('codigo').annotate(
+            quantidade=Count('id'), total=Sum('valor'), nome=Max('descricao')).order_by():
+        resumos.append(ResumoVendas(
+            dimensao='produto', chave=linha['codigo'], descricao=linha['nome'],
+            quantidade=linha['quantidade'], valor=linha['total']))
+    ResumoVendas.objects.bulk_create(resumos, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas_class', '0014_parcelavenda_produtovenda'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumoVendas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimensao', models.CharField(max_length=20)),
+                ('chave', models.CharField(max_length=60)),
+                ('descricao', models.CharField(blank=True, default='', max_length=255)),
+                ('quantidade', models.IntegerField(default=0)),
+                ('valor', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='resumovendas',
+            constraint=models.UniqueConstraint(fields=('dimensao', 'chave'), name='resumo_vendas_unico'),
+        ),
+        migrations.RunPython(popular_resumo, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+import logging
+
+from django.db import migrations
+
+logger = logging.getLogger(__name__)
+
+TABELA_BUSCA = 'vendas_class_busca_venda'
+
+
+def criar_indice_busca(apps, schema_editor):
+    """
+    Cria o índice FTS5 de busca das vendas e o preenche com as vendas já gravadas.
+    Em outros bancos, ou em um SQLite sem FTS5, a busca usa consultas comuns.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Venda = apps.get_model('vendas_class', 'Venda')
+    with schema_editor.connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {TABELA_BUSCA} USING fts5('
+                'numero_pedido_cliente, descricoes, codigos, '
+                "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')")
+        except Exception as e:
+            logger.warning(f'Índice de busca não criado, SQLite sem FTS5: {e}')
+            return
+
+        documentos = []
+        for venda in Venda.objects.only('id', 'numero_pedido_cliente', 'produtos').iterator(chunk_size=500):
+            produtos = venda.produtos or []
+            documentos.append((
+                venda.id, venda.numero_pedido_cliente or '',
+                ' '.join(str(produto.get('descricao') or '') for produto in produtos),
+                ' '.join(str(produto.get('codigo') or '') for produto in produtos)))
+        cursor.executemany(
+            f'INSERT INTO {TABELA_BUSCA} (rowid, numero_pedido_cliente, descricoes, codigos) '
+            'VALUES (%s, %s, %s, %s)', documentos)
+
+
+def remover_indice_busca(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {TABELA_BUSCA}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas_class', '0015_resumovendas'),
+    ]
+
+    operations = [
+        migrations.RunPython(criar_indice_busca, remover_indice_busca),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-18 12:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas_class', '0016_busca_venda'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='venda',
+            name='numero_pedido_cliente',
+            field=models.CharField(default='', max_length=20),
+        ),
+    ]
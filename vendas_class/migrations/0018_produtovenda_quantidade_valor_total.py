@@ -0,0 +1,50 @@
+# Generated by Django 5.0 on 2026-10-18 12:09
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+
+def popular_quantidade_e_total(apps, schema_editor):
+    """
+    Refaz os produtos normalizados a partir dos JSONs das vendas já gravadas. Esses JSONs não têm
+    a quantidade: os produtos ficam com quantidade 1 e total igual ao valor unitário até a
+    próxima sincronização completa (sync_vendas --completo) trazer os valores da Omie.
+    """
+    Venda = apps.get_model('vendas_class', 'Venda')
+    ProdutoVenda = apps.get_model('vendas_class', 'ProdutoVenda')
+
+    produtos = []
+    for venda in Venda.objects.only('id', 'produtos').iterator(chunk_size=500):
+        for produto in venda.produtos or []:
+            valor = Decimal(str(produto.get('valor') or 0))
+            quantidade = Decimal(str(produto.get('quantidade') or 1))
+            valor_total = produto.get('valor_total')
+            valor_total = Decimal(str(valor_total)) if valor_total is not None else valor * quantidade
+            produtos.append(ProdutoVenda(
+                venda_id=venda.id, codigo=str(produto.get('codigo', '')),
+                descricao=produto.get('descricao') or '', valor=valor, quantidade=quantidade,
+                valor_total=valor_total.quantize(Decimal('0.01'))))
+    ProdutoVenda.objects.all().delete()
+    ProdutoVenda.objects.bulk_create(produtos, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas_class', '0017_remover_indice_numero_pedido_cliente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='produtovenda',
+            name='quantidade',
+            field=models.DecimalField(decimal_places=4, default=1, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='produtovenda',
+            name='valor_total',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(popular_quantidade_e_total, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0 on 2026-10-18 12:15
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def refazer_resumo_produtos(apps, schema_editor):
+    """
+    Refaz as linhas de produto do resumo com o total de cada item (em vez do valor unitário)
+    e as unidades vendidas.
+    """
+    ProdutoVenda = apps.get_model('vendas_class', 'ProdutoVenda')
+    ResumoVendas = apps.get_model('vendas_class', 'ResumoVendas')
+
+    ResumoVendas.objects.filter(dimensao='produto').delete()
+    ResumoVendas.objects.bulk_create([
+        ResumoVendas(dimensao='produto', chave=linha['codigo'], descricao=linha['nome'],
+                     quantidade=linha['itens'], valor=linha['total'],
+                     unidades=linha['unidades'])
+        for linha in ProdutoVenda.objects.values('codigo').annotate(
+            itens=Count('id'), total=Sum('valor_total'), unidades=Sum('quantidade'),
+            nome=Max('descricao')).order_by()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('vendas_class', '0018_produtovenda_quantidade_valor_total'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='resumovendas',
+            name='unidades',
+            field=models.DecimalField(decimal_places=4, default=0, max_digits=18),
+        ),
+        migrations.RunPython(refazer_resumo_produtos, migrations.RunPython.noop),
+    ]
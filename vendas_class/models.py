@@ -1,10 +1,31 @@
-from django.db import models
+import logging
+from django.db import models, transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.db.models.signals import post_save
+from django.dispatch import Signal, receiver
+from django.utils import timezone
 from datetime import datetime
+from decimal import Decimal
+
+from backend_rocinante.banco import transacao_escrita
+from . import busca
+
+logger = logging.getLogger(__name__)
+
+# Enviado após o commit de cada alteração registrada por SincronizacaoOmie.registrar_alteracao,
+# com a chave dos dados alterados
+dados_alterados = Signal()
+
+# Quantidade de vendas gravadas por comando INSERT no upsert em lote
+TAMANHO_LOTE_UPSERT = 500
 
 
 class Venda(models.Model):
     numero_pedido = models.IntegerField(unique=True)
     # FIXME - Definir um default pra numero_pedido_cliente
+    # Indexado pelo índice composto (numero_pedido_cliente, numero_pedido), que também atende as
+    # buscas só pelo numero_pedido_cliente
     numero_pedido_cliente = models.CharField(max_length=20, default='')
     # FIXME - Definir um default pra data_vencimento
     data_vencimento = models.DateField(null=True)
@@ -15,9 +36,74 @@ class Venda(models.Model):
     parcelas = models.JSONField()
     adiantado = models.BooleanField(default=False)
 
+    class Meta:
+        # Filtros e ordenações da listagem de vendas; numero_pedido desempata a paginação por keyset
+        indexes = [
+            models.Index(fields=['data_vencimento', 'numero_pedido']),
+            models.Index(fields=['data_emissao', 'numero_pedido']),
+            models.Index(fields=['valor_total_pedido', 'numero_pedido']),
+            models.Index(fields=['numero_pedido_cliente', 'numero_pedido']),
+            models.Index(fields=['adiantado', 'data_vencimento']),
+        ]
+
     def __str__(self):
         return f"Pedido {self.numero_pedido}"
 
+    def parcelas_normalizadas(self):
+        """
+        :return: As linhas de ParcelaVenda do JSON 'parcelas', ainda não gravadas.
+        :rtype: list[ParcelaVenda]
+        """
+        return [ParcelaVenda.de_api(self, parcela, indice)
+                for indice, parcela in enumerate(self.parcelas or [])]
+
+    def produtos_normalizados(self):
+        """
+        :return: As linhas de ProdutoVenda do JSON 'produtos', ainda não gravadas.
+        :rtype: list[ProdutoVenda]
+        """
+        return [ProdutoVenda.de_api(self, produto) for produto in self.produtos or []]
+
+    @classmethod
+    def gravar_itens(cls, vendas):
+        """
+        Substitui as parcelas e os produtos normalizados das vendas já gravadas, em lote,
+        atualizando o ResumoVendas e o índice de busca.
+
+        :param vendas: Vendas com pk.
+        :type vendas: list[Venda]
+        """
+        antes = ResumoVendas.contribuicoes(vendas)
+        ParcelaVenda.objects.filter(venda__in=vendas).delete()
+        ProdutoVenda.objects.filter(venda__in=vendas).delete()
+        ParcelaVenda.objects.bulk_create(
+            [parcela for venda in vendas for parcela in venda.parcelas_normalizadas()])
+        ProdutoVenda.objects.bulk_create(
+            [produto for venda in vendas for produto in venda.produtos_normalizados()])
+        ResumoVendas.aplicar(antes, ResumoVendas.contribuicoes(vendas))
+        busca.indexar(vendas)
+
+    @classmethod
+    def excluir(cls, vendas):
+        """
+        Exclui as vendas, com suas parcelas e produtos, descontando-as do ResumoVendas,
+        retirando-as do índice de busca e registrando a alteração dos dados.
+
+        :param vendas: As vendas a excluir.
+        :type vendas: QuerySet
+        :return: A quantidade de vendas excluídas (sem contar os itens excluídos em cascata).
+        :rtype: int
+        """
+        with transacao_escrita():
+            antes = ResumoVendas.contribuicoes(vendas)
+            busca.remover(list(vendas.values_list('id', flat=True)))
+            _, excluidas_por_modelo = vendas.delete()
+            excluidas = excluidas_por_modelo.get(cls._meta.label, 0)
+            if excluidas:
+                ResumoVendas.aplicar(antes, {})
+                SincronizacaoOmie.registrar_alteracao()
+        return excluidas
+
     @classmethod
     def criar_de_api(cls, dados_venda):
         try:
@@ -41,6 +127,8 @@ class Venda(models.Model):
 
             produtos = [{
                 'valor': produto['produto']['valor_unitario'],
+                'quantidade': produto['produto'].get('quantidade', 1),
+                'valor_total': produto['produto'].get('valor_total'),
                 'descricao': produto['produto']['descricao'],
                 'codigo': produto['produto']['codigo']
             } for produto in dados_venda['det']]
@@ -67,3 +155,440 @@ class Venda(models.Model):
             )
         except KeyError as e:
             raise ValueError(f"Dado obrigatório não encontrado: {e}")
+
+    @staticmethod
+    def _comparavel(valores):
+        # O valor total vem da API como número e do banco como Decimal com duas casas
+        valores = dict(valores)
+        valores['valor_total_pedido'] = Decimal(
+            str(valores['valor_total_pedido'])).quantize(Decimal('0.01'))
+        return valores
+
+    @classmethod
+    def upsert_de_api(cls, vendas_api, tamanho_lote=TAMANHO_LOTE_UPSERT):
+        """
+        Insere ou atualiza em lote vendas vindas da API da Omie, usando 'codigo_pedido' como chave.
+
+        As vendas são gravadas em comandos INSERT ... ON CONFLICT de até 'tamanho_lote' linhas,
+        todos dentro de uma única transação. São rejeitadas as vendas com dados inválidos e as que
+        usam um 'numero_pedido' que já pertence a outro 'codigo_pedido'.
+
+        :param vendas_api: Dicionários de venda no formato retornado pela API da Omie.
+        :type vendas_api: Iterable[dict]
+        :param tamanho_lote: Quantidade máxima de vendas por comando.
+        :type tamanho_lote: int
+        :return: As quantidades de vendas inseridas, atualizadas e rejeitadas. Vendas idênticas
+                 às já gravadas não entram em nenhuma delas.
+        :rtype: dict
+        """
+        resultado = {"inseridas": 0, "atualizadas": 0, "rejeitadas": 0}
+
+        vendas = {}
+        for dados_venda in vendas_api:
+            try:
+                venda = cls.criar_de_api(dados_venda)
+                venda.numero_pedido = int(venda.numero_pedido)
+                venda.codigo_pedido = int(venda.codigo_pedido)
+            except (ValueError, TypeError) as e:
+                logger.error(
+                    f"Erro ao salvar venda do pedido {e}", exc_info=True)
+                resultado["rejeitadas"] += 1
+                continue
+            vendas[venda.codigo_pedido] = venda
+        vendas = list(vendas.values())
+
+        campos_atualizados = [
+            campo.name for campo in cls._meta.concrete_fields
+            if not campo.primary_key and campo.name != 'codigo_pedido']
+
+        with transacao_escrita():
+            for inicio in range(0, len(vendas), tamanho_lote):
+                lote = vendas[inicio:inicio + tamanho_lote]
+                existentes = list(cls.objects.filter(
+                    Q(codigo_pedido__in=[venda.codigo_pedido for venda in lote]) |
+                    Q(numero_pedido__in=[venda.numero_pedido for venda in lote])
+                ).values('codigo_pedido', *campos_atualizados))
+                codigo_por_numero = {
+                    linha['numero_pedido']: linha['codigo_pedido'] for linha in existentes}
+                atuais = {linha.pop('codigo_pedido'): cls._comparavel(linha)
+                          for linha in existentes}
+
+                validas = []
+                for venda in lote:
+                    codigo_atual = codigo_por_numero.setdefault(
+                        venda.numero_pedido, venda.codigo_pedido)
+                    if codigo_atual != venda.codigo_pedido:
+                        logger.error(
+                            f"Erro ao salvar venda do pedido {venda.numero_pedido}: "
+                            f"número já usado pelo codigo_pedido {codigo_atual}")
+                        resultado["rejeitadas"] += 1
+                        continue
+                    # Vendas iguais às gravadas não são regravadas nem contam como alteração
+                    if atuais.get(venda.codigo_pedido) == cls._comparavel(
+                            {campo: getattr(venda, campo) for campo in campos_atualizados}):
+                        continue
+                    validas.append(venda)
+                if not validas:
+                    continue
+
+                cls.objects.bulk_create(
+                    validas,
+                    update_conflicts=True,
+                    unique_fields=['codigo_pedido'],
+                    update_fields=campos_atualizados,
+                )
+                # O upsert não devolve o id das vendas que já existiam
+                ids = dict(cls.objects.filter(
+                    codigo_pedido__in=[venda.codigo_pedido for venda in validas]
+                ).values_list('codigo_pedido', 'id'))
+                for venda in validas:
+                    venda.pk = ids[venda.codigo_pedido]
+                cls.gravar_itens(validas)
+
+                atualizadas = sum(
+                    venda.codigo_pedido in atuais for venda in validas)
+                resultado["atualizadas"] += atualizadas
+                resultado["inseridas"] += len(validas) - atualizadas
+
+            if resultado["inseridas"] or resultado["atualizadas"]:
+                SincronizacaoOmie.registrar_alteracao()
+
+        return resultado
+
+
+class ParcelaVenda(models.Model):
+    """
+    Parcela de uma venda, normalizada a partir de Venda.parcelas para consultas por vencimento no banco.
+    """
+    venda = models.ForeignKey(
+        Venda, on_delete=models.CASCADE, related_name='parcelas_venda')
+    numero_parcela = models.IntegerField()
+    data_vencimento = models.DateField(null=True)
+    valor = models.DecimalField(max_digits=10, decimal_places=2)
+    adiantada = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['data_vencimento', 'adiantada']),
+        ]
+
+    def __str__(self):
+        return f"Parcela {self.numero_parcela} do pedido {self.venda_id}"
+
+    @classmethod
+    def de_api(cls, venda, parcela, indice=0):
+        """
+        :param parcela: Uma parcela no formato da Omie (item de 'lista_parcelas').
+        :type parcela: dict
+        :param indice: A posição da parcela, usada se ela não tiver 'numero_parcela'.
+        :type indice: int
+        :rtype: ParcelaVenda
+        """
+        data_vencimento = parcela.get('data_vencimento')
+        return cls(
+            venda=venda,
+            numero_parcela=int(parcela.get('numero_parcela') or indice + 1),
+            data_vencimento=datetime.strptime(
+                data_vencimento, '%d/%m/%Y').date() if data_vencimento else None,
+            valor=Decimal(str(parcela.get('valor') or 0)),
+            adiantada=parcela.get('parcela_adiantamento') == 'S',
+        )
+
+    @classmethod
+    def atualizar_de_vendas(cls, vendas):
+        """
+        Atualiza o vencimento e o adiantamento das parcelas gravadas a partir do JSON 'parcelas'
+        das vendas, com um único bulk_update.
+
+        :param vendas: Vendas com pk, com o JSON 'parcelas' já alterado.
+        :type vendas: list[Venda]
+        """
+        alteradas = {(parcela.venda_id, parcela.numero_parcela): parcela
+                     for venda in vendas for parcela in venda.parcelas_normalizadas()}
+        with transacao_escrita():
+            # Apenas as parcelas mudam no adiantamento
+            antes = ResumoVendas.contribuicoes(vendas, produtos=False)
+            parcelas = list(cls.objects.filter(venda__in=vendas))
+            for parcela in parcelas:
+                alterada = alteradas.get(
+                    (parcela.venda_id, parcela.numero_parcela))
+                if alterada is not None:
+                    parcela.data_vencimento = alterada.data_vencimento
+                    parcela.adiantada = alterada.adiantada
+            cls.objects.bulk_update(parcelas, ['data_vencimento', 'adiantada'])
+            ResumoVendas.aplicar(
+                antes, ResumoVendas.contribuicoes(vendas, produtos=False))
+
+
+class ProdutoVenda(models.Model):
+    """
+    Produto de uma venda, normalizado a partir de Venda.produtos.
+    """
+    venda = models.ForeignKey(
+        Venda, on_delete=models.CASCADE, related_name='produtos_venda')
+    codigo = models.CharField(max_length=60, db_index=True)
+    descricao = models.CharField(max_length=255, blank=True, default='')
+    # Valor unitário
+    valor = models.DecimalField(max_digits=10, decimal_places=2)
+    quantidade = models.DecimalField(max_digits=14, decimal_places=4, default=1)
+    valor_total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"Produto {self.codigo} do pedido {self.venda_id}"
+
+    @classmethod
+    def de_api(cls, venda, produto):
+        """
+        :param venda: A venda do produto.
+        :type venda: Venda
+        :param produto: Um item de Venda.produtos.
+        :type produto: dict
+        :return: O produto normalizado, ainda não gravado. Sem 'valor_total' (vendas gravadas antes
+                 dele existir), o total é a quantidade vezes o valor unitário.
+        :rtype: ProdutoVenda
+        """
+        valor = Decimal(str(produto.get('valor') or 0))
+        quantidade = Decimal(str(produto.get('quantidade') or 1))
+        valor_total = produto.get('valor_total')
+        valor_total = Decimal(str(valor_total)) if valor_total is not None else valor * quantidade
+        return cls(venda=venda, codigo=str(produto.get('codigo', '')),
+                   descricao=produto.get('descricao') or '', valor=valor,
+                   quantidade=quantidade, valor_total=valor_total.quantize(Decimal('0.01')))
+
+
+class ResumoVendas(models.Model):
+    """
+    Totais das vendas em aberto por mês de vencimento e por situação de adiantamento (das
+    parcelas) e por produto. Mantido de forma incremental, a cada gravação ou exclusão de
+    vendas, para que o resumo não precise percorrer a tabela de vendas.
+    """
+    MES = 'mes'
+    ADIANTAMENTO = 'adiantamento'
+    PRODUTO = 'produto'
+
+    dimensao = models.CharField(max_length=20)
+    # 'AAAA-MM' (vazio sem vencimento), 'S'/'N' ou o código do produto
+    chave = models.CharField(max_length=60)
+    descricao = models.CharField(max_length=255, blank=True, default='')
+    # Parcelas (mês e adiantamento) ou itens de pedido (produto) somados na linha
+    quantidade = models.IntegerField(default=0)
+    valor = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Unidades vendidas, apenas na dimensão produto
+    unidades = models.DecimalField(max_digits=18, decimal_places=4, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['dimensao', 'chave'], name='resumo_vendas_unico'),
+        ]
+
+    def __str__(self):
+        return f"Resumo {self.dimensao} {self.chave}: {self.valor}"
+
+    @staticmethod
+    def contribuicoes(vendas, produtos=True):
+        """
+        Calcula, no banco, quanto as vendas somam em cada linha do resumo. Nos produtos, o valor
+        é o total de cada item (quantidade vezes valor unitário), e não o valor unitário.
+
+        :param vendas: Vendas gravadas (lista com pk ou QuerySet).
+        :param produtos: Se False, considera apenas as parcelas (mês e adiantamento).
+        :type produtos: bool
+        :return: Para cada (dimensao, chave), a quantidade, o valor, a descrição e as unidades.
+        :rtype: dict[tuple[str, str], tuple[int, Decimal, str, Decimal]]
+        """
+        totais = {}
+        parcelas = ParcelaVenda.objects.filter(venda__in=vendas)
+        for linha in parcelas.annotate(mes=TruncMonth('data_vencimento')).values('mes').annotate(
+                quantidade=Count('id'), total=Sum('valor')).order_by():
+            chave = linha['mes'].strftime('%Y-%m') if linha['mes'] else ''
+            totais[(ResumoVendas.MES, chave)] = (
+                linha['quantidade'], linha['total'], '', 0)
+        for linha in parcelas.values('adiantada').annotate(
+                quantidade=Count('id'), total=Sum('valor')).order_by():
+            chave = 'S' if linha['adiantada'] else 'N'
+            totais[(ResumoVendas.ADIANTAMENTO, chave)] = (
+                linha['quantidade'], linha['total'], '', 0)
+        if not produtos:
+            return totais
+        for linha in ProdutoVenda.objects.filter(venda__in=vendas).values('codigo').annotate(
+                itens=Count('id'), total=Sum('valor_total'), unidades=Sum('quantidade'),
+                nome=Max('descricao')).order_by():
+            totais[(ResumoVendas.PRODUTO, linha['codigo'])] = (
+                linha['itens'], linha['total'], linha['nome'], linha['unidades'])
+        return totais
+
+    @classmethod
+    def aplicar(cls, antes, depois):
+        """
+        Soma ao resumo a diferença entre as contribuições de depois e de antes de uma gravação.
+        As linhas afetadas são lidas com select_for_update dentro da transação, e as que
+        zeram são removidas.
+
+        :param antes: O retorno do contribuicoes antes da gravação.
+        :param depois: O retorno do contribuicoes depois da gravação ({} para exclusões).
+        """
+        deltas = {}
+        for chave in set(antes) | set(depois):
+            quantidade_antes, valor_antes, _, unidades_antes = antes.get(chave, (0, 0, '', 0))
+            quantidade, valor, descricao, unidades = depois.get(chave, (0, 0, '', 0))
+            if (quantidade, valor, unidades) != (quantidade_antes, valor_antes, unidades_antes):
+                deltas[chave] = (quantidade - quantidade_antes,
+                                 (valor or 0) - (valor_antes or 0), descricao,
+                                 (unidades or 0) - (unidades_antes or 0))
+        if not deltas:
+            return
+
+        with transacao_escrita():
+            filtro = Q()
+            for dimensao in {dimensao for dimensao, _ in deltas}:
+                filtro |= Q(dimensao=dimensao, chave__in=[
+                    chave for dimensao_delta, chave in deltas if dimensao_delta == dimensao])
+            existentes = {(resumo.dimensao, resumo.chave): resumo
+                          for resumo in cls.objects.select_for_update().filter(filtro)}
+
+            novos, alterados, zerados = [], [], []
+            for (dimensao, chave), (quantidade, valor, descricao, unidades) in deltas.items():
+                resumo = existentes.get((dimensao, chave))
+                if resumo is None:
+                    resumo = cls(dimensao=dimensao, chave=chave, descricao=descricao)
+                    novos.append(resumo)
+                else:
+                    alterados.append(resumo)
+                resumo.quantidade += quantidade
+                resumo.valor += valor
+                resumo.unidades += unidades
+                if descricao:
+                    resumo.descricao = descricao
+                if resumo.quantidade <= 0 and resumo.pk is not None:
+                    zerados.append(resumo.pk)
+
+            cls.objects.bulk_create(
+                [resumo for resumo in novos if resumo.quantidade > 0])
+            cls.objects.bulk_update(
+                [resumo for resumo in alterados if resumo.pk not in zerados],
+                ['quantidade', 'valor', 'unidades', 'descricao'])
+            cls.objects.filter(pk__in=zerados).delete()
+
+    @classmethod
+    def recalcular(cls):
+        """
+        Refaz o resumo inteiro a partir das parcelas e produtos, para corrigir divergências.
+        """
+        with transacao_escrita():
+            cls.objects.all().delete()
+            cls.aplicar({}, cls.contribuicoes(Venda.objects.all()))
+
+
+class SincronizacaoOmie(models.Model):
+    """
+    Marca d'água da sincronização incremental com a Omie, trava que impede duas
+    sincronizações simultâneas, mesmo em processos diferentes, e versão dos dados,
+    incrementada a cada gravação, usada nos cabeçalhos ETag e Last-Modified.
+    """
+    VENDAS = 'vendas'
+    FILA_WEBHOOKS = 'fila_webhooks'
+
+    chave = models.CharField(max_length=50, unique=True)
+    ultima_sincronizacao = models.DateTimeField(null=True)
+    travado_por = models.CharField(max_length=64, blank=True, default='')
+    travado_ate = models.DateTimeField(null=True)
+    versao = models.PositiveBigIntegerField(default=0)
+    alterado_em = models.DateTimeField(null=True)
+
+    def __str__(self):
+        return f"Sincronização {self.chave}: {self.ultima_sincronizacao}"
+
+    @classmethod
+    def adquirir_trava(cls, chave, dono, duracao):
+        """
+        Tenta obter a trava da sincronização com um único UPDATE condicional, atômico no banco.
+        A trava expira sozinha após 'duracao', caso o processo que a obteve morra sem liberá-la.
+
+        :param chave: A chave da sincronização.
+        :type chave: str
+        :param dono: Identificador único de quem está travando.
+        :type dono: str
+        :param duracao: Por quanto tempo a trava vale.
+        :type duracao: timedelta
+        :return: True se a trava foi obtida (ou renovada pelo mesmo dono).
+        :rtype: bool
+        """
+        cls.objects.get_or_create(chave=chave)
+        agora = timezone.now()
+        return cls.objects.filter(chave=chave).filter(
+            Q(travado_ate__isnull=True) | Q(travado_ate__lt=agora) | Q(travado_por=dono)
+        ).update(travado_por=dono, travado_ate=agora + duracao) == 1
+
+    @classmethod
+    def renovar_trava(cls, chave, dono, duracao):
+        """
+        Estende a validade da trava por mais 'duracao', se ela ainda pertencer ao dono.
+
+        :return: False se a trava expirou e foi obtida por outro processo.
+        :rtype: bool
+        """
+        return cls.objects.filter(chave=chave, travado_por=dono).update(
+            travado_ate=timezone.now() + duracao) == 1
+
+    @classmethod
+    def liberar_trava(cls, chave, dono):
+        cls.objects.filter(chave=chave, travado_por=dono).update(
+            travado_por='', travado_ate=None)
+
+    @classmethod
+    def registrar_alteracao(cls, chave=VENDAS):
+        """
+        Incrementa a versão dos dados, com um UPDATE atômico no banco, e envia o sinal
+        dados_alterados após o commit. Deve ser chamado após toda gravação em lote (bulk_create,
+        bulk_update, update, delete), que não dispara sinais.
+        """
+        if not cls.objects.filter(chave=chave).update(
+                versao=F('versao') + 1, alterado_em=timezone.now()):
+            cls.objects.get_or_create(chave=chave)
+            cls.objects.filter(chave=chave).update(
+                versao=F('versao') + 1, alterado_em=timezone.now())
+        transaction.on_commit(lambda: dados_alterados.send(sender=cls, chave=chave))
+
+
+class SnapshotVendas(models.Model):
+    """
+    Listagem completa de vendas já serializada em JSON, com as variantes sem compressão e gzip,
+    gerada para uma versão dos dados (SincronizacaoOmie.versao).
+    """
+    chave = models.CharField(max_length=50, unique=True)
+    versao = models.PositiveBigIntegerField(default=0)
+    conteudo = models.BinaryField()
+    conteudo_gzip = models.BinaryField()
+    gerado_em = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Snapshot {self.chave} versão {self.versao}"
+
+
+class EventoWebhook(models.Model):
+    """
+    Fila durável dos eventos de webhook da Omie, consumida pelo comando processar_webhooks.
+    """
+    numero_pedido = models.CharField(max_length=30)
+    message_id = models.CharField(max_length=100, blank=True, default='')
+    recebido_em = models.DateTimeField(auto_now_add=True)
+    processado_em = models.DateTimeField(null=True)
+    tentativas = models.IntegerField(default=0)
+    erro = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['processado_em', 'recebido_em']),
+            models.Index(fields=['numero_pedido', 'processado_em']),
+        ]
+
+    def __str__(self):
+        return f"Evento do pedido {self.numero_pedido}"
+
+
+# Apenas post_save: um receptor de post_delete faria todo QuerySet.delete() carregar as vendas
+# uma a uma, por isso as exclusões chamam registrar_alteracao diretamente
+@receiver(post_save, sender=Venda)
+def _venda_alterada(sender, **kwargs):
+    SincronizacaoOmie.registrar_alteracao()
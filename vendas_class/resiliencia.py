@@ -0,0 +1,228 @@
+import os
+import random
+import threading
+import time
+
+from dotenv import load_dotenv
+
+
+load_dotenv()
+
+# Requisições por segundo aceitas pela Omie para a app_key (todas as chamadas do processo)
+OMIE_REQUISICOES_POR_SEGUNDO = float(
+    os.getenv('OMIE_REQUISICOES_POR_SEGUNDO', 4))
+# Quantas vezes repetir uma chamada recusada por limitação ou falha temporária da Omie
+OMIE_TENTATIVAS_LIMITACAO = int(os.getenv('OMIE_TENTATIVAS_LIMITACAO', 5))
+OMIE_BACKOFF_BASE = float(os.getenv('OMIE_BACKOFF_BASE', 0.5))
+OMIE_BACKOFF_MAXIMO = float(os.getenv('OMIE_BACKOFF_MAXIMO', 30))
+# Falhas seguidas que abrem o circuito e segundos até liberar uma chamada de teste
+OMIE_CIRCUITO_FALHAS = int(os.getenv('OMIE_CIRCUITO_FALHAS', 5))
+OMIE_CIRCUITO_ESPERA = float(os.getenv('OMIE_CIRCUITO_ESPERA', 30))
+
+# Status HTTP com que a Omie (ou o proxy na frente dela) recusa temporariamente uma chamada
+STATUS_TEMPORARIOS = {425, 429, 502, 503, 504}
+# Trechos do 'faultstring' das respostas de erro da Omie que indicam limitação ou falha temporária
+FALHAS_TEMPORARIAS = (
+    'consumo redundante',
+    'consumo indevido',
+    'limite de requisi',
+    'tente novamente',
+    'broken response',
+)
+
+
+class LimitadorTaxa:
+    def __init__(self, taxa_maxima=OMIE_REQUISICOES_POR_SEGUNDO, capacidade=None, taxa_minima=0.25):
+        """
+        Token bucket com taxa adaptativa: a taxa cai pela metade a cada limitação reportada pela
+        Omie e volta a subir aos poucos a cada chamada aceita, convergindo para o máximo aceito.
+
+        :param taxa_maxima: Tokens (requisições) por segundo quando a Omie não está limitando.
+        :type taxa_maxima: float
+        :param capacidade: Tamanho da rajada permitida; por padrão igual à taxa máxima.
+        :type capacidade: float
+        :param taxa_minima: Menor taxa para a qual o limitador pode recuar.
+        :type taxa_minima: float
+        """
+        self.taxa_maxima = taxa_maxima
+        self.taxa_minima = min(taxa_minima, taxa_maxima)
+        self.taxa = taxa_maxima
+        self.capacidade = capacidade or max(taxa_maxima, 1)
+        self.tokens = self.capacidade
+        self.atualizado_em = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reservar(self):
+        """
+        Reserva um token.
+
+        :return: Quantos segundos esperar antes de fazer a requisição.
+        :rtype: float
+        """
+        with self._lock:
+            agora = time.monotonic()
+            self.tokens = min(
+                self.capacidade, self.tokens + (agora - self.atualizado_em) * self.taxa)
+            self.atualizado_em = agora
+            self.tokens -= 1
+            if self.tokens >= 0:
+                return 0
+            return -self.tokens / self.taxa
+
+    def adquirir(self):
+        espera = self.reservar()
+        if espera:
+            time.sleep(espera)
+
+    def reduzir(self):
+        with self._lock:
+            self.taxa = max(self.taxa_minima, self.taxa / 2)
+            self.tokens = min(self.tokens, 0)
+
+    def aumentar(self):
+        with self._lock:
+            self.taxa = min(self.taxa_maxima,
+                            self.taxa + self.taxa_maxima / 20)
+
+
+def resposta_temporaria(response):
+    """
+    Indica se a resposta da Omie é uma limitação de consumo ou falha temporária,
+    que deve ser repetida após um backoff.
+
+    :param response: Resposta do requests ou do httpx.
+    :rtype: bool
+    """
+    if response.status_code in STATUS_TEMPORARIOS:
+        return True
+    if response.status_code < 500:
+        return False
+    try:
+        falha = str(response.json().get('faultstring', '')).lower()
+    except Exception:
+        return False
+    return any(trecho in falha for trecho in FALHAS_TEMPORARIAS)
+
+
+def espera_backoff(tentativa, base=OMIE_BACKOFF_BASE, maximo=OMIE_BACKOFF_MAXIMO):
+    """
+    Backoff exponencial com jitter completo.
+
+    :param tentativa: Número da tentativa que falhou, começando em 0.
+    :type tentativa: int
+    :return: Segundos a aguardar antes da próxima tentativa.
+    :rtype: float
+    """
+    return random.uniform(0, min(maximo, base * 2 ** tentativa))
+
+
+class CircuitoAbertoError(Exception):
+    """
+    A Omie falhou repetidamente e o circuito está aberto: a chamada nem foi enviada.
+    """
+
+
+class CircuitBreaker:
+    FECHADO = 'fechado'
+    ABERTO = 'aberto'
+    SEMIABERTO = 'semiaberto'
+
+    def __init__(self, limite_falhas=OMIE_CIRCUITO_FALHAS, tempo_espera=OMIE_CIRCUITO_ESPERA, chamadas_teste=1):
+        """
+        Circuit breaker das chamadas à Omie. Depois de 'limite_falhas' falhas seguidas o circuito
+        abre e as chamadas falham imediatamente com CircuitoAbertoError. Passado 'tempo_espera',
+        fica semiaberto e libera até 'chamadas_teste' chamadas: um sucesso fecha o circuito
+        e uma falha o abre de novo.
+
+        :param limite_falhas: Falhas seguidas que abrem o circuito.
+        :type limite_falhas: int
+        :param tempo_espera: Segundos com o circuito aberto antes das chamadas de teste.
+        :type tempo_espera: float
+        :param chamadas_teste: Chamadas simultâneas permitidas com o circuito semiaberto.
+        :type chamadas_teste: int
+        """
+        self.limite_falhas = limite_falhas
+        self.tempo_espera = tempo_espera
+        self.chamadas_teste = chamadas_teste
+        self.falhas = 0
+        self.aberto_em = None
+        self.testes_em_andamento = 0
+        self._lock = threading.Lock()
+
+    def _estado(self):
+        if self.aberto_em is None:
+            return self.FECHADO
+        if time.monotonic() - self.aberto_em < self.tempo_espera:
+            return self.ABERTO
+        return self.SEMIABERTO
+
+    @property
+    def estado(self):
+        with self._lock:
+            return self._estado()
+
+    def disponivel(self):
+        """
+        Indica se uma chamada à Omie seria enviada agora (circuito fechado ou semiaberto).
+
+        :rtype: bool
+        """
+        return self.estado != self.ABERTO
+
+    def antes_da_chamada(self):
+        """
+        Deve ser chamado antes de cada chamada à Omie.
+
+        :return: True se a chamada é uma chamada de teste (circuito semiaberto); ela deve terminar
+                 com registrar_sucesso, registrar_falha ou, se interrompida, cancelar_teste.
+        :rtype: bool
+        :raises: CircuitoAbertoError se o circuito estiver aberto ou já houver chamadas de teste em andamento.
+        """
+        with self._lock:
+            estado = self._estado()
+            if estado == self.FECHADO:
+                return False
+            if estado == self.SEMIABERTO and self.testes_em_andamento < self.chamadas_teste:
+                self.testes_em_andamento += 1
+                return True
+        raise CircuitoAbertoError(
+            'Omie indisponível: chamadas suspensas após falhas seguidas')
+
+    def registrar_sucesso(self):
+        with self._lock:
+            self.falhas = 0
+            self.aberto_em = None
+            self.testes_em_andamento = 0
+
+    def registrar_falha(self):
+        with self._lock:
+            self.falhas += 1
+            if self.aberto_em is not None or self.falhas >= self.limite_falhas:
+                self.aberto_em = time.monotonic()
+                self.testes_em_andamento = 0
+
+    def cancelar_teste(self):
+        """
+        Libera a vaga de uma chamada de teste interrompida antes da resposta (a requisição
+        assíncrona cancelada quando o cliente desconecta, por exemplo), sem contá-la como falha.
+        """
+        with self._lock:
+            if self.testes_em_andamento > 0:
+                self.testes_em_andamento -= 1
+
+    def status(self):
+        """
+        :return: O estado do circuito, as falhas seguidas e os segundos até a próxima chamada de teste.
+        :rtype: dict
+        """
+        with self._lock:
+            estado = self._estado()
+            reabre_em = None
+            if estado == self.ABERTO:
+                reabre_em = round(
+                    self.tempo_espera - (time.monotonic() - self.aberto_em), 1)
+            return {"estado": estado, "falhas": self.falhas, "reabre_em": reabre_em}
+
+
+limitador_omie = LimitadorTaxa()
+circuito_omie = CircuitBreaker()
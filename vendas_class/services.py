@@ -1,9 +1,16 @@
 import logging
 from math import e
-import requests
 import json
-from .models import Venda
+from backend_rocinante.banco import transacao_escrita
+from .models import ParcelaVenda, SincronizacaoOmie, Venda
+from .transport import get_transport
+from .cache import cache_pedidos
 from datetime import datetime
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque
+from zoneinfo import ZoneInfo
+from django.utils import timezone
 from dateutil.relativedelta import relativedelta
 from dotenv import load_dotenv
 import os
@@ -14,73 +21,377 @@ logger = logging.getLogger(__name__)
 
 APP_KEY = os.getenv('APP_KEY')
 APP_SECRET = os.getenv('APP_SECRET')
+# Número máximo de páginas do 'ListarPedidos' buscadas ao mesmo tempo
+OMIE_MAX_WORKERS = int(os.getenv('OMIE_MAX_WORKERS', 4))
+# Número máximo de 'AlterarPedidoVenda' enviados ao mesmo tempo no adiantamento
+OMIE_MAX_ALTERACOES = int(os.getenv('OMIE_MAX_ALTERACOES', 8))
+REGISTROS_POR_PAGINA = 500
+FUSO_OMIE = ZoneInfo('America/Sao_Paulo')
+# Sobreposição aplicada à marca d'água da sincronização incremental, para não perder
+# pedidos alterados durante a sincronização anterior
+MARGEM_SINCRONIZACAO = timedelta(minutes=5)
+# Falha com que o 'ListarPedidos' responde (HTTP 500) quando o filtro não encontra nenhum
+# pedido, em vez de uma página vazia: "ERROR: Não existem registros para a página [1]!"
+FALHA_SEM_REGISTROS = '5113'
+
+
+class OmieVendasBase:
+    """
+    Montagem dos payloads e tratamento das respostas da API de pedidos da Omie.
+    Compartilhado pelo cliente síncrono (OmieVendas) e pelo assíncrono (AsyncOmieVendas).
+    """
+    url = 'https://app.omie.com.br/api/v1/produtos/pedido/'
 
-
-class OmieVendas:
     def __init__(self, app_key, app_secret):
         self.app_key = app_key
         self.app_secret = app_secret
-        self.url = 'https://app.omie.com.br/api/v1/produtos/pedido/'
+        self.cache = cache_pedidos
+
+    def _payload(self, call, param):
+        return json.dumps({
+            "call": call,
+            "app_key": self.app_key,
+            "app_secret": self.app_secret,
+            "param": [param]
+        })
 
-    def get_vendas(self):
+    def _payload_pagina(self, pagina, alterados_desde=None):
+        param = {
+            "pagina": pagina,
+            "registros_por_pagina": REGISTROS_POR_PAGINA,
+            "apenas_importado_api": "N"
+        }
+        if alterados_desde is not None:
+            param.update(self._filtro_alterados_desde(alterados_desde))
+        return self._payload('ListarPedidos', param)
+
+    @staticmethod
+    def _filtro_alterados_desde(alterados_desde):
         """
-        Recupera uma lista de vendas por meio da API 'ListarPedidos' da Omie e salva no banco de dados.
+        Monta os filtros de data do 'ListarPedidos' para trazer apenas os pedidos incluídos
+        ou alterados a partir de um instante. A Omie trabalha no horário de Brasília.
+        """
+        inicio = timezone.localtime(
+            alterados_desde - MARGEM_SINCRONIZACAO, FUSO_OMIE)
+        return {
+            "filtrar_por_data_de": inicio.strftime('%d/%m/%Y'),
+            "filtrar_por_hora_de": inicio.strftime('%H:%M:%S'),
+            "filtrar_apenas_inclusao": "N",
+            "filtrar_apenas_alteracao": "N"
+        }
+
+    @staticmethod
+    def _sem_registros(response):
+        try:
+            response_data = response.json()
+        except ValueError:
+            return False
+        if not isinstance(response_data, dict):
+            return False
+        return (str(response_data.get('faultcode', '')).endswith(FALHA_SEM_REGISTROS)
+                or 'não existem registros' in str(response_data.get('faultstring', '')).lower())
+
+    @classmethod
+    def _tratar_resposta_pagina(cls, response, pagina=1):
+        """
+        :return: O JSON da página; uma página vazia se a primeira página não tem registros.
+        :rtype: dict
+        :raises: Exception em caso de erro HTTP.
+        """
+        if response.status_code != 200:
+            # Sem pedidos no filtro (uma sincronização incremental sem alterações, por exemplo)
+            if pagina == 1 and cls._sem_registros(response):
+                return {"pagina": 1, "total_de_paginas": 0, "registros": 0,
+                        "total_de_registros": 0, "pedido_venda_produto": []}
+            raise Exception(
+                f"Erro HTTP ao buscar vendas: {response.status_code}")
 
-        :return: Uma lista de dicionarios de venda.
-        :rtype: list[Venda<models.Venda>]
+        return response.json()
+
+    @staticmethod
+    def _vendas_nao_faturadas(paginas):
+        vendas = []
+        for response_data in paginas:
+            vendas_da_pagina = response_data.get(
+                "pedido_venda_produto", [])
+
+            for dados_venda in vendas_da_pagina:
+                if dados_venda['infoCadastro']['faturado'] != 'S':
+                    vendas.append(dados_venda)
+
+        return vendas
+
+    @staticmethod
+    def _tratar_resposta_consulta(response):
+        response_data = response.json()
+        if response.status_code != 200:
+            raise Exception(
+                f"Erro HTTP ao consultar pedido: {response.status_code} / {response_data}")
+        if 'pedido_venda_produto' not in response_data:
+            raise KeyError(
+                'Campo pedido_venda_produto não encontrado na resposta')
+        return response_data['pedido_venda_produto']
+
+    def _invalidar_cache(self, pedido):
+        """
+        Remove do cache do 'ConsultarPedido' o pedido enviado ao 'AlterarPedidoVenda',
+        identificado pelo numero_pedido ou pelo codigo_pedido do cabeçalho.
+        """
+        cabecalho = pedido.get('cabecalho') if isinstance(pedido, dict) else None
+        if not isinstance(cabecalho, dict):
+            return
+        if cabecalho.get('numero_pedido') is not None:
+            self.cache.invalidar(cabecalho['numero_pedido'])
+        codigo_pedido = cabecalho.get('codigo_pedido')
+        if codigo_pedido is not None:
+            self.cache.invalidar_se(lambda dados: str(
+                dados.get('cabecalho', {}).get('codigo_pedido')) == str(codigo_pedido))
+
+    @staticmethod
+    def _tratar_resposta_alteracao(response):
+        if response.status_code != 200:
+            raise Exception(
+                f"Erro HTTP ao alterar pedido: {response.status_code} / {response.json()}")
+        response_data = response.json()
+        if 'descricao_status' not in response_data:
+            logger.critical(
+                f'Erro no response da API de alterar pedido: {response_data}', exc_info=True)
+            raise KeyError('Pedido nao foi alterado')
+        return response_data
+
+
+    def _preparar_adiantamentos(self, dados):
+        """
+        Localiza as vendas a adiantar com uma única consulta, marca as parcelas para adiantamento
+        e grava as parcelas alteradas com um único bulk_update (na Venda e na ParcelaVenda), em
+        uma única transação.
+
+        :return: Os números recebidos, o erro de cada pedido na ordem recebida (None para os que
+                 seguem para a Omie) e os pares (índice, venda) a enviar para a Omie.
+        :rtype: tuple[list, list, list[tuple[int, Venda]]]
+        """
+        vendas_a_adiantar = dados["numerosVendas"]
+        data_vencimento_inicial = datetime.strptime(
+            dados["dataVencimento"], "%d/%m/%Y")
+        numeros = [str(numero_pedido_cliente)
+                   for numero_pedido_cliente in vendas_a_adiantar]
+        vendas_por_numero = {}
+        for venda in Venda.objects.filter(numero_pedido_cliente__in=numeros):
+            vendas_por_numero.setdefault(
+                venda.numero_pedido_cliente, []).append(venda)
+
+        resultados = [None] * len(vendas_a_adiantar)
+        a_alterar = []
+        for indice, numero_pedido_cliente in enumerate(vendas_a_adiantar):
+            encontradas = vendas_por_numero.get(numeros[indice], [])
+            if not encontradas:
+                resultados[indice] = "Pedido não encontrado"
+                continue
+            if len(encontradas) > 1:
+                logger.warning(
+                    f'Número do pedido do cliente {numeros[indice]} duplicado em {len(encontradas)} vendas')
+                resultados[indice] = f"Número do pedido duplicado em {len(encontradas)} vendas"
+                continue
+
+            venda = encontradas[0]
+            try:
+                self._adiantar_parcelas(
+                    venda.parcelas, data_vencimento_inicial)
+            except Exception as e:
+                resultados[indice] = str(e)
+                continue
+            a_alterar.append((indice, venda))
+
+        if a_alterar:
+            vendas = list({venda.pk: venda for _, venda in a_alterar}.values())
+            # O JSON da Venda, a ParcelaVenda e o ResumoVendas mudam juntos ou não mudam
+            with transacao_escrita():
+                Venda.objects.bulk_update(vendas, ['parcelas'])
+                ParcelaVenda.atualizar_de_vendas(vendas)
+                SincronizacaoOmie.registrar_alteracao()
+        return vendas_a_adiantar, resultados, a_alterar
+
+    @staticmethod
+    def _adiantar_parcelas(parcelas, data_vencimento_inicial):
+        """
+        Marca as parcelas para adiantamento, com vencimentos mensais a partir da data inicial.
+        """
+        for i, parcela in enumerate(parcelas):
+            parcela['parcela_adiantamento'] = "S"
+            parcela['categoria_adiantamento'] = "1.04.01"
+            parcela['conta_corrente_adiantamento'] = "2135259563"
+            nova_data = data_vencimento_inicial + \
+                relativedelta(months=+i)
+            parcela['data_vencimento'] = nova_data.strftime(
+                '%d/%m/%Y')
+
+    @staticmethod
+    def _detalhes_adiantamento(venda):
+        return {
+            "cabecalho": {"codigo_pedido": venda.codigo_pedido},
+            "lista_parcelas": {"parcela": venda.parcelas}
+        }
+
+    @staticmethod
+    def _erro_adiantamento(numero_pedido_cliente, resposta_adiantamento):
+        """
+        Interpreta a resposta (ou a exceção) do 'AlterarPedidoVenda' de um adiantamento.
+
+        :return: None se o pedido foi alterado, ou a descrição do erro.
+        :rtype: str ou None
+        """
+        if isinstance(resposta_adiantamento, Exception):
+            return str(resposta_adiantamento)
+
+        if resposta_adiantamento.get('descricao_status') != 'Pedido alterado com sucesso!':
+            logger.critical(
+                f'Erro ao adiantar pedido: {resposta_adiantamento}', exc_info=True)
+            return "Falha ao alterar pedido"
+
+        print(f'Pedido {numero_pedido_cliente} adiantado com sucesso.')
+        return None
+
+    def _concluir_adiantamentos(self, vendas_a_adiantar, resultados):
+        """
+        Exclui as vendas adiantadas com sucesso e monta o retorno do set_adiantamentos.
+        """
+        pedidos_para_excluir = []
+        erros = []
+        for numero_pedido_cliente, erro in zip(vendas_a_adiantar, resultados):
+            if erro is None:
+                pedidos_para_excluir.append(numero_pedido_cliente)
+            else:
+                erros.append(
+                    {"numero_pedido_cliente": numero_pedido_cliente, "erro": erro})
+
+        if pedidos_para_excluir:
+            self._excluir_pedidos(pedidos_para_excluir)
+
+        if erros:
+            logger.error(
+                f'Erros ao adiantar pedidos: {erros}', exc_info=True)
+            return {"status_code": 500, "message": "Erros encontrados", "erros": erros}
+        else:
+            return {"status_code": 200, "message": "Todos os pedidos foram adiantados com sucesso"}
+
+    @staticmethod
+    def _excluir_pedidos(pedidos):
+        try:
+            Venda.excluir(Venda.objects.filter(
+                numero_pedido_cliente__in=[str(numero_pedido_cliente) for numero_pedido_cliente in pedidos]))
+        except Exception as e:
+            logger.error(
+                f'Erro ao excluir pedidos: {e}', exc_info=True)
+            raise e
+
+
+class OmieVendas(OmieVendasBase):
+    def __init__(self, app_key, app_secret, max_workers=OMIE_MAX_WORKERS,
+                 max_alteracoes=OMIE_MAX_ALTERACOES, transport=None):
+        super().__init__(app_key, app_secret)
+        self.max_workers = max_workers
+        self.max_alteracoes = max_alteracoes
+        self.transport = transport or get_transport()
+
+    def _buscar_pagina(self, pagina, alterados_desde=None):
+        """
+        Busca uma única página da API 'ListarPedidos' da Omie.
+
+        :param pagina: O número da página a ser buscada.
+        :type pagina: int
+        :param alterados_desde: Se informado, busca apenas pedidos incluídos ou alterados a partir desse instante.
+        :type alterados_desde: datetime
+        :return: O JSON da resposta da API para a página.
+        :rtype: dict
+        :raises: Exception em caso de erro HTTP ou de conexão.
+        """
+        try:
+            response = self.transport.post(
+                self.url, self._payload_pagina(pagina, alterados_desde), consulta=True)
+        except Exception as e:
+            logger.critical(
+                f'Erro no response de na busca das vendas: {e}', exc_info=True)
+            raise e
+
+        return self._tratar_resposta_pagina(response, pagina)
+
+    def _iter_paginas(self, alterados_desde=None):
+        """
+        Gera as páginas do 'ListarPedidos' em ordem. A primeira página informa o 'total_de_paginas';
+        as restantes são buscadas em paralelo, com no máximo 'max_workers' páginas em andamento
+        ou aguardando consumo, de modo que a memória depende do tamanho da página e não do total.
+
+        :return: O JSON de resposta de cada página.
+        :rtype: Iterator[dict]
+        """
+        primeira_pagina = self._buscar_pagina(1, alterados_desde)
+        total_paginas = primeira_pagina.get("total_de_paginas", 1)
+        if total_paginas <= 1:
+            yield primeira_pagina
+            return
+
+        executor = ThreadPoolExecutor(
+            max_workers=min(self.max_workers, total_paginas - 1))
+        pendentes = deque()
+        proxima_pagina = 2
+        try:
+            while True:
+                while proxima_pagina <= total_paginas and len(pendentes) < self.max_workers:
+                    pendentes.append(executor.submit(
+                        self._buscar_pagina, proxima_pagina, alterados_desde))
+                    proxima_pagina += 1
+
+                if primeira_pagina is not None:
+                    pagina, primeira_pagina = primeira_pagina, None
+                    yield pagina
+                elif pendentes:
+                    yield pendentes.popleft().result()
+                else:
+                    return
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def iter_vendas(self, alterados_desde=None, por_pagina=False):
+        """
+        Versão em streaming do get_vendas: gera as vendas não faturadas conforme cada página chega,
+        para que o chamador possa persistir e descartar cada página antes da próxima.
+
+        :param alterados_desde: Se informado, busca apenas pedidos incluídos ou alterados a partir desse instante.
+        :type alterados_desde: datetime
+        :param por_pagina: Se True, gera uma lista por página em vez de uma venda por vez.
+        :type por_pagina: bool
+        :return: Os dicionários de venda, ou listas deles quando 'por_pagina' é True.
+        :rtype: Iterator[dict] ou Iterator[list[dict]]
         :raises: Exception em caso de erro HTTP, resposta inválida da API ou erro geral durante o processo.
         """
         try:
-            vendas = []
-            pagina = 1
-            total_paginas = 1
-
-            while pagina <= total_paginas:
-                payload = json.dumps({
-                    "call": 'ListarPedidos',
-                    "app_key": self.app_key,
-                    "app_secret": self.app_secret,
-                    "param": [{
-                        "pagina": pagina,
-                        "registros_por_pagina": 500,
-                        "apenas_importado_api": "N"
-                    }]
-                })
-
-                headers = {'Content-Type': 'application/json'}
-                try:
-                    response = requests.post(
-                        url=self.url, headers=headers, data=payload)
-                except Exception as e:
-                    logger.critical(
-                        f'Erro no response de na busca das vendas: {e}', exc_info=True)
-                    raise e
-
-                if response.status_code != 200:
-                    raise Exception(
-                        f"Erro HTTP ao buscar vendas: {response.status_code}")
-
-                response_data = response.json()
-
-                vendas_da_pagina = response_data.get(
-                    "pedido_venda_produto", [])
-
-                for dados_venda in vendas_da_pagina:
-                    if dados_venda['infoCadastro']['faturado'] != 'S':
-                        vendas.append(dados_venda)
-
-                total_paginas = response_data.get("total_de_paginas", 1)
-                pagina += 1
-
-            return vendas
+            for response_data in self._iter_paginas(alterados_desde):
+                vendas_da_pagina = self._vendas_nao_faturadas([response_data])
+                if por_pagina:
+                    yield vendas_da_pagina
+                else:
+                    yield from vendas_da_pagina
         except Exception as e:
             logger.critical(
                 f'Erro no TRY/EXCEPT geral de buscar vendas: {e}', exc_info=True)
             raise e
 
+    def get_vendas(self, alterados_desde=None):
+        """
+        Recupera uma lista de vendas por meio da API 'ListarPedidos' da Omie e salva no banco de dados.
+
+        :param alterados_desde: Se informado, busca apenas pedidos incluídos ou alterados a partir desse instante.
+        :type alterados_desde: datetime
+        :return: Uma lista de dicionarios de venda.
+        :rtype: list[Venda<models.Venda>]
+        :raises: Exception em caso de erro HTTP, resposta inválida da API ou erro geral durante o processo.
+        """
+        return list(self.iter_vendas(alterados_desde))
+
     def consultar_pedido(self, numero_pedido):
         """
         Consulta um pedido de venda por meio da API de "ConsultarPedido" da Omie.
+        A resposta fica no cache de pedidos (TTL e LRU) até expirar ou o pedido ser alterado.
 
         :param numero_pedido: O número do pedido de venda a ser consultado.
         :ptype numero_pedido: int ou str
@@ -88,26 +399,16 @@ class OmieVendas:
         :rtype: dict
         :raises: Exception em caso de erro HTTP, resposta inválida da API ou se o campo 'pedido_venda_produto' não for encontrado na resposta.
         """
+        pedido = self.cache.obter(numero_pedido)
+        if pedido is not None:
+            return pedido
 
-        payload = json.dumps({
-            "call": 'ConsultarPedido',
-            "app_key": self.app_key,
-            "app_secret": self.app_secret,
-            "param": [{
-                    "numero_pedido": numero_pedido,
-            }]
-        })
-        headers = {'Content-Type': 'application/json'}
-        response = requests.post(self.url, headers=headers, data=payload)
-        response_data = response.json()
-        if response.status_code != 200:
-            raise Exception(
-                f"Erro HTTP ao consultar pedido: {response.status_code} / {response_data}")
-        response_data = response.json()
-        if 'pedido_venda_produto' not in response_data:
-            raise KeyError(
-                'Campo pedido_venda_produto não encontrado na resposta')
-        return response_data['pedido_venda_produto']
+        payload = self._payload(
+            'ConsultarPedido', {"numero_pedido": numero_pedido})
+        response = self.transport.post(self.url, payload, consulta=True)
+        pedido = self._tratar_resposta_consulta(response)
+        self.cache.guardar(numero_pedido, pedido)
+        return pedido
 
     def alterar_pedido(self, pedido):
         """
@@ -120,31 +421,68 @@ class OmieVendas:
         :raises: Exception em caso de erro HTTP, resposta inválida da API ou erro geral durante o processo.
         """
         try:
-            payload = json.dumps({
-                "call": 'AlterarPedidoVenda',
-                "app_key": self.app_key,
-                "app_secret": self.app_secret,
-                "param": [pedido]
-            })
-            headers = {'Content-Type': 'application/json'}
-            response = requests.post(self.url, headers=headers, data=payload)
-            if response.status_code != 200:
-                raise Exception(
-                    f"Erro HTTP ao alterar pedido: {response.status_code} / {response.json()}")
-            response_data = response.json()
-            if 'descricao_status' not in response_data:
-                logger.critical(
-                    f'Erro no response da API de alterar pedido: {response_data}', exc_info=True)
-                raise KeyError('Pedido nao foi alterado')
-            return response_data
+            payload = self._payload('AlterarPedidoVenda', pedido)
+            try:
+                response = self.transport.post(self.url, payload)
+            finally:
+                self._invalidar_cache(pedido)
+            return self._tratar_resposta_alteracao(response)
         except Exception as e:
             logger.critical(
                 f'Erro no TRY/EXCEPT geral de alterar pedido: {e}', exc_info=True)
             raise e
 
+    def sincronizar_vendas(self, incremental=True, a_cada_pagina=None):
+        """
+        Sincroniza a tabela de Venda com os pedidos da Omie.
+
+        No modo incremental, busca apenas os pedidos incluídos ou alterados desde a última
+        sincronização bem-sucedida; sem marca d'água registrada, faz a sincronização completa.
+        Pedidos não faturados são inseridos ou atualizados em lote (Venda.upsert_de_api) e pedidos
+        que passaram a faturados são removidos. O início da sincronização é salvo como nova marca d'água.
+
+        :param incremental: Se False, busca todos os pedidos.
+        :type incremental: bool
+        :param a_cada_pagina: Chamado após gravar cada página; uma exceção nele interrompe a sincronização.
+        :type a_cada_pagina: Callable[[], None]
+        :return: Um dicionário com as quantidades de páginas lidas e de vendas inseridas, atualizadas, rejeitadas e removidas.
+        :rtype: dict
+        :raises: Exception em caso de erro na API da Omie; nesse caso a marca d'água não é alterada.
+        """
+        sincronizacao, _ = SincronizacaoOmie.objects.get_or_create(
+            chave=SincronizacaoOmie.VENDAS)
+        inicio = timezone.now()
+        alterados_desde = sincronizacao.ultima_sincronizacao if incremental else None
+
+        resultado = {"paginas": 0, "inseridas": 0, "atualizadas": 0,
+                     "rejeitadas": 0, "removidas": 0}
+        for response_data in self._iter_paginas(alterados_desde):
+            resultado["paginas"] += 1
+            vendas_da_pagina = response_data.get("pedido_venda_produto", [])
+
+            for chave, quantidade in Venda.upsert_de_api(
+                    self._vendas_nao_faturadas([response_data])).items():
+                resultado[chave] += quantidade
+
+            codigos_faturados = [
+                dados_venda['cabecalho']['codigo_pedido'] for dados_venda in vendas_da_pagina
+                if dados_venda['infoCadastro']['faturado'] == 'S']
+            if codigos_faturados:
+                resultado["removidas"] += Venda.excluir(
+                    Venda.objects.filter(codigo_pedido__in=codigos_faturados))
+            if a_cada_pagina is not None:
+                a_cada_pagina()
+
+        # A versão dos dados só muda se alguma venda mudou (registrada pelo upsert_de_api e pelo
+        # Venda.excluir), para que uma sincronização sem alterações preserve o ETag da listagem
+        sincronizacao.ultima_sincronizacao = inicio
+        sincronizacao.save(update_fields=['ultima_sincronizacao'])
+        return resultado
+
     def set_adiantamentos(self, dados):
         """
         Utiliza o serviço de alterar_pedido para realizar o adiantamento.
+        As alterações na Omie são enviadas em paralelo, até 'max_alteracoes' ao mesmo tempo.
 
         :param dados: Um dicionário contendo informações necessárias para o adiantamento.
                     Deve conter "numerosVendas" (lista com os numeros do pedido do cliente para localizar os pedidos de vendas a adiantar)
@@ -159,81 +497,42 @@ class OmieVendas:
         :raises: Exception em caso de erro crítico durante o processo.
         """
         try:
-
-            vendas_a_adiantar = dados["numerosVendas"]
-            data_vencimento_inicial = datetime.strptime(
-                dados["dataVencimento"], "%d/%m/%Y")
-            pedidos_para_excluir = []
-            erros = []
-
-            for numero_pedido_cliente in vendas_a_adiantar:
-                try:
-                    venda = Venda.objects.get(
-                        numero_pedido_cliente=numero_pedido_cliente)
-                    parcelas = venda.parcelas
-
-                    for i, parcela in enumerate(parcelas):
-                        parcela['parcela_adiantamento'] = "S"
-                        parcela['categoria_adiantamento'] = "1.04.01"
-                        parcela['conta_corrente_adiantamento'] = "2135259563"
-                        nova_data = data_vencimento_inicial + \
-                            relativedelta(months=+i)
-                        parcela['data_vencimento'] = nova_data.strftime(
-                            '%d/%m/%Y')
-
-                    venda.parcelas = parcelas
-                    venda.save()
-
-                    detalhes_pedido = {
-                        "cabecalho": {"codigo_pedido": venda.codigo_pedido},
-                        "lista_parcelas": {"parcela": parcelas}
-                    }
-
-                    resposta_adiantamento = self.alterar_pedido(
-                        detalhes_pedido)
-                    if resposta_adiantamento.get('descricao_status') != 'Pedido alterado com sucesso!':
-                        logger.critical(
-                            f'Erro ao adiantar pedido: {resposta_adiantamento}', exc_info=True)
-                        erros.append(
-                            {"numero_pedido_cliente": numero_pedido_cliente, "erro": "Falha ao alterar pedido"})
-                    else:
-                        print(
-                            f'Pedido {numero_pedido_cliente} adiantado com sucesso.')
-                        pedidos_para_excluir.append(numero_pedido_cliente)
-
-                except Venda.DoesNotExist:
-                    erros.append(
-                        {"numero_pedido_cliente": numero_pedido_cliente, "erro": "Pedido não encontrado"})
-                except Exception as e:
-                    erros.append(
-                        {"numero_pedido_cliente": numero_pedido_cliente, "erro": str(e)})
-
-            if pedidos_para_excluir:
-                self.excluir_pedidos(pedidos_para_excluir)
-
-            if erros:
-                logger.error(
-                    f'Erros ao adiantar pedidos: {erros}', exc_info=True)
-                return {"status_code": 500, "message": "Erros encontrados", "erros": erros}
-            else:
-                return {"status_code": 200, "message": "Todos os pedidos foram adiantados com sucesso"}
+            vendas_a_adiantar, resultados, a_alterar = self._preparar_adiantamentos(
+                dados)
+
+            if a_alterar:
+                with ThreadPoolExecutor(max_workers=min(self.max_alteracoes, len(a_alterar))) as executor:
+                    respostas = executor.map(
+                        lambda item: self._alterar_parcelas_na_omie(
+                            vendas_a_adiantar[item[0]], item[1]),
+                        a_alterar)
+                    for (indice, _), erro in zip(a_alterar, respostas):
+                        resultados[indice] = erro
+
+            return self._concluir_adiantamentos(vendas_a_adiantar, resultados)
         except Exception as e:
             logger.critical(
                 f'Erro ao adiantar pedidos: {e}', exc_info=True)
             raise e
 
+    def _alterar_parcelas_na_omie(self, numero_pedido_cliente, venda):
+        """
+        Envia as parcelas adiantadas de uma venda para a Omie.
+
+        :return: None se o pedido foi alterado, ou a descrição do erro.
+        :rtype: str ou None
+        """
+        try:
+            resposta_adiantamento = self.alterar_pedido(
+                self._detalhes_adiantamento(venda))
+        except Exception as e:
+            resposta_adiantamento = e
+        return self._erro_adiantamento(numero_pedido_cliente, resposta_adiantamento)
+
     def excluir_pedidos(self, pedidos):
         """
         Exclui vendas do banco de dados com base em uma lista de números de pedido.
 
         :param pedidos: Uma lista de números de pedidos.
         """
-        try:
-
-            for numero_pedido_cliente in pedidos:
-                Venda.objects.filter(
-                    numero_pedido_cliente=numero_pedido_cliente).delete()
-        except Exception as e:
-            logger.error(
-                f'Erro ao excluir pedidos: {e}', exc_info=True)
-            raise e
+        self._excluir_pedidos(pedidos)
@@ -0,0 +1,184 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.db import connection
+from dotenv import load_dotenv
+
+from .models import SincronizacaoOmie, Venda
+from .services import APP_KEY, APP_SECRET, OmieVendas
+from .snapshot import gerar_snapshot
+
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# Validade da trava de sincronização, renovada a cada página; expira sozinha se o processo morrer
+SINCRONIZACAO_TRAVA_SEGUNDOS = int(
+    os.getenv('SINCRONIZACAO_TRAVA_SEGUNDOS', 30 * 60))
+# Idade, em segundos, a partir da qual a listagem de vendas dispara uma atualização em segundo plano
+VENDAS_IDADE_MAXIMA = int(os.getenv('VENDAS_IDADE_MAXIMA', 10 * 60))
+# Quanto uma requisição espera pela sincronização inicial feita por outra requisição ou processo
+SINCRONIZACAO_ESPERA_SEGUNDOS = float(
+    os.getenv('SINCRONIZACAO_ESPERA_SEGUNDOS', 30))
+
+CAMPOS_ESTADO = ('ultima_sincronizacao', 'versao', 'alterado_em')
+
+_atualizacao_em_andamento = threading.Lock()
+_sincronizacao_inicial = threading.Lock()
+
+
+class TravaPerdidaError(Exception):
+    """
+    A trava da sincronização expirou e foi obtida por outro processo durante a sincronização.
+    """
+
+
+def executar_sincronizacao(incremental=True, omie_vendas=None):
+    """
+    Executa o OmieVendas.sincronizar_vendas sob a trava de banco da sincronização, de modo que
+    apenas um processo sincronize por vez, e registra no log a duração, as páginas e as linhas.
+    A trava é renovada a cada página, e uma sincronização que a perde é interrompida sem
+    avançar a marca d'água.
+
+    :param incremental: Repassado ao sincronizar_vendas.
+    :type incremental: bool
+    :param omie_vendas: Cliente da Omie; por padrão um OmieVendas com as chaves do ambiente.
+    :type omie_vendas: OmieVendas
+    :return: O resultado do sincronizar_vendas acrescido de 'duracao' (segundos),
+             ou None se outra sincronização estiver em andamento.
+    :rtype: dict ou None
+    :raises: TravaPerdidaError se outro processo obtiver a trava durante a sincronização.
+    :raises: Exception em caso de erro na sincronização; a trava é liberada mesmo assim.
+    """
+    dono = uuid.uuid4().hex
+    duracao = timedelta(seconds=SINCRONIZACAO_TRAVA_SEGUNDOS)
+    if not SincronizacaoOmie.adquirir_trava(SincronizacaoOmie.VENDAS, dono, duracao):
+        logger.info('Sincronização de vendas já em andamento em outro processo')
+        return None
+
+    def renovar_trava():
+        if not SincronizacaoOmie.renovar_trava(SincronizacaoOmie.VENDAS, dono, duracao):
+            raise TravaPerdidaError(
+                'Trava da sincronização de vendas obtida por outro processo')
+
+    try:
+        omie_vendas = omie_vendas or OmieVendas(APP_KEY, APP_SECRET)
+        inicio = time.monotonic()
+        resultado = omie_vendas.sincronizar_vendas(
+            incremental=incremental, a_cada_pagina=renovar_trava)
+        resultado["duracao"] = round(time.monotonic() - inicio, 3)
+
+        linhas = resultado["inseridas"] + \
+            resultado["atualizadas"] + resultado["removidas"]
+        logger.info(
+            f'Sincronização de vendas {"incremental" if incremental else "completa"} concluída em '
+            f'{resultado["duracao"]}s: {resultado["paginas"]} páginas, {linhas} linhas ({resultado})')
+        _atualizar_snapshot()
+        return resultado
+    finally:
+        SincronizacaoOmie.liberar_trava(SincronizacaoOmie.VENDAS, dono)
+
+
+def _atualizar_snapshot():
+    # Uma falha aqui não invalida a sincronização: o snapshot é gerado na próxima leitura
+    try:
+        gerar_snapshot()
+    except Exception as e:
+        logger.error(f'Erro ao gerar o snapshot de vendas: {e}', exc_info=True)
+
+
+def ultima_sincronizacao():
+    """
+    :return: O instante da última sincronização de vendas bem-sucedida, ou None se nunca houve.
+    :rtype: datetime ou None
+    """
+    return SincronizacaoOmie.objects.filter(chave=SincronizacaoOmie.VENDAS).values_list(
+        'ultima_sincronizacao', flat=True).first()
+
+
+def estado_vendas():
+    """
+    :return: 'ultima_sincronizacao', 'versao' e 'alterado_em' das vendas, com uma única consulta.
+    :rtype: dict
+    """
+    return SincronizacaoOmie.objects.filter(chave=SincronizacaoOmie.VENDAS).values(
+        *CAMPOS_ESTADO).first() or dict.fromkeys(CAMPOS_ESTADO)
+
+
+async def aestado_vendas():
+    """
+    Versão assíncrona do estado_vendas.
+
+    :rtype: dict
+    """
+    return await SincronizacaoOmie.objects.filter(chave=SincronizacaoOmie.VENDAS).values(
+        *CAMPOS_ESTADO).afirst() or dict.fromkeys(CAMPOS_ESTADO)
+
+
+def sincronizacao_inicial(espera=None):
+    """
+    Popula a tabela de vendas vazia com uma sincronização completa, garantindo que apenas uma
+    rode por vez: as threads do processo aguardam a que já começou e, entre processos, quem não
+    obtém a trava de banco aguarda a sincronização do outro processo terminar.
+
+    :param espera: Segundos máximos de espera; por padrão SINCRONIZACAO_ESPERA_SEGUNDOS.
+    :type espera: float
+    :return: True se a sincronização terminou (aqui ou em outro lugar), False se ainda estiver
+             em andamento em outro processo após a espera.
+    :rtype: bool
+    :raises: Exception em caso de erro na sincronização executada por esta chamada.
+    """
+    if espera is None:
+        espera = SINCRONIZACAO_ESPERA_SEGUNDOS
+    limite = time.monotonic() + espera
+    sincronizado_antes = ultima_sincronizacao()
+
+    def concluida():
+        return Venda.objects.exists() or ultima_sincronizacao() != sincronizado_antes
+
+    if not _sincronizacao_inicial.acquire(timeout=espera):
+        return concluida()
+    try:
+        while not concluida():
+            if executar_sincronizacao(incremental=False) is not None:
+                return True
+            if time.monotonic() >= limite:
+                return False
+            time.sleep(0.5)
+        return True
+    finally:
+        _sincronizacao_inicial.release()
+
+
+def _atualizar():
+    try:
+        executar_sincronizacao(incremental=True)
+    except Exception as e:
+        logger.error(
+            f'Erro na atualização de vendas em segundo plano: {e}', exc_info=True)
+    finally:
+        connection.close()
+        _atualizacao_em_andamento.release()
+
+
+def atualizar_em_segundo_plano():
+    """
+    Dispara uma sincronização incremental em uma thread, se ainda não houver uma em andamento
+    neste processo. Entre processos, a trava de banco do executar_sincronizacao evita duplicidade.
+
+    :return: True se a atualização foi disparada.
+    :rtype: bool
+    """
+    if not _atualizacao_em_andamento.acquire(blocking=False):
+        return False
+    try:
+        threading.Thread(target=_atualizar, name='atualizacao-vendas',
+                         daemon=True).start()
+    except Exception:
+        _atualizacao_em_andamento.release()
+        raise
+    return True
@@ -0,0 +1,171 @@
+import gzip
+import logging
+import os
+import threading
+import time
+
+from django.db import connections
+from django.dispatch import receiver
+from django.http import QueryDict
+from django.utils import timezone
+from dotenv import load_dotenv
+
+from .listagem import ConsultaVendas
+from .models import SincronizacaoOmie, SnapshotVendas, dados_alterados
+
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_GZIP_NIVEL = int(os.getenv('SNAPSHOT_GZIP_NIVEL', 6))
+# Espera antes de gerar o snapshot em segundo plano, para que uma sequência de gravações
+# (um lote de webhooks, por exemplo) resulte em uma única geração
+SNAPSHOT_ATRASO_SEGUNDOS = float(os.getenv('SNAPSHOT_ATRASO_SEGUNDOS', 1))
+
+# Snapshot mais recente lido ou gerado neste processo: (versao, conteudo, conteudo_gzip)
+_em_memoria = None
+_geracao = threading.Lock()
+_geracao_em_segundo_plano = threading.Lock()
+_geracao_pendente = threading.Event()
+
+
+def _versao_atual():
+    return SincronizacaoOmie.objects.filter(chave=SincronizacaoOmie.VENDAS).values_list(
+        'versao', flat=True).first() or 0
+
+
+def gerar_snapshot():
+    """
+    Serializa a listagem completa de vendas, comprime com gzip e grava o resultado no
+    SnapshotVendas, de onde todos os processos o leem. Chamado ao fim da sincronização e do
+    processamento da fila de webhooks; as demais gravações o disparam em segundo plano
+    (gerar_em_segundo_plano).
+
+    A versão é lida antes das vendas: se houver gravações durante a serialização, o snapshot
+    fica com a versão anterior e é gerado de novo na próxima leitura.
+
+    :return: A versão, o JSON e o JSON comprimido.
+    :rtype: tuple[int, bytes, bytes]
+    """
+    global _em_memoria
+    versao = _versao_atual()
+    conteudo = ''.join(ConsultaVendas(QueryDict()).json_em_fluxo()).encode()
+    conteudo_gzip = gzip.compress(conteudo, compresslevel=SNAPSHOT_GZIP_NIVEL)
+
+    SnapshotVendas.objects.update_or_create(
+        chave=SincronizacaoOmie.VENDAS,
+        defaults={"versao": versao, "conteudo": conteudo, "conteudo_gzip": conteudo_gzip})
+    _em_memoria = (versao, conteudo, conteudo_gzip)
+    logger.info(
+        f'Snapshot de vendas gerado na versão {versao}: {len(conteudo)} bytes, {len(conteudo_gzip)} com gzip')
+    return _em_memoria
+
+
+def snapshot_em_memoria(versao):
+    """
+    :return: O snapshot da versão informada (ou de uma posterior), se já estiver na memória do
+             processo; senão None.
+    :rtype: tuple[int, bytes, bytes] ou None
+    """
+    snapshot = _em_memoria
+    if snapshot is not None and snapshot[0] >= versao:
+        return snapshot
+    return None
+
+
+def obter_snapshot(versao):
+    """
+    Devolve o snapshot da versão informada, da memória ou do banco. Se ele ainda não foi gerado,
+    devolve o snapshot anterior e agenda a geração em segundo plano; quem o recebe deve conferir
+    a versão e, se anterior, ler a listagem do banco. Apenas quando não existe nenhum snapshot a
+    geração ocorre na própria chamada (uma por vez no processo).
+
+    :param versao: A versão atual dos dados.
+    :type versao: int
+    :return: O snapshot, que pode ser de uma versão anterior à informada.
+    :rtype: tuple[int, bytes, bytes]
+    """
+    global _em_memoria
+    snapshot = snapshot_em_memoria(versao)
+    if snapshot is not None:
+        return snapshot
+
+    with _geracao:
+        snapshot = _em_memoria
+        if snapshot is not None and snapshot[0] >= versao:
+            return snapshot
+
+        gravados = SnapshotVendas.objects.filter(chave=SincronizacaoOmie.VENDAS)
+        versao_gravada = gravados.values_list('versao', flat=True).first()
+        if versao_gravada is not None and (snapshot is None or versao_gravada > snapshot[0]):
+            gravado = gravados.values_list('versao', 'conteudo', 'conteudo_gzip').first()
+            if gravado is not None:
+                _em_memoria = snapshot = (gravado[0], bytes(gravado[1]), bytes(gravado[2]))
+
+        if snapshot is None:
+            return gerar_snapshot()
+        if snapshot[0] < versao:
+            gerar_em_segundo_plano()
+            snapshot = _em_memoria
+        return snapshot
+
+
+def gerar_em_segundo_plano():
+    """
+    Agenda a geração do snapshot da versão atual em uma thread, sem atrasar quem gravou os dados;
+    enquanto isso, as leituras recebem o snapshot anterior. Os pedidos feitos durante uma geração
+    são atendidos por uma única geração seguinte.
+
+    :return: True se uma thread foi disparada.
+    :rtype: bool
+    """
+    _geracao_pendente.set()
+    if not _geracao_em_segundo_plano.acquire(blocking=False):
+        return False
+    try:
+        threading.Thread(target=_gerar_pendentes, name='snapshot-vendas',
+                         daemon=True).start()
+    except Exception:
+        _geracao_em_segundo_plano.release()
+        raise
+    return True
+
+
+def _gerar_pendentes():
+    try:
+        while _geracao_pendente.is_set():
+            time.sleep(SNAPSHOT_ATRASO_SEGUNDOS)
+            _geracao_pendente.clear()
+            _gerar_se_desatualizado()
+    finally:
+        connections.close_all()
+        _geracao_em_segundo_plano.release()
+    # Pedido feito entre o fim do laço e a liberação da trava
+    if _geracao_pendente.is_set():
+        gerar_em_segundo_plano()
+
+
+def _gerar_se_desatualizado():
+    try:
+        versao = _versao_atual()
+        if snapshot_em_memoria(versao) is not None or SnapshotVendas.objects.filter(
+                chave=SincronizacaoOmie.VENDAS, versao__gte=versao).exists():
+            return
+        # Uma sincronização em andamento gera o snapshot ao terminar
+        if SincronizacaoOmie.objects.filter(
+                chave=SincronizacaoOmie.VENDAS, travado_ate__gt=timezone.now()).exists():
+            return
+        gerar_snapshot()
+    except Exception as e:
+        logger.error(f'Erro ao gerar o snapshot de vendas: {e}', exc_info=True)
+
+
+@receiver(dados_alterados, dispatch_uid='snapshot_vendas')
+def _dados_alterados(sender, chave, **kwargs):
+    if chave == SincronizacaoOmie.VENDAS:
+        gerar_em_segundo_plano()
+
+
+def limpar_memoria():
+    global _em_memoria
+    _em_memoria = None
@@ -0,0 +1,21 @@
+import pytest
+from vendas_class.cache import cache_pedidos
+from vendas_class.resiliencia import circuito_omie, limitador_omie
+from vendas_class import snapshot
+from vendas_class.snapshot import limpar_memoria
+
+
+@pytest.fixture(autouse=True)
+def resiliencia_omie_isolada(monkeypatch):
+    # O limitador de taxa do processo atrasaria os testes que fazem várias chamadas mockadas
+    for atributo in ('taxa_maxima', 'taxa', 'capacidade', 'tokens'):
+        monkeypatch.setattr(limitador_omie, atributo, 1000)
+    # Falhas simuladas em um teste não podem deixar o circuito aberto para os seguintes
+    circuito_omie.registrar_sucesso()
+    cache_pedidos.limpar()
+    # O banco volta ao estado inicial a cada teste, e com ele a versão dos dados
+    limpar_memoria()
+    # Uma thread não enxerga os dados da transação do teste: o snapshot é gerado na hora
+    monkeypatch.setattr(snapshot, 'gerar_em_segundo_plano', snapshot._gerar_se_desatualizado)
+    yield
+    circuito_omie.registrar_sucesso()
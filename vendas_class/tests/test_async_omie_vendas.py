@@ -0,0 +1,131 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from asgiref.sync import async_to_sync
+from vendas_class.async_services import AsyncOmieVendas
+from vendas_class.transport import AsyncOmieTransport, get_async_transport
+
+
+def _cliente(handler, **kwargs):
+    transport = AsyncOmieTransport(
+        http_transport=httpx.MockTransport(handler))
+    return AsyncOmieVendas("test_key", "test_secret", transport=transport, **kwargs)
+
+
+def test_get_vendas_mantem_ordem_das_paginas():
+    def handler(request):
+        pagina = json.loads(request.content)["param"][0]["pagina"]
+        return httpx.Response(200, json={"pedido_venda_produto": [
+            {"cabecalho": {"numero_pedido": pagina},
+             "infoCadastro": {"faturado": "N"}},
+            {"cabecalho": {"numero_pedido": pagina * 100},
+             "infoCadastro": {"faturado": "S"}}],
+            "total_de_paginas": 4})
+
+    vendas = asyncio.run(_cliente(handler, max_concorrencia=2).get_vendas())
+
+    assert [venda["cabecalho"]["numero_pedido"]
+            for venda in vendas] == [1, 2, 3, 4]
+
+
+def test_get_vendas_http_error():
+    def handler(request):
+        return httpx.Response(500, json={"faultstring": "erro"})
+
+    with pytest.raises(Exception) as excinfo:
+        asyncio.run(_cliente(handler).get_vendas())
+    assert "Erro HTTP ao buscar vendas: 500" in str(excinfo.value)
+
+
+def test_get_vendas_sem_registros():
+    def handler(request):
+        return httpx.Response(500, json={
+            "faultstring": "ERROR: Não existem registros para a página [1]!",
+            "faultcode": "SOAP-ENV:Client-5113"})
+
+    assert asyncio.run(_cliente(handler).get_vendas()) == []
+
+
+def test_consultar_pedidos_em_lote():
+    def handler(request):
+        numero_pedido = json.loads(request.content)[
+            "param"][0]["numero_pedido"]
+        if numero_pedido == 2:
+            return httpx.Response(200, json={"invalid": "response"})
+        return httpx.Response(200, json={"pedido_venda_produto": {
+            "cabecalho": {"numero_pedido": numero_pedido}}})
+
+    resultados = asyncio.run(_cliente(handler).consultar_pedidos([1, 2, 3]))
+
+    assert resultados[0]["cabecalho"]["numero_pedido"] == 1
+    assert isinstance(resultados[1], KeyError)
+    assert resultados[2]["cabecalho"]["numero_pedido"] == 3
+
+
+def test_alterar_pedido_invalid_response():
+    def handler(request):
+        return httpx.Response(200, json={"invalid": "response"})
+
+    with pytest.raises(KeyError):
+        asyncio.run(_cliente(handler).alterar_pedido({"algum_dado": "valor"}))
+
+
+@pytest.mark.django_db(transaction=True)
+def test_set_adiantamentos_altera_pedidos_ao_mesmo_tempo():
+    from vendas_class.models import Venda
+    from vendas_class.tests.test_omie_vendas import _dados_venda
+
+    Venda.upsert_de_api([_dados_venda(1, 101), _dados_venda(2, 102)])
+    em_andamento = 0
+    maximo = 0
+
+    async def handler(request):
+        nonlocal em_andamento, maximo
+        em_andamento += 1
+        maximo = max(maximo, em_andamento)
+        await asyncio.sleep(0.05)
+        em_andamento -= 1
+        codigo_pedido = json.loads(request.content)[
+            "param"][0]["cabecalho"]["codigo_pedido"]
+        if codigo_pedido == 102:
+            return httpx.Response(200, json={"descricao_status": "Erro"})
+        return httpx.Response(200, json={"descricao_status": "Pedido alterado com sucesso!"})
+
+    resultado = asyncio.run(_cliente(handler).set_adiantamentos(
+        {"numerosVendas": ["PC1", "PC2", "PC3"], "dataVencimento": "10/01/2024"}))
+
+    assert maximo == 2
+    assert resultado["status_code"] == 500
+    assert resultado["erros"] == [
+        {"numero_pedido_cliente": "PC2", "erro": "Falha ao alterar pedido"},
+        {"numero_pedido_cliente": "PC3", "erro": "Pedido não encontrado"}]
+    assert list(Venda.objects.values_list(
+        'numero_pedido_cliente', flat=True)) == ["PC2"]
+
+
+def test_transport_do_loop_fechado_ao_encerrar_o_loop():
+    async def transport_do_loop():
+        transport = get_async_transport()
+        assert get_async_transport() is transport
+        return transport
+
+    transport = async_to_sync(transport_do_loop)()
+
+    assert transport.client.is_closed
+    # Cada loop tem o seu transporte
+    assert async_to_sync(transport_do_loop)() is not transport
+
+
+def test_transport_proprio_com_async_with():
+    def handler(request):
+        return httpx.Response(200, json={"descricao_status": "Pedido alterado com sucesso!"})
+
+    async def alterar():
+        async with AsyncOmieTransport(http_transport=httpx.MockTransport(handler)) as transport:
+            omie_vendas = AsyncOmieVendas("test_key", "test_secret", transport=transport)
+            await omie_vendas.alterar_pedido({"cabecalho": {"codigo_pedido": 1}})
+        return transport
+
+    assert asyncio.run(alterar()).client.is_closed
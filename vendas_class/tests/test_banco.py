@@ -0,0 +1,110 @@
+import asyncio
+import json
+
+import pytest
+from django.db import connection, connections, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from backend_rocinante.banco import (BANCO_LEITURA, PRAGMAS_SQLITE, RoteadorBancos,
+                                     somente_leitura, transacao_escrita)
+from vendas_class.models import Venda
+from vendas_class.tests.test_omie_vendas import _dados_venda
+
+
+roteador = RoteadorBancos()
+
+
+@pytest.mark.django_db
+def test_pragmas_aplicados_na_conexao():
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA synchronous')
+        assert cursor.fetchone()[0] == 1  # NORMAL
+        cursor.execute('PRAGMA busy_timeout')
+        assert cursor.fetchone()[0] == PRAGMAS_SQLITE['busy_timeout']
+
+
+def test_roteador_leituras_das_views_somente_leitura():
+    assert roteador.db_for_read(Venda) == 'default'
+
+    @somente_leitura
+    def view():
+        bancos = [roteador.db_for_read(Venda)]
+        assert roteador.db_for_write(Venda) == 'default'
+        # Depois de gravar, a requisição volta a ler do principal
+        bancos.append(roteador.db_for_read(Venda))
+        return bancos
+
+    assert view() == [BANCO_LEITURA, 'default']
+    assert view() == [BANCO_LEITURA, 'default']
+    assert roteador.db_for_read(Venda) == 'default'
+
+
+def test_roteador_views_assincronas():
+    @somente_leitura
+    async def view():
+        return roteador.db_for_read(Venda)
+
+    assert asyncio.run(view()) == BANCO_LEITURA
+    assert roteador.db_for_read(Venda) == 'default'
+
+
+@pytest.mark.django_db
+def test_roteador_le_do_principal_dentro_de_transacao():
+    # O teste roda dentro de uma transação no banco principal
+    assert somente_leitura(lambda: roteador.db_for_read(Venda))() == 'default'
+
+
+def test_roteador_migra_apenas_o_principal():
+    assert roteador.allow_migrate('default', 'vendas_class')
+    assert not roteador.allow_migrate(BANCO_LEITURA, 'vendas_class')
+
+
+@pytest.mark.django_db(transaction=True)
+def test_transacao_escrita_abre_com_begin_immediate():
+    with CaptureQueriesContext(connection) as consultas:
+        with transacao_escrita():
+            Venda.objects.count()
+            # Dentro de outra transação, vira um savepoint
+            with transacao_escrita():
+                Venda.objects.count()
+    assert consultas.captured_queries[0]['sql'] == 'BEGIN IMMEDIATE'
+    assert not any(consulta['sql'] == 'BEGIN' for consulta in consultas.captured_queries)
+    # A substituição vale só para o bloco
+    assert '_start_transaction_under_autocommit' not in connection.__dict__
+    with CaptureQueriesContext(connection) as consultas:
+        with transaction.atomic():
+            Venda.objects.count()
+    assert consultas.captured_queries[0]['sql'] == 'BEGIN'
+
+
+@pytest.mark.django_db(transaction=True, databases=['default', BANCO_LEITURA])
+def test_views_somente_leitura_consultam_o_banco_de_leitura(client):
+    Venda.upsert_de_api([_dados_venda(1, 101), _dados_venda(2, 102)])
+
+    def tabelas(consultas):
+        return ' '.join(consulta['sql'] for consulta in consultas.captured_queries)
+
+    rotas = [(reverse('buscar_vendas'), {'q': 'mouse'}, 'vendas_class_venda'),
+             (reverse('resumo_vendas'), {}, 'vendas_class_resumovendas')]
+    for rota, parametros, tabela in rotas:
+        with CaptureQueriesContext(connections[BANCO_LEITURA]) as leitura, \
+                CaptureQueriesContext(connection) as principal:
+            assert client.get(rota, parametros).status_code == 200
+        assert tabela in tabelas(leitura)
+        assert tabela not in tabelas(principal)
+
+    # Na listagem, só a página vai ao banco de leitura; a verificação que decide pela
+    # sincronização inicial e o estado dos dados ficam no principal
+    with CaptureQueriesContext(connections[BANCO_LEITURA]) as leitura, \
+            CaptureQueriesContext(connection) as principal:
+        assert len(client.get(reverse('get_vendas'), {'limit': 1}).json()) == 1
+    assert [consulta['sql'] for consulta in leitura.captured_queries
+            if 'vendas_class_venda' in consulta['sql'] and 'LIMIT 2' in consulta['sql']]
+    assert 'vendas_class_sincronizacaoomie' in tabelas(principal)
+    assert 'LIMIT 2' not in tabelas(principal)
+
+    # A exportação em streaming é lida depois que a view retorna, fora do banco de leitura
+    with CaptureQueriesContext(connections[BANCO_LEITURA]) as leitura:
+        response = client.get(reverse('get_vendas'), {'stream': 'true'})
+        assert len(json.loads(b''.join(response.streaming_content))) == 2
+    assert 'vendas_class_venda' not in tabelas(leitura)
@@ -0,0 +1,36 @@
+from vendas_class import cache as cache_module
+from vendas_class.cache import CacheTTL
+
+
+def test_cache_ttl_expira_itens(monkeypatch):
+    agora = [100.0]
+    monkeypatch.setattr(cache_module.time, 'monotonic', lambda: agora[0])
+    cache = CacheTTL(ttl=10)
+
+    cache.guardar(1, {"numero_pedido": 1})
+    assert cache.obter("1") == {"numero_pedido": 1}
+
+    agora[0] += 11
+    assert cache.obter(1) is None
+    assert cache.estatisticas() == {
+        "acertos": 1, "falhas": 1, "itens": 0, "taxa_acerto": 0.5}
+
+
+def test_cache_descarta_menos_usado():
+    cache = CacheTTL(tamanho_maximo=2)
+    cache.guardar(1, "a")
+    cache.guardar(2, "b")
+    cache.obter(1)
+    cache.guardar(3, "c")
+
+    assert cache.obter(2) is None
+    assert cache.obter(1) == "a"
+    assert cache.obter(3) == "c"
+
+
+def test_cache_devolve_copias():
+    cache = CacheTTL()
+    cache.guardar(1, {"parcelas": []})
+    cache.obter(1)["parcelas"].append("alterada")
+
+    assert cache.obter(1) == {"parcelas": []}
@@ -0,0 +1,87 @@
+import json
+from datetime import timedelta
+
+import pytest
+import requests_mock
+from django.urls import reverse
+from vendas_class.fila import processar_fila
+from vendas_class.models import EventoWebhook, SincronizacaoOmie, Venda
+from vendas_class.services import OmieVendas
+from vendas_class.tests.test_omie_vendas import _dados_venda
+
+
+@pytest.fixture
+def omie_vendas():
+    return OmieVendas(app_key="test_key", app_secret="test_secret")
+
+
+@pytest.mark.django_db
+def test_webhook_apenas_enfileira_evento(client):
+    with requests_mock.Mocker() as m:
+        response = client.post(reverse('webhook_omie'), json.dumps(
+            {"numero_pedido": 81, "messageId": "abc"}), content_type='application/json')
+
+        assert m.call_count == 0
+    assert response.status_code == 200
+    evento = EventoWebhook.objects.get()
+    assert (evento.numero_pedido, evento.message_id,
+            evento.processado_em) == ("81", "abc", None)
+
+
+@pytest.mark.django_db
+def test_processar_fila_agrupa_eventos_do_mesmo_pedido(client, omie_vendas):
+    for _ in range(3):
+        client.post(reverse('webhook_omie'), json.dumps(
+            {"numero_pedido": 1}), content_type='application/json')
+    client.post(reverse('webhook_omie'), json.dumps(
+        {"numero_pedido": 2}), content_type='application/json')
+
+    def consulta(request, context):
+        numero_pedido = request.json()["param"][0]["numero_pedido"]
+        return {"pedido_venda_produto": _dados_venda(int(numero_pedido), 100 + int(numero_pedido))}
+
+    with requests_mock.Mocker() as m:
+        m.post(omie_vendas.url, json=consulta)
+        resultado = processar_fila(omie_vendas, janela=0)
+
+        assert m.call_count == 2
+    assert resultado == {"pedidos": 2, "eventos": 4, "erros": 0}
+    assert set(Venda.objects.values_list('numero_pedido', flat=True)) == {1, 2}
+    assert not EventoWebhook.objects.filter(processado_em__isnull=True).exists()
+
+
+@pytest.mark.django_db
+def test_processar_fila_respeita_janela_e_mantem_erros_na_fila(omie_vendas):
+    EventoWebhook.objects.create(numero_pedido="1")
+
+    with requests_mock.Mocker() as m:
+        m.post(omie_vendas.url, status_code=500,
+               json={"faultstring": "ERROR: Pedido não cadastrado"})
+        assert processar_fila(omie_vendas, janela=60) == {
+            "pedidos": 0, "eventos": 0, "erros": 0}
+        assert processar_fila(omie_vendas, janela=0) == {
+            "pedidos": 0, "eventos": 0, "erros": 1}
+
+    evento = EventoWebhook.objects.get()
+    assert evento.tentativas == 1
+    assert evento.processado_em is None
+
+
+@pytest.mark.django_db
+def test_processar_fila_apenas_um_processo_por_vez(omie_vendas):
+    EventoWebhook.objects.create(numero_pedido="1")
+    SincronizacaoOmie.adquirir_trava(
+        SincronizacaoOmie.FILA_WEBHOOKS, 'outro-worker', timedelta(minutes=5))
+
+    with requests_mock.Mocker() as m:
+        assert processar_fila(omie_vendas, janela=0) == {
+            "pedidos": 0, "eventos": 0, "erros": 0}
+        assert m.call_count == 0
+    assert EventoWebhook.objects.get().processado_em is None
+
+    SincronizacaoOmie.liberar_trava(SincronizacaoOmie.FILA_WEBHOOKS, 'outro-worker')
+    with requests_mock.Mocker() as m:
+        m.post(omie_vendas.url, json={"pedido_venda_produto": _dados_venda(1, 101)})
+        assert processar_fila(omie_vendas, janela=0)["eventos"] == 1
+    assert SincronizacaoOmie.objects.get(
+        chave=SincronizacaoOmie.FILA_WEBHOOKS).travado_por == ''
@@ -1,9 +1,14 @@
+import threading
+from unittest import mock
 import pytest
 import requests
 import requests_mock
 from vendas_class.services import OmieVendas
-from vendas_class.models import Venda
-from datetime import datetime
+from vendas_class.models import ParcelaVenda, ProdutoVenda, SincronizacaoOmie, Venda
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from django.db import DatabaseError
+from django.utils import timezone
 
 
 @pytest.fixture
@@ -111,6 +116,43 @@ def test_pagination(omie_vendas):
         assert venda2.numero_pedido == 2
 
 
+def _pagina_listar_pedidos(request, context):
+    pagina = request.json()["param"][0]["pagina"]
+    return {"pedido_venda_produto": [
+        {"cabecalho": {"numero_pedido": pagina},
+         "infoCadastro": {"faturado": "N"}},
+        {"cabecalho": {"numero_pedido": pagina * 100},
+         "infoCadastro": {"faturado": "S"}}],
+        "total_de_paginas": 6}
+
+
+def test_get_vendas_paginas_em_paralelo_mantem_ordem():
+    omie_vendas = OmieVendas(
+        app_key="test_key", app_secret="test_secret", max_workers=3)
+    with requests_mock.Mocker() as m:
+        m.post(omie_vendas.url, json=_pagina_listar_pedidos)
+        vendas = omie_vendas.get_vendas()
+
+        assert m.call_count == 6
+        assert [venda["cabecalho"]["numero_pedido"]
+                for venda in vendas] == [1, 2, 3, 4, 5, 6]
+
+
+def test_iter_vendas_por_pagina_busca_sob_demanda():
+    omie_vendas = OmieVendas(
+        app_key="test_key", app_secret="test_secret", max_workers=2)
+    with requests_mock.Mocker() as m:
+        m.post(omie_vendas.url, json=_pagina_listar_pedidos)
+        paginas = omie_vendas.iter_vendas(por_pagina=True)
+
+        primeira_pagina = next(paginas)
+        paginas.close()
+
+        assert [venda["cabecalho"]["numero_pedido"]
+                for venda in primeira_pagina] == [1]
+        assert m.call_count <= 3
+
+
 def test_consultar_pedido_success(omie_vendas):
     with requests_mock.Mocker() as m:
         m.post(omie_vendas.url, json={"pedido_venda_produto": {
@@ -192,3 +234,238 @@ def test_set_adiantamentos_alteracao_falha(omie_vendas):
             [{"infos_pedido": "+ tag de adiantamento",
               "numero_pedido": "81"}])
         assert status == 500
+
+
+def _dados_venda(numero_pedido, codigo_pedido, faturado="N", valor=150):
+    return {
+        "cabecalho": {"numero_pedido": numero_pedido, "codigo_pedido": codigo_pedido, "etapa": "10"},
+        "infoCadastro": {"dInc": "11/07/2023", "faturado": faturado},
+        "informacoes_adicionais": {"numero_pedido_cliente": f"PC{numero_pedido}"},
+        "total_pedido": {"valor_total_pedido": valor},
+        "det": [{"produto": {"codigo": "1000", "descricao": "Mouse sem fio Microsoft", "valor_unitario": valor}}],
+        "lista_parcelas": {"parcela": [{"data_vencimento": "11/08/2023", "numero_parcela": 1, "valor": valor}]}
+    }
+
+
+@pytest.mark.django_db
+def test_sincronizar_vendas_incremental(omie_vendas):
+    with requests_mock.Mocker() as m:
+        m.post(omie_vendas.url, json={"pedido_venda_produto": [
+            _dados_venda(1, 101), _dados_venda(2, 102)], "total_de_paginas": 1})
+        resultado = omie_vendas.sincronizar_vendas()
+
+        assert resultado == {"paginas": 1, "inseridas": 2, "atualizadas": 0,
+                             "rejeitadas": 0, "removidas": 0}
+        assert "filtrar_por_data_de" not in m.last_request.json()["param"][0]
+        marca_dagua = SincronizacaoOmie.objects.get(
+            chave=SincronizacaoOmie.VENDAS).ultima_sincronizacao
+        assert marca_dagua is not None
+
+        m.post(omie_vendas.url, json={"pedido_venda_produto": [
+            _dados_venda(1, 101, valor=300), _dados_venda(2, 102, faturado="S")], "total_de_paginas": 1})
+        resultado = omie_vendas.sincronizar_vendas()
+
+        param = m.last_request.json()["param"][0]
+        assert param["filtrar_por_data_de"]
+        assert param["filtrar_apenas_alteracao"] == "N"
+        assert resultado == {"paginas": 1, "inseridas": 0, "atualizadas": 1,
+                             "rejeitadas": 0, "removidas": 1}
+        assert list(Venda.objects.values_list(
+            'numero_pedido', 'valor_total_pedido')) == [(1, 300)]
+        assert SincronizacaoOmie.objects.get(
+            chave=SincronizacaoOmie.VENDAS).ultima_sincronizacao > marca_dagua
+
+
+@pytest.mark.django_db
+def test_sincronizar_vendas_incremental_sem_alteracoes(omie_vendas):
+    Venda.upsert_de_api([_dados_venda(1, 101)])
+    marca_dagua = timezone.now() - timedelta(hours=1)
+    SincronizacaoOmie.objects.update_or_create(
+        chave=SincronizacaoOmie.VENDAS, defaults={"ultima_sincronizacao": marca_dagua})
+
+    with requests_mock.Mocker() as m:
+        # Sem pedidos no filtro, a Omie responde com uma falha em vez de uma página vazia
+        m.post(omie_vendas.url, status_code=500, json={
+            "faultstring": "ERROR: Não existem registros para a página [1]!",
+            "faultcode": "SOAP-ENV:Client-5113"})
+        resultado = omie_vendas.sincronizar_vendas()
+
+    assert m.call_count == 1
+    assert resultado["inseridas"] == resultado["atualizadas"] == resultado["removidas"] == 0
+    assert Venda.objects.count() == 1
+    assert SincronizacaoOmie.objects.get(
+        chave=SincronizacaoOmie.VENDAS).ultima_sincronizacao > marca_dagua
+
+
+@pytest.mark.django_db
+def test_upsert_de_api_em_lote():
+    Venda.upsert_de_api([_dados_venda(1, 101), _dados_venda(2, 102)])
+
+    resultado = Venda.upsert_de_api([
+        _dados_venda(2, 102, valor=500),
+        _dados_venda(3, 103),
+        _dados_venda(4, 104),
+        _dados_venda(1, 999),
+        {"cabecalho": {}},
+    ], tamanho_lote=2)
+
+    assert resultado == {"inseridas": 2, "atualizadas": 1, "rejeitadas": 2}
+    assert dict(Venda.objects.values_list('numero_pedido', 'codigo_pedido')) == {
+        1: 101, 2: 102, 3: 103, 4: 104}
+    assert Venda.objects.get(codigo_pedido=102).valor_total_pedido == 500
+
+
+@pytest.mark.django_db
+def test_upsert_de_api_ignora_vendas_inalteradas():
+    Venda.upsert_de_api([_dados_venda(1, 101, valor=10.1), _dados_venda(2, 102)])
+    versao = SincronizacaoOmie.objects.get(chave=SincronizacaoOmie.VENDAS).versao
+
+    resultado = Venda.upsert_de_api([_dados_venda(1, 101, valor=10.1), _dados_venda(2, 102)])
+
+    assert resultado == {"inseridas": 0, "atualizadas": 0, "rejeitadas": 0}
+    assert SincronizacaoOmie.objects.get(chave=SincronizacaoOmie.VENDAS).versao == versao
+
+    resultado = Venda.upsert_de_api([_dados_venda(1, 101, valor=10.1), _dados_venda(2, 102, valor=20)])
+
+    assert resultado == {"inseridas": 0, "atualizadas": 1, "rejeitadas": 0}
+    assert SincronizacaoOmie.objects.get(chave=SincronizacaoOmie.VENDAS).versao == versao + 1
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("adicionais", [0, 3])
+def test_set_adiantamentos_em_lote(omie_vendas, django_assert_num_queries, adicionais):
+    Venda.upsert_de_api([_dados_venda(1, 101), _dados_venda(2, 102)] + [
+        _dados_venda(numero, 100 + numero) for numero in range(3, 3 + adicionais)])
+
+    def resposta_alteracao(request, context):
+        codigo_pedido = request.json()["param"][0]["cabecalho"]["codigo_pedido"]
+        if codigo_pedido == 102:
+            return {"descricao_status": "Pedido não alterado"}
+        return {"descricao_status": "Pedido alterado com sucesso!"}
+
+    with requests_mock.Mocker() as m:
+        m.post(omie_vendas.url, json=resposta_alteracao)
+        # Consulta e bulk_update das vendas e das parcelas, exclusão com as parcelas e produtos em
+        # cascata, atualização do resumo, do índice de busca e da versão dos dados (com os
+        # savepoints das transações): a mesma quantidade para qualquer número de pedidos
+        with django_assert_num_queries(34):
+            resultado = omie_vendas.set_adiantamentos(
+                {"numerosVendas": ["PC1", "PC9", "PC2"] + [
+                    f"PC{numero}" for numero in range(3, 3 + adicionais)],
+                 "dataVencimento": "10/01/2024"})
+
+    assert resultado["erros"] == [
+        {"numero_pedido_cliente": "PC9", "erro": "Pedido não encontrado"},
+        {"numero_pedido_cliente": "PC2", "erro": "Falha ao alterar pedido"}]
+    assert list(Venda.objects.values_list(
+        'numero_pedido_cliente', flat=True)) == ["PC2"]
+    parcela = Venda.objects.get(numero_pedido_cliente="PC2").parcelas[0]
+    assert parcela["parcela_adiantamento"] == "S"
+    assert parcela["data_vencimento"] == "10/01/2024"
+    parcela = ParcelaVenda.objects.get(venda__numero_pedido_cliente="PC2")
+    assert parcela.adiantada
+    assert parcela.data_vencimento == date(2024, 1, 10)
+
+
+@pytest.mark.django_db
+def test_upsert_grava_parcelas_e_produtos_normalizados():
+    dados = _dados_venda(1, 101)
+    dados["lista_parcelas"]["parcela"].append(
+        {"data_vencimento": "11/09/2023", "numero_parcela": 2, "valor": 50})
+    Venda.upsert_de_api([dados, _dados_venda(2, 102)])
+    # Uma nova gravação substitui os itens, sem duplicar
+    Venda.upsert_de_api([dados])
+
+    assert list(ParcelaVenda.objects.filter(data_vencimento__gte=date(2023, 9, 1)).values_list(
+        'venda__numero_pedido', 'numero_parcela', 'valor')) == [(1, 2, Decimal('50'))]
+    assert ParcelaVenda.objects.filter(venda__numero_pedido=1).count() == 2
+    assert list(ProdutoVenda.objects.filter(codigo="1000").values_list(
+        'venda__numero_pedido', flat=True).order_by('venda__numero_pedido')) == [1, 2]
+
+
+@pytest.mark.django_db
+def test_upsert_grava_quantidade_e_total_dos_produtos():
+    dados = _dados_venda(1, 101, valor=90)
+    dados["det"] = [
+        {"produto": {"codigo": "1000", "descricao": "Mouse", "valor_unitario": 25,
+                     "quantidade": 3, "valor_total": 75}},
+        {"produto": {"codigo": "2000", "descricao": "Cabo", "valor_unitario": 7.5, "quantidade": 2}},
+    ]
+    Venda.upsert_de_api([dados])
+
+    assert list(ProdutoVenda.objects.order_by('codigo').values_list(
+        'codigo', 'valor', 'quantidade', 'valor_total')) == [
+        ("1000", Decimal('25'), Decimal('3'), Decimal('75')),
+        ("2000", Decimal('7.5'), Decimal('2'), Decimal('15'))]
+
+
+@pytest.mark.django_db
+def test_set_adiantamentos_numero_duplicado(omie_vendas):
+    Venda.upsert_de_api([_dados_venda(1, 101), _dados_venda(2, 102)])
+    Venda.objects.filter(numero_pedido=2).update(numero_pedido_cliente="PC1")
+
+    with requests_mock.Mocker() as m:
+        resultado = omie_vendas.set_adiantamentos(
+            {"numerosVendas": ["PC1"], "dataVencimento": "10/01/2024"})
+
+        assert not m.called
+    assert resultado["erros"] == [
+        {"numero_pedido_cliente": "PC1", "erro": "Número do pedido duplicado em 2 vendas"}]
+    assert Venda.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_set_adiantamentos_grava_parcelas_em_uma_transacao(omie_vendas):
+    Venda.upsert_de_api([_dados_venda(1, 101)])
+    parcelas = Venda.objects.get().parcelas
+
+    with requests_mock.Mocker() as m, \
+            mock.patch.object(ParcelaVenda, 'atualizar_de_vendas', side_effect=DatabaseError('locked')):
+        with pytest.raises(DatabaseError):
+            omie_vendas.set_adiantamentos(
+                {"numerosVendas": ["PC1"], "dataVencimento": "10/01/2024"})
+
+        assert not m.called
+    # A falha ao gravar a ParcelaVenda desfaz também o JSON da Venda
+    assert Venda.objects.get().parcelas == parcelas
+
+
+class _TransportBarreira:
+    """Só responde quando 'partes' requisições estão em andamento ao mesmo tempo."""
+
+    def __init__(self, partes):
+        self.barreira = threading.Barrier(partes, timeout=5)
+
+    def post(self, url, payload, consulta=False):
+        self.barreira.wait()
+        return requests_mock.create_response(
+            requests.Request('POST', url).prepare(),
+            json={"descricao_status": "Pedido alterado com sucesso!"})
+
+
+@pytest.mark.django_db
+def test_set_adiantamentos_altera_pedidos_em_paralelo():
+    omie_vendas = OmieVendas(app_key="test_key", app_secret="test_secret",
+                             max_alteracoes=2, transport=_TransportBarreira(2))
+    Venda.upsert_de_api([_dados_venda(1, 101), _dados_venda(2, 102)])
+
+    resultado = omie_vendas.set_adiantamentos(
+        {"numerosVendas": ["PC1", "PC2"], "dataVencimento": "10/01/2024"})
+
+    assert resultado["status_code"] == 200
+    assert not Venda.objects.exists()
+
+
+def test_consultar_pedido_usa_cache_ate_alteracao(omie_vendas):
+    with requests_mock.Mocker() as m:
+        m.post(omie_vendas.url, json={"pedido_venda_produto": {
+               "cabecalho": {"numero_pedido": 81, "codigo_pedido": 6706980855}},
+               "descricao_status": "Pedido alterado com sucesso!"})
+        omie_vendas.consultar_pedido(81)
+        omie_vendas.consultar_pedido("81")
+        assert m.call_count == 1
+
+        omie_vendas.alterar_pedido({"cabecalho": {"codigo_pedido": 6706980855}})
+        omie_vendas.consultar_pedido(81)
+        assert m.call_count == 3
+    assert omie_vendas.cache.estatisticas()["acertos"] == 1
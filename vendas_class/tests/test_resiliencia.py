@@ -0,0 +1,135 @@
+import asyncio
+
+import httpx
+import pytest
+import requests
+import requests_mock
+from vendas_class import resiliencia
+from vendas_class import transport as transport_module
+from vendas_class.resiliencia import CircuitBreaker, CircuitoAbertoError, LimitadorTaxa, resposta_temporaria
+from vendas_class.services import OmieVendas
+from vendas_class.transport import AsyncOmieTransport, OmieTransport
+
+
+def test_limitador_taxa_respeita_rajada_e_taxa():
+    limitador = LimitadorTaxa(taxa_maxima=2, capacidade=2)
+
+    assert limitador.reservar() == 0
+    assert limitador.reservar() == 0
+    assert 0.4 < limitador.reservar() <= 0.5
+
+
+def test_limitador_taxa_recua_e_recupera():
+    limitador = LimitadorTaxa(taxa_maxima=4)
+
+    limitador.reduzir()
+    limitador.reduzir()
+    assert limitador.taxa == 1
+
+    for _ in range(100):
+        limitador.aumentar()
+    assert limitador.taxa == 4
+
+
+def test_resposta_temporaria():
+    with requests_mock.Mocker() as m:
+        url = "https://app.omie.com.br/api/v1/produtos/pedido/"
+        m.post(url, [
+            {"status_code": 429},
+            {"status_code": 500, "json": {
+                "faultstring": "ERROR: Consumo redundante detectado. Aguarde 3 segundos."}},
+            {"status_code": 500, "json": {
+                "faultstring": "ERROR: Pedido não cadastrado"}},
+        ])
+        respostas = [OmieTransport().session.post(url) for _ in range(3)]
+
+    assert [resposta_temporaria(r) for r in respostas] == [True, True, False]
+
+
+def test_transport_repete_chamada_limitada(monkeypatch):
+    monkeypatch.setattr(transport_module, 'espera_backoff',
+                        lambda tentativa: 0)
+    limitador = LimitadorTaxa(taxa_maxima=1000)
+    transport = OmieTransport(limitador=limitador)
+
+    with requests_mock.Mocker() as m:
+        m.post("https://app.omie.com.br/api/v1/produtos/pedido/", [
+            {"status_code": 429},
+            {"status_code": 503},
+            {"json": {"descricao_status": "Pedido alterado com sucesso!"}},
+        ])
+        resposta = OmieVendas("key", "secret", transport=transport).alterar_pedido({})
+
+        assert m.call_count == 3
+    assert resposta["descricao_status"] == "Pedido alterado com sucesso!"
+    assert limitador.taxa < 1000
+
+
+def test_circuit_breaker_abre_e_testa_semiaberto(monkeypatch):
+    agora = [100.0]
+    monkeypatch.setattr(resiliencia.time, 'monotonic', lambda: agora[0])
+    circuito = CircuitBreaker(limite_falhas=2, tempo_espera=30)
+
+    circuito.registrar_falha()
+    circuito.antes_da_chamada()
+    circuito.registrar_falha()
+    assert circuito.estado == CircuitBreaker.ABERTO
+    with pytest.raises(CircuitoAbertoError):
+        circuito.antes_da_chamada()
+
+    agora[0] += 31
+    circuito.antes_da_chamada()
+    with pytest.raises(CircuitoAbertoError):
+        circuito.antes_da_chamada()
+    circuito.registrar_falha()
+    assert circuito.estado == CircuitBreaker.ABERTO
+
+    agora[0] += 31
+    circuito.antes_da_chamada()
+    circuito.registrar_sucesso()
+    assert circuito.status() == {"estado": "fechado",
+                                 "falhas": 0, "reabre_em": None}
+
+
+def test_transport_falha_rapido_com_circuito_aberto():
+    circuito = CircuitBreaker(limite_falhas=1)
+    transport = OmieTransport(circuito=circuito)
+
+    with requests_mock.Mocker() as m:
+        m.post("https://app.omie.com.br/api/v1/produtos/pedido/",
+               exc=requests.exceptions.ConnectTimeout)
+        with pytest.raises(requests.exceptions.ConnectTimeout):
+            OmieVendas("key", "secret", transport=transport).consultar_pedido(1)
+        with pytest.raises(CircuitoAbertoError):
+            OmieVendas("key", "secret", transport=transport).consultar_pedido(1)
+
+        assert m.call_count == 1
+
+
+def test_circuit_breaker_libera_chamada_de_teste_cancelada(monkeypatch):
+    agora = [100.0]
+    monkeypatch.setattr(resiliencia.time, 'monotonic', lambda: agora[0])
+    circuito = CircuitBreaker(limite_falhas=1, tempo_espera=30)
+    circuito.registrar_falha()
+    agora[0] += 31
+
+    async def responde_depois(request):
+        await asyncio.sleep(10)
+        return httpx.Response(200, json={})
+
+    transport = AsyncOmieTransport(
+        circuito=circuito, http_transport=httpx.MockTransport(responde_depois))
+
+    async def cancela_o_teste():
+        chamada = asyncio.create_task(transport.post('https://app.omie.com.br/api/v1/', '{}'))
+        await asyncio.sleep(0)
+        chamada.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await chamada
+        await transport.aclose()
+
+    asyncio.run(cancela_o_teste())
+
+    # O cancelamento não conta como falha e a próxima chamada de teste é liberada
+    assert circuito.status() == {"estado": "semiaberto", "falhas": 1, "reabre_em": None}
+    assert circuito.antes_da_chamada()
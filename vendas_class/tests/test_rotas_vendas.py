@@ -1,7 +1,22 @@
+import gzip
+import json
+from datetime import datetime, timedelta
+from unittest import mock
+
 import pytest
 import requests_mock
+from asgiref.sync import sync_to_async
+from django.http import QueryDict
 from django.test import TestCase
 from django.urls import reverse
+from django.utils import timezone
+from vendas_class.listagem import ConsultaVendas
+from vendas_class.models import (EventoWebhook, ParcelaVenda, ResumoVendas, SincronizacaoOmie,
+                                 SnapshotVendas, Venda)
+from vendas_class.services import OmieVendas
+from vendas_class.snapshot import gerar_snapshot
+from vendas_class.tests.test_omie_vendas import _dados_venda
+from vendas_class.resiliencia import circuito_omie
 
 
 @pytest.mark.django_db
@@ -83,3 +98,384 @@ class OmieVendasRouteTests(TestCase):
         response = self.client.post(reverse('set_adiantamentos'), json={"infos_pedido": "+ tag de adiantamento",
                                                                         "numero_pedido": "81"}, content_type='application/json')
         self.assertEqual(response.status_code, 500)
+
+    def test_rotas_omie_respondem_503_com_circuito_aberto(self):
+        for _ in range(circuito_omie.limite_falhas):
+            circuito_omie.registrar_falha()
+
+        response = self.client.get(reverse('get_vendas'))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['circuito']['estado'], 'aberto')
+
+        response = self.client.post(reverse('set_adiantamentos'), data={"numerosVendas": [], "dataVencimento": "10/01/2024"},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+
+        response = self.client.get(reverse('status_omie'))
+        self.assertEqual(response.json()['disponivel'], False)
+
+    @mock.patch('vendas_class.views.atualizar_em_segundo_plano', return_value=True)
+    def test_get_vendas_serve_dados_antigos_e_atualiza_em_segundo_plano(self, atualizar):
+        Venda.upsert_de_api([_dados_venda(1, 101)])
+        SincronizacaoOmie.objects.filter(
+            chave=SincronizacaoOmie.VENDAS).update(ultima_sincronizacao=timezone.now() - timedelta(hours=1))
+
+        with requests_mock.Mocker() as m:
+            response = self.client.get(reverse('get_vendas'))
+            self.assertEqual(m.call_count, 0)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+        self.assertGreaterEqual(int(response['X-Vendas-Idade']), 3600)
+        self.assertEqual(response['X-Vendas-Atualizando'], 'true')
+        atualizar.assert_called_once()
+
+    @mock.patch('vendas_class.views.atualizar_em_segundo_plano')
+    def test_get_vendas_dados_recentes_nao_atualiza(self, atualizar):
+        Venda.upsert_de_api([_dados_venda(1, 101)])
+        SincronizacaoOmie.objects.filter(
+            chave=SincronizacaoOmie.VENDAS).update(ultima_sincronizacao=timezone.now())
+
+        response = self.client.get(reverse('get_vendas'))
+
+        self.assertEqual(response['X-Vendas-Atualizando'], 'false')
+        atualizar.assert_not_called()
+
+    @mock.patch('vendas_class.views.atualizar_em_segundo_plano')
+    async def test_get_vendas_async(self, atualizar):
+        await sync_to_async(Venda.upsert_de_api)([_dados_venda(1, 101)])
+        await SincronizacaoOmie.objects.filter(
+            chave=SincronizacaoOmie.VENDAS).aupdate(ultima_sincronizacao=timezone.now())
+
+        response = await self.async_client.get(reverse('get_vendas_async'))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['numero_pedido_cliente'], 'PC1')
+        self.assertEqual(response['X-Vendas-Atualizando'], 'false')
+        atualizar.assert_not_called()
+
+    @mock.patch('vendas_class.async_views.AsyncOmieVendas.alterar_pedido',
+                new_callable=mock.AsyncMock, return_value={"descricao_status": "Pedido alterado com sucesso!"})
+    async def test_alterar_pedido_async(self, alterar_pedido):
+        response = await self.async_client.post(
+            reverse('alterar_pedido_async'), {"cabecalho": {"codigo_pedido": 101}}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        alterar_pedido.assert_awaited_once_with(
+            {"cabecalho": {"codigo_pedido": 101}})
+
+    async def test_rotas_async_respondem_503_com_circuito_aberto(self):
+        for _ in range(circuito_omie.limite_falhas):
+            circuito_omie.registrar_falha()
+
+        response = await self.async_client.post(reverse('set_adiantamentos_async'),
+                                                {"numerosVendas": [], "dataVencimento": "10/01/2024"},
+                                                content_type='application/json')
+        self.assertEqual(response.status_code, 503)
+
+    @mock.patch('vendas_class.async_views.connections')
+    @mock.patch('vendas_class.async_views.sincronizacao_inicial', return_value=False)
+    async def test_get_vendas_async_fecha_conexoes_da_sincronizacao_inicial(self, inicial, conexoes):
+        response = await self.async_client.get(reverse('get_vendas_async'))
+
+        self.assertEqual(response.status_code, 503)
+        inicial.assert_called_once_with()
+        conexoes.close_all.assert_called_once_with()
+
+    async def test_webhook_async_enfileira_evento(self):
+        response = await self.async_client.post(
+            reverse('webhook_omie_async'), {"numero_pedido": 7, "messageId": "m1"}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(await EventoWebhook.objects.filter(numero_pedido="7", message_id="m1").aexists())
+
+    @mock.patch('vendas_class.views.atualizar_em_segundo_plano')
+    def test_get_vendas_paginado_com_projecao(self, atualizar):
+        Venda.upsert_de_api([_dados_venda(numero, 100 + numero)
+                            for numero in (3, 1, 2)])
+
+        response = self.client.get(
+            reverse('get_vendas'), {'limit': 2, 'fields': 'numero_pedido,data_emissao'})
+        self.assertEqual(response.json(), [
+            {'numero_pedido': 1, 'data_emissao': '11/07/2023'},
+            {'numero_pedido': 2, 'data_emissao': '11/07/2023'}])
+
+        response = self.client.get(reverse('get_vendas'), {
+            'limit': 2, 'fields': 'numero_pedido', 'cursor': response['X-Vendas-Proximo-Cursor']})
+        self.assertEqual(response.json(), [{'numero_pedido': 3}])
+        self.assertNotIn('X-Vendas-Proximo-Cursor', response)
+
+    def test_get_vendas_parametros_invalidos(self):
+        for params in ({'fields': 'produtos,senha'}, {'limit': 0}, {'cursor': 'invalido'}):
+            response = self.client.get(reverse('get_vendas'), params)
+            self.assertEqual(response.status_code, 400)
+
+    @mock.patch('vendas_class.views.atualizar_em_segundo_plano')
+    def test_get_vendas_stream(self, atualizar):
+        Venda.upsert_de_api([_dados_venda(numero, 100 + numero)
+                            for numero in (1, 2, 3)])
+
+        response = self.client.get(
+            reverse('get_vendas'), {'stream': 'true', 'fields': 'numero_pedido,valor_total_pedido'})
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(json.loads(b''.join(response.streaming_content)), [
+            {'numero_pedido': numero, 'valor_total_pedido': '150.00'} for numero in (1, 2, 3)])
+
+        pedacos = list(ConsultaVendas(QueryDict('stream=true')).json_em_fluxo(tamanho_lote=2))
+        self.assertEqual(len(pedacos), 4)
+        self.assertEqual(len(json.loads(''.join(pedacos))), 3)
+
+        response = self.client.get(
+            reverse('get_vendas'), {'stream': 'true', 'limit': 10})
+        self.assertEqual(response.status_code, 400)
+
+    @mock.patch('vendas_class.views.atualizar_em_segundo_plano')
+    async def test_get_vendas_async_stream(self, atualizar):
+        await sync_to_async(Venda.upsert_de_api)([_dados_venda(1, 101)])
+
+        response = await self.async_client.get(reverse('get_vendas_async'), {'stream': '1'})
+
+        self.assertTrue(response.streaming)
+        conteudo = b''.join([pedaco async for pedaco in response.streaming_content])
+        self.assertEqual(json.loads(conteudo)[0]['numero_pedido_cliente'], 'PC1')
+
+    @mock.patch('vendas_class.views.atualizar_em_segundo_plano')
+    async def test_get_vendas_async_le_o_banco_enquanto_gera_o_snapshot(self, atualizar):
+        await sync_to_async(Venda.upsert_de_api)([_dados_venda(1, 101)])
+        await self.async_client.get(reverse('get_vendas_async'))
+
+        with mock.patch('vendas_class.snapshot.gerar_em_segundo_plano'):
+            await sync_to_async(Venda.upsert_de_api)([_dados_venda(2, 102)])
+            response = await self.async_client.get(reverse('get_vendas_async'))
+
+        conteudo = b''.join([pedaco async for pedaco in response.streaming_content])
+        self.assertEqual(len(json.loads(conteudo)), 2)
+        self.assertIn('ETag', response)
+
+    @mock.patch('vendas_class.views.atualizar_em_segundo_plano')
+    def test_get_vendas_filtros_e_ordenacao(self, atualizar):
+        Venda.upsert_de_api([_dados_venda(numero, 100 + numero, valor=numero * 100)
+                            for numero in (1, 2, 3, 4)])
+        Venda.objects.filter(numero_pedido=1).update(data_vencimento=None)
+        Venda.objects.filter(numero_pedido=2).update(
+            data_vencimento='2024-01-10', adiantado=True)
+        Venda.objects.filter(numero_pedido=3).update(data_vencimento='2024-02-10')
+        Venda.objects.filter(numero_pedido=4).update(
+            data_vencimento='2024-02-10', numero_pedido_cliente='XY4')
+
+        def numeros(params):
+            response = self.client.get(reverse('get_vendas'), params)
+            return [venda['numero_pedido'] for venda in response.json()], response
+
+        self.assertEqual(numeros({'data_vencimento_de': '01/02/2024'})[0], [3, 4])
+        self.assertEqual(numeros({'data_vencimento_ate': '2024-01-31', 'adiantado': 'true'})[0], [2])
+        self.assertEqual(numeros({'valor_total_pedido_de': '150', 'valor_total_pedido_ate': '300'})[0], [2, 3])
+        self.assertEqual(numeros({'numero_pedido_cliente': 'PC'})[0], [1, 2, 3])
+
+        # Paginação na ordem decrescente de vencimento, com empates e nulos por último
+        pagina, response = numeros({'sort': '-data_vencimento', 'limit': 2})
+        self.assertEqual(pagina, [4, 3])
+        pagina, response = numeros({'sort': '-data_vencimento', 'limit': 1,
+                                    'cursor': response['X-Vendas-Proximo-Cursor']})
+        self.assertEqual(pagina, [2])
+        pagina, response = numeros({'sort': '-data_vencimento', 'limit': 1,
+                                    'cursor': response['X-Vendas-Proximo-Cursor']})
+        self.assertEqual(pagina, [1])
+        self.assertNotIn('X-Vendas-Proximo-Cursor', response)
+
+        cursor = numeros({'limit': 1})[1]['X-Vendas-Proximo-Cursor']
+        for params in ({'sort': 'produtos'}, {'adiantado': 'talvez'}, {'data_emissao_de': '2024/01/01'},
+                       {'sort': 'data_emissao', 'cursor': cursor}):
+            response = self.client.get(reverse('get_vendas'), params)
+            self.assertEqual(response.status_code, 400)
+
+    @mock.patch('vendas_class.views.atualizar_em_segundo_plano')
+    def test_sincronizacao_sem_alteracoes_preserva_etag(self, atualizar):
+        omie_vendas = OmieVendas(app_key="test_key", app_secret="test_secret")
+        with requests_mock.Mocker() as m:
+            m.post(omie_vendas.url, json={"pedido_venda_produto": [
+                _dados_venda(1, 101), _dados_venda(2, 102)], "total_de_paginas": 1})
+            omie_vendas.sincronizar_vendas()
+            etag = self.client.get(reverse('get_vendas'))['ETag']
+            etag_resumo = self.client.get(reverse('resumo_vendas'))['ETag']
+
+            resultado = omie_vendas.sincronizar_vendas()
+
+        self.assertEqual((resultado["inseridas"], resultado["atualizadas"]), (0, 0))
+        response = self.client.get(reverse('get_vendas'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(reverse('resumo_vendas'), HTTP_IF_NONE_MATCH=etag_resumo)
+        self.assertEqual(response.status_code, 304)
+
+    @mock.patch('vendas_class.views.atualizar_em_segundo_plano')
+    def test_get_vendas_get_condicional(self, atualizar):
+        Venda.upsert_de_api([_dados_venda(1, 101)])
+        SincronizacaoOmie.objects.filter(
+            chave=SincronizacaoOmie.VENDAS).update(ultima_sincronizacao=timezone.now())
+
+        response = self.client.get(reverse('get_vendas'))
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        # Apenas as consultas de existência e da versão: nem a listagem nem a serialização rodam
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                reverse('get_vendas'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+        response = self.client.get(
+            reverse('get_vendas'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+        Venda.upsert_de_api([_dados_venda(1, 101, valor=200)])
+        response = self.client.get(
+            reverse('get_vendas'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    @mock.patch('vendas_class.views.atualizar_em_segundo_plano')
+    def test_get_vendas_serve_snapshot(self, atualizar):
+        Venda.upsert_de_api([_dados_venda(1, 101)])
+
+        response = self.client.get(reverse('get_vendas'))
+        self.assertEqual(response.json()[0]['numero_pedido_cliente'], 'PC1')
+        self.assertEqual(SnapshotVendas.objects.get().conteudo, response.content)
+
+        # Com o snapshot em memória, apenas as consultas de existência e da versão
+        with self.assertNumQueries(2):
+            response_gzip = self.client.get(
+                reverse('get_vendas'), HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response_gzip['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response_gzip['Vary'])
+        self.assertEqual(gzip.decompress(response_gzip.content), response.content)
+        self.assertEqual(response_gzip['ETag'], 'W/' + response['ETag'])
+
+        Venda.upsert_de_api([_dados_venda(2, 102)])
+        response = self.client.get(reverse('get_vendas'))
+        self.assertEqual(len(response.json()), 2)
+
+    @mock.patch('vendas_class.views.atualizar_em_segundo_plano')
+    def test_get_vendas_le_o_banco_enquanto_gera_o_snapshot(self, atualizar):
+        Venda.upsert_de_api([_dados_venda(1, 101), _dados_venda(2, 102)])
+        etag = self.client.get(reverse('get_vendas'))['ETag']
+
+        # A geração em segundo plano fica pendente durante todo o teste
+        with mock.patch('vendas_class.snapshot.gerar_em_segundo_plano') as gerar:
+            with self.captureOnCommitCallbacks(execute=True):
+                Venda.excluir(Venda.objects.filter(numero_pedido=1))
+            # A gravação agenda a geração após o commit
+            gerar.assert_called_once_with()
+
+            response = self.client.get(reverse('get_vendas'), HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                [venda['numero_pedido'] for venda in json.loads(b''.join(response.streaming_content))],
+                [2])
+            self.assertNotEqual(response['ETag'], etag)
+            self.assertEqual(
+                self.client.get(reverse('get_vendas'), HTTP_IF_NONE_MATCH=response['ETag']).status_code,
+                304)
+            self.assertEqual(SnapshotVendas.objects.get().versao, 1)
+
+        gerar_snapshot()
+        response = self.client.get(reverse('get_vendas'))
+        self.assertEqual([venda['numero_pedido'] for venda in response.json()], [2])
+
+    def test_resumo_vendas_incremental(self):
+        dados = _dados_venda(1, 101, valor=100)
+        dados["lista_parcelas"]["parcela"].append(
+            {"data_vencimento": "11/09/2023", "numero_parcela": 2, "valor": 50})
+        Venda.upsert_de_api([dados, _dados_venda(2, 102, valor=200)])
+
+        resumo = self.client.get(reverse('resumo_vendas')).json()
+        self.assertEqual(resumo['por_mes'], [
+            {'mes': '2023-08', 'quantidade': 2, 'valor': '300.00'},
+            {'mes': '2023-09', 'quantidade': 1, 'valor': '50.00'}])
+        self.assertEqual(resumo['por_adiantamento'], [
+            {'adiantada': False, 'quantidade': 3, 'valor': '350.00'}])
+        self.assertEqual(resumo['por_produto'], [
+            {'codigo': '1000', 'descricao': 'Mouse sem fio Microsoft', 'quantidade': 2, 'itens': 2,
+             'valor': '300.00'}])
+
+        venda = Venda.objects.get(numero_pedido=2)
+        OmieVendas._adiantar_parcelas(venda.parcelas, datetime(2024, 1, 10))
+        ParcelaVenda.atualizar_de_vendas([venda])
+        Venda.excluir(Venda.objects.filter(numero_pedido_cliente='PC1'))
+
+        resumo = self.client.get(reverse('resumo_vendas')).json()
+        self.assertEqual(resumo['por_mes'], [
+            {'mes': '2024-01', 'quantidade': 1, 'valor': '200.00'}])
+        self.assertEqual(resumo['por_adiantamento'], [
+            {'adiantada': True, 'quantidade': 1, 'valor': '200.00'}])
+        self.assertEqual(resumo['por_produto'][0]['quantidade'], 1)
+
+        # O resumo incremental confere com o recalculado do zero
+        ResumoVendas.recalcular()
+        self.assertEqual(self.client.get(reverse('resumo_vendas')).json(), resumo)
+
+    def test_resumo_vendas_soma_o_total_dos_itens(self):
+        dados = _dados_venda(1, 101, valor=90)
+        dados["det"] = [
+            {"produto": {"codigo": "1000", "descricao": "Mouse sem fio Microsoft", "valor_unitario": 25,
+                         "quantidade": 3, "valor_total": 75}},
+            {"produto": {"codigo": "2000", "descricao": "Cabo", "valor_unitario": 7.5, "quantidade": 2}},
+        ]
+        outra = _dados_venda(2, 102, valor=25)
+        outra["det"][0]["produto"].update({"valor_unitario": 12.5, "quantidade": 2, "valor_total": 25})
+        Venda.upsert_de_api([dados, outra])
+
+        resumo = self.client.get(reverse('resumo_vendas')).json()
+        self.assertEqual(resumo['por_produto'], [
+            {'codigo': '1000', 'descricao': 'Mouse sem fio Microsoft', 'quantidade': 5, 'itens': 2,
+             'valor': '100.00'},
+            {'codigo': '2000', 'descricao': 'Cabo', 'quantidade': 2, 'itens': 1, 'valor': '15.00'}])
+
+        Venda.excluir(Venda.objects.filter(numero_pedido=2))
+        resumo = self.client.get(reverse('resumo_vendas')).json()
+        self.assertEqual(resumo['por_produto'][0], {
+            'codigo': '1000', 'descricao': 'Mouse sem fio Microsoft', 'quantidade': 3, 'itens': 1,
+            'valor': '75.00'})
+
+        ResumoVendas.recalcular()
+        self.assertEqual(self.client.get(reverse('resumo_vendas')).json(), resumo)
+
+    def test_buscar_vendas(self):
+        dados = _dados_venda(1, 101)
+        dados["det"].append({"produto": {"codigo": "TEC-20", "descricao": "Teclado ABNT Ação", "valor_unitario": 80}})
+        Venda.upsert_de_api([dados, _dados_venda(12, 112), _dados_venda(2, 102)])
+
+        def buscar(**params):
+            response = self.client.get(reverse('buscar_vendas'), params)
+            self.assertEqual(response.status_code, 200)
+            return [venda['numero_pedido'] for venda in response.json()]
+
+        # Cada termo casa com o início das palavras: PC1 também encontra PC12
+        self.assertEqual(sorted(buscar(q='PC1')), [1, 12])
+        self.assertEqual(sorted(buscar(q='mouse')), [1, 2, 12])
+        self.assertEqual(buscar(q='acao tecl'), [1])
+        self.assertEqual(buscar(q='TEC'), [1])
+        self.assertEqual(buscar(q='inexistente'), [])
+        self.assertEqual(len(buscar(q='mouse', limit='2')), 2)
+
+        response = self.client.get(reverse('buscar_vendas'), {'q': 'pc12', 'fields': 'numero_pedido'})
+        self.assertEqual(response.json(), [{'numero_pedido': 12}])
+
+        Venda.excluir(Venda.objects.filter(numero_pedido=1))
+        self.assertEqual(buscar(q='teclado'), [])
+
+    def test_buscar_vendas_sem_texto(self):
+        self.assertEqual(self.client.get(reverse('buscar_vendas')).status_code, 400)
+        self.assertEqual(self.client.get(reverse('buscar_vendas'), {'q': '"*'}).status_code, 400)
+
+    def test_buscar_vendas_sem_indice(self):
+        dados = _dados_venda(1, 101)
+        dados["det"].append({"produto": {"codigo": "TEC-20", "descricao": "Teclado ABNT", "valor_unitario": 80}})
+        Venda.upsert_de_api([dados, _dados_venda(2, 102)])
+
+        with mock.patch('vendas_class.busca.disponivel', return_value=False):
+            response = self.client.get(reverse('buscar_vendas'), {'q': 'mouse'})
+            self.assertEqual([venda['numero_pedido'] for venda in response.json()], [1, 2])
+            response = self.client.get(reverse('buscar_vendas'), {'q': 'teclado pc1'})
+            self.assertEqual([venda['numero_pedido'] for venda in response.json()], [1])
@@ -0,0 +1,145 @@
+import json
+import time
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+import requests_mock
+from django.core.management import call_command
+from django.urls import reverse
+from vendas_class import sincronizacao, snapshot
+from vendas_class.models import SincronizacaoOmie, SnapshotVendas, Venda
+from vendas_class.services import OmieVendas
+from vendas_class.tests.test_omie_vendas import _dados_venda
+
+# O conftest troca a geração em segundo plano pela geração na hora
+gerar_em_segundo_plano = snapshot.gerar_em_segundo_plano
+
+
+@pytest.mark.django_db
+def test_trava_de_sincronizacao_exclusiva():
+    chave = SincronizacaoOmie.VENDAS
+    assert SincronizacaoOmie.adquirir_trava(chave, "a", timedelta(minutes=1))
+    assert not SincronizacaoOmie.adquirir_trava(chave, "b", timedelta(minutes=1))
+    assert SincronizacaoOmie.adquirir_trava(chave, "a", timedelta(minutes=1))
+
+    SincronizacaoOmie.liberar_trava(chave, "a")
+    assert SincronizacaoOmie.adquirir_trava(chave, "b", timedelta(minutes=1))
+
+
+@pytest.mark.django_db
+def test_trava_de_sincronizacao_expira():
+    chave = SincronizacaoOmie.VENDAS
+    assert SincronizacaoOmie.adquirir_trava(chave, "a", timedelta(seconds=-1))
+    assert SincronizacaoOmie.adquirir_trava(chave, "b", timedelta(minutes=1))
+
+
+@pytest.mark.django_db
+def test_comando_sync_vendas():
+    saida = StringIO()
+    with requests_mock.Mocker() as m:
+        m.post(OmieVendas.url, json={"pedido_venda_produto": [
+            _dados_venda(1, 101), _dados_venda(2, 102)], "total_de_paginas": 1})
+        call_command('sync_vendas', stdout=saida)
+
+    assert "1 páginas, 2 inseridas" in saida.getvalue()
+    assert Venda.objects.count() == 2
+    assert SincronizacaoOmie.objects.get().travado_ate is None
+    # A sincronização deixa o snapshot da listagem pronto para a próxima leitura
+    snapshot = SnapshotVendas.objects.get()
+    assert snapshot.versao == SincronizacaoOmie.objects.get().versao
+    assert len(json.loads(bytes(snapshot.conteudo))) == 2
+
+
+def _paginas(request, context):
+    pagina = request.json()["param"][0]["pagina"]
+    return {"pedido_venda_produto": [_dados_venda(pagina, 100 + pagina)], "total_de_paginas": 3}
+
+
+@pytest.mark.django_db
+def test_sincronizacao_renova_trava_a_cada_pagina(monkeypatch):
+    renovacoes = []
+    renovar_trava = SincronizacaoOmie.renovar_trava
+
+    def registrar_renovacao(chave, dono, duracao):
+        renovacoes.append(chave)
+        return renovar_trava(chave, dono, duracao)
+
+    monkeypatch.setattr(SincronizacaoOmie, 'renovar_trava', registrar_renovacao)
+    with requests_mock.Mocker() as m:
+        m.post(OmieVendas.url, json=_paginas)
+        resultado = sincronizacao.executar_sincronizacao(incremental=False)
+
+    assert resultado["paginas"] == 3
+    assert renovacoes == [SincronizacaoOmie.VENDAS] * 3
+
+
+@pytest.mark.django_db
+def test_sincronizacao_interrompida_ao_perder_a_trava(monkeypatch):
+    monkeypatch.setattr(SincronizacaoOmie, 'renovar_trava',
+                        lambda chave, dono, duracao: False)
+    with requests_mock.Mocker() as m:
+        m.post(OmieVendas.url, json=_paginas)
+        with pytest.raises(sincronizacao.TravaPerdidaError):
+            sincronizacao.executar_sincronizacao(incremental=False)
+
+    sincronizacao_vendas = SincronizacaoOmie.objects.get(chave=SincronizacaoOmie.VENDAS)
+    assert sincronizacao_vendas.ultima_sincronizacao is None
+    assert sincronizacao_vendas.travado_ate is None
+
+
+@pytest.mark.django_db
+def test_comando_sync_vendas_com_trava_ocupada():
+    SincronizacaoOmie.adquirir_trava(
+        SincronizacaoOmie.VENDAS, "outro", timedelta(minutes=1))
+    saida = StringIO()
+    with requests_mock.Mocker() as m:
+        call_command('sync_vendas', stdout=saida)
+
+        assert m.call_count == 0
+    assert "em andamento" in saida.getvalue()
+
+
+@pytest.mark.django_db
+def test_sincronizacao_inicial_aguarda_outro_processo(monkeypatch):
+    SincronizacaoOmie.adquirir_trava(
+        SincronizacaoOmie.VENDAS, "outro", timedelta(minutes=1))
+
+    def outro_processo_termina(segundos):
+        Venda.upsert_de_api([_dados_venda(1, 101)])
+        SincronizacaoOmie.liberar_trava(SincronizacaoOmie.VENDAS, "outro")
+
+    monkeypatch.setattr(sincronizacao.time, 'sleep', outro_processo_termina)
+    with requests_mock.Mocker() as m:
+        assert sincronizacao.sincronizacao_inicial(espera=5)
+
+        assert m.call_count == 0
+
+
+@pytest.mark.django_db
+def test_sincronizacao_inicial_em_andamento_responde_503(client, monkeypatch):
+    SincronizacaoOmie.adquirir_trava(
+        SincronizacaoOmie.VENDAS, "outro", timedelta(minutes=1))
+    monkeypatch.setattr(sincronizacao, 'SINCRONIZACAO_ESPERA_SEGUNDOS', 0)
+
+    with requests_mock.Mocker() as m:
+        response = client.get(reverse('get_vendas'))
+
+        assert m.call_count == 0
+    assert response.status_code == 503
+    assert "em andamento" in response.json()["message"]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_gravacao_gera_snapshot_em_segundo_plano(monkeypatch):
+    monkeypatch.setattr(snapshot, 'gerar_em_segundo_plano', gerar_em_segundo_plano)
+    monkeypatch.setattr(snapshot, 'SNAPSHOT_ATRASO_SEGUNDOS', 0)
+
+    Venda.upsert_de_api([_dados_venda(1, 101), _dados_venda(2, 102)])
+    versao = SincronizacaoOmie.objects.get(chave=SincronizacaoOmie.VENDAS).versao
+
+    limite = time.monotonic() + 5
+    while not SnapshotVendas.objects.filter(versao=versao).exists():
+        assert time.monotonic() < limite, 'Snapshot não gerado em segundo plano'
+        time.sleep(0.05)
+    assert len(json.loads(bytes(SnapshotVendas.objects.get().conteudo))) == 2
@@ -0,0 +1,78 @@
+import socket
+import struct
+import threading
+
+import pytest
+import requests
+import requests_mock
+from vendas_class.resiliencia import CircuitBreaker, LimitadorTaxa
+from vendas_class.services import OmieVendas
+from vendas_class.transport import OmieTransport, get_transport
+
+
+class _ServidorQueReseta:
+    """Servidor HTTP que lê cada requisição e reseta a conexão sem responder."""
+
+    def __init__(self):
+        self.socket = socket.create_server(('127.0.0.1', 0))
+        self.url = f'http://127.0.0.1:{self.socket.getsockname()[1]}/'
+        self.requisicoes = 0
+        threading.Thread(target=self._atender, daemon=True).start()
+
+    def _atender(self):
+        while True:
+            try:
+                conexao, _ = self.socket.accept()
+            except OSError:
+                return
+            conexao.recv(65536)
+            self.requisicoes += 1
+            conexao.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+            conexao.close()
+
+    def fechar(self):
+        self.socket.close()
+
+
+@pytest.fixture
+def servidor_que_reseta():
+    servidor = _ServidorQueReseta()
+    yield servidor
+    servidor.fechar()
+
+
+def _transport_teste(max_retries):
+    return OmieTransport(max_retries=max_retries, limitador=LimitadorTaxa(taxa_maxima=1000),
+                         circuito=CircuitBreaker(limite_falhas=100))
+
+
+def test_get_transport_compartilhado_entre_clientes():
+    assert get_transport() is get_transport()
+    assert OmieVendas("key", "secret").transport is get_transport()
+
+
+def test_transport_envia_timeouts_e_content_type():
+    transport = OmieTransport(connect_timeout=2, read_timeout=10)
+    with requests_mock.Mocker() as m:
+        m.post("https://app.omie.com.br/api/v1/produtos/pedido/",
+               json={"descricao_status": "Pedido alterado com sucesso"})
+        OmieVendas("key", "secret", transport=transport).alterar_pedido({})
+
+        assert m.last_request.timeout == (2, 10)
+        assert m.last_request.headers['Content-Type'] == 'application/json'
+
+
+def test_transport_nao_repete_alteracao_com_conexao_resetada(servidor_que_reseta):
+    transport = _transport_teste(max_retries=2)
+
+    with pytest.raises(requests.ConnectionError):
+        transport.post(servidor_que_reseta.url, '{"call": "AlterarPedidoVenda"}')
+    assert servidor_que_reseta.requisicoes == 1
+
+
+def test_transport_repete_consulta_com_conexao_resetada(servidor_que_reseta):
+    transport = _transport_teste(max_retries=2)
+
+    with pytest.raises(requests.ConnectionError):
+        transport.post(servidor_que_reseta.url, '{"call": "ConsultarPedido"}', consulta=True)
+    assert servidor_que_reseta.requisicoes == 3
@@ -0,0 +1,279 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+
+import httpx
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import ProtocolError
+from urllib3.util.retry import Retry
+
+from .resiliencia import (OMIE_TENTATIVAS_LIMITACAO, circuito_omie, espera_backoff, limitador_omie,
+                          resposta_temporaria)
+
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+OMIE_POOL_SIZE = int(os.getenv('OMIE_POOL_SIZE', 10))
+OMIE_CONNECT_TIMEOUT = float(os.getenv('OMIE_CONNECT_TIMEOUT', 5))
+OMIE_READ_TIMEOUT = float(os.getenv('OMIE_READ_TIMEOUT', 60))
+OMIE_MAX_RETRIES = int(os.getenv('OMIE_MAX_RETRIES', 3))
+
+
+class _RetryConexao(Retry):
+    """
+    Retry das consultas: repete falhas de conexão, inclusive conexões resetadas pela Omie depois
+    do envio. Timeouts de leitura não são repetidos, para não acumular esperas longas.
+    """
+
+    def _is_read_error(self, err):
+        return isinstance(err, ProtocolError)
+
+
+class OmieTransport:
+    def __init__(self, pool_size=OMIE_POOL_SIZE, connect_timeout=OMIE_CONNECT_TIMEOUT,
+                 read_timeout=OMIE_READ_TIMEOUT, max_retries=OMIE_MAX_RETRIES,
+                 limitador=limitador_omie, tentativas_limitacao=OMIE_TENTATIVAS_LIMITACAO,
+                 circuito=circuito_omie):
+        """
+        Sessão HTTP com keep-alive compartilhada pelas chamadas à API da Omie.
+
+        Cada chamada consome um token do limitador de taxa do processo. Respostas de limitação
+        ou falha temporária da Omie reduzem a taxa e são repetidas com backoff exponencial e jitter.
+        Erros de conexão, timeouts e falhas temporárias que esgotam as tentativas contam como
+        falha no circuit breaker, que passa a recusar as chamadas enquanto estiver aberto.
+
+        :param pool_size: Número máximo de conexões mantidas abertas com a Omie.
+        :type pool_size: int
+        :param connect_timeout: Timeout em segundos para abrir uma conexão.
+        :type connect_timeout: float
+        :param read_timeout: Timeout em segundos para aguardar a resposta.
+        :type read_timeout: float
+        :param max_retries: Quantas vezes repetir uma chamada cuja conexão falhou (ou, nas consultas, foi resetada).
+        :type max_retries: int
+        :param limitador: Token bucket compartilhado pelas chamadas à Omie.
+        :type limitador: LimitadorTaxa
+        :param tentativas_limitacao: Quantas vezes repetir uma chamada recusada por limitação.
+        :type tentativas_limitacao: int
+        :param circuito: Circuit breaker compartilhado pelas chamadas à Omie.
+        :type circuito: CircuitBreaker
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self.limitador = limitador
+        self.tentativas_limitacao = tentativas_limitacao
+        self.circuito = circuito
+        # Chamadas que alteram dados repetem apenas falhas ao abrir a conexão: uma conexão
+        # resetada depois do envio pode ter sido processada pela Omie. As consultas usam uma sessão
+        # própria, que repete também as conexões resetadas.
+        self.session = self._sessao(pool_size, Retry(
+            total=max_retries, connect=max_retries, read=0, status=0, other=0,
+            backoff_factor=0.2, raise_on_status=False))
+        self.session_consultas = self._sessao(pool_size, _RetryConexao(
+            total=max_retries, connect=max_retries, read=max_retries, status=0, other=0,
+            allowed_methods=None, backoff_factor=0.2, raise_on_status=False))
+
+    @staticmethod
+    def _sessao(pool_size, retry):
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+        session = requests.Session()
+        session.headers.update({'Content-Type': 'application/json'})
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def post(self, url, payload, consulta=False):
+        """
+        Envia um payload JSON já serializado para a API da Omie.
+
+        :param url: A URL do endpoint da Omie.
+        :type url: str
+        :param payload: O corpo da requisição em JSON.
+        :type payload: str
+        :param consulta: Se a chamada apenas consulta dados e pode ser repetida depois de enviada.
+        :type consulta: bool
+        :return: A resposta HTTP.
+        :rtype: requests.Response
+        :raises: CircuitoAbertoError se o circuit breaker estiver aberto.
+        """
+        teste = self.circuito.antes_da_chamada()
+        session = self.session_consultas if consulta else self.session
+        try:
+            response = self._post_com_backoff(session, url, payload)
+        except Exception:
+            self.circuito.registrar_falha()
+            raise
+        except BaseException:
+            # Interrompida sem resposta (cancelamento, KeyboardInterrupt): não é uma falha da
+            # Omie, mas a vaga da chamada de teste precisa ser liberada
+            if teste:
+                self.circuito.cancelar_teste()
+            raise
+
+        if resposta_temporaria(response):
+            self.circuito.registrar_falha()
+        else:
+            self.circuito.registrar_sucesso()
+        return response
+
+    def _post_com_backoff(self, session, url, payload):
+        for tentativa in range(self.tentativas_limitacao + 1):
+            self.limitador.adquirir()
+            response = session.post(
+                url, data=payload, timeout=self.timeout)
+            if not resposta_temporaria(response):
+                self.limitador.aumentar()
+                return response
+            if tentativa == self.tentativas_limitacao:
+                return response
+
+            self.limitador.reduzir()
+            espera = espera_backoff(tentativa)
+            logger.warning(
+                f'Omie recusou a chamada temporariamente ({response.status_code}), nova tentativa em {espera:.1f}s')
+            time.sleep(espera)
+
+    def close(self):
+        self.session.close()
+        self.session_consultas.close()
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """
+    Retorna o OmieTransport do processo, criando-o na primeira chamada.
+
+    :rtype: OmieTransport
+    """
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = OmieTransport()
+    return _transport
+
+
+class AsyncOmieTransport:
+    def __init__(self, pool_size=OMIE_POOL_SIZE, connect_timeout=OMIE_CONNECT_TIMEOUT,
+                 read_timeout=OMIE_READ_TIMEOUT, max_retries=OMIE_MAX_RETRIES,
+                 limitador=limitador_omie, tentativas_limitacao=OMIE_TENTATIVAS_LIMITACAO,
+                 circuito=circuito_omie, http_transport=None):
+        """
+        Equivalente assíncrono do OmieTransport, baseado em um httpx.AsyncClient.
+
+        Os parâmetros têm o mesmo significado do OmieTransport; o limitador de taxa e o circuit
+        breaker são compartilhados com o transporte síncrono. O httpx repete apenas falhas ao abrir a conexão,
+        nunca uma requisição já enviada.
+
+        :param http_transport: Transporte httpx alternativo (usado nos testes).
+        :type http_transport: httpx.AsyncBaseTransport
+        """
+        self.limitador = limitador
+        self.tentativas_limitacao = tentativas_limitacao
+        self.circuito = circuito
+        limits = httpx.Limits(max_connections=pool_size,
+                              max_keepalive_connections=pool_size)
+        if http_transport is None:
+            http_transport = httpx.AsyncHTTPTransport(
+                limits=limits, retries=max_retries)
+
+        self.client = httpx.AsyncClient(
+            transport=http_transport,
+            headers={'Content-Type': 'application/json'},
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+        )
+
+    async def post(self, url, payload):
+        """
+        Envia um payload JSON já serializado para a API da Omie.
+
+        :rtype: httpx.Response
+        :raises: CircuitoAbertoError se o circuit breaker estiver aberto.
+        """
+        teste = self.circuito.antes_da_chamada()
+        try:
+            response = await self._post_com_backoff(url, payload)
+        except Exception:
+            self.circuito.registrar_falha()
+            raise
+        except BaseException:
+            # Interrompida sem resposta (cancelamento, KeyboardInterrupt): não é uma falha da
+            # Omie, mas a vaga da chamada de teste precisa ser liberada
+            if teste:
+                self.circuito.cancelar_teste()
+            raise
+
+        if resposta_temporaria(response):
+            self.circuito.registrar_falha()
+        else:
+            self.circuito.registrar_sucesso()
+        return response
+
+    async def _post_com_backoff(self, url, payload):
+        for tentativa in range(self.tentativas_limitacao + 1):
+            espera = self.limitador.reservar()
+            if espera:
+                await asyncio.sleep(espera)
+            response = await self.client.post(url, content=payload)
+            if not resposta_temporaria(response):
+                self.limitador.aumentar()
+                return response
+            if tentativa == self.tentativas_limitacao:
+                return response
+
+            self.limitador.reduzir()
+            espera = espera_backoff(tentativa)
+            logger.warning(
+                f'Omie recusou a chamada temporariamente ({response.status_code}), nova tentativa em {espera:.1f}s')
+            await asyncio.sleep(espera)
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+
+_async_transports = weakref.WeakKeyDictionary()
+
+
+async def _fechar_ao_encerrar_loop(transport):
+    # Fica pendente enquanto o loop existir: o asyncio.run (usado pelo servidor ASGI e pelo
+    # async_to_sync) cancela as tarefas pendentes ao encerrar o loop, e o cliente é fechado
+    try:
+        await asyncio.get_running_loop().create_future()
+    finally:
+        await transport.aclose()
+
+
+def get_async_transport():
+    """
+    Retorna o AsyncOmieTransport do event loop em execução, criando-o na primeira chamada.
+    Um httpx.AsyncClient só pode ser usado no loop em que foi criado, e é fechado quando o loop
+    se encerra.
+
+    O transporte só é reaproveitado em um loop de longa duração (o do servidor ASGI). Sob o
+    async_to_sync (WSGI, comandos, testes), cada chamada tem um loop novo e, com ele, um pool
+    de conexões novo: nesses casos, prefira passar ao AsyncOmieVendas um AsyncOmieTransport
+    próprio, usado com 'async with'.
+
+    :rtype: AsyncOmieTransport
+    """
+    loop = asyncio.get_running_loop()
+    transport = _async_transports.get(loop)
+    if transport is None:
+        transport = _async_transports[loop] = AsyncOmieTransport()
+        # Referência forte à tarefa: o loop guarda apenas referências fracas
+        transport._encerramento = loop.create_task(_fechar_ao_encerrar_loop(transport))
+    return transport
@@ -1,62 +1,209 @@
 from django.db import IntegrityError
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse, HttpResponse, StreamingHttpResponse
 from django.views.decorators.http import require_http_methods
 
+from backend_rocinante.banco import leitura_replica, somente_leitura
+
 from vendas_class.tests.test_omie_vendas import omie_vendas
 from .services import OmieVendas
+from .resiliencia import CircuitoAbertoError, circuito_omie
+from .cache import cache_pedidos
+from .fila import enfileirar_evento
+from .listagem import ConsultaVendas, ParametroInvalidoError, buscar_vendas
+from .snapshot import obter_snapshot
+from .sincronizacao import VENDAS_IDADE_MAXIMA, atualizar_em_segundo_plano, estado_vendas, sincronizacao_inicial
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
 import json
 from django.views.decorators.csrf import csrf_exempt
-from .models import Venda
+from .models import ResumoVendas, Venda
 from dotenv import load_dotenv
 import os
+import re
 import logging
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+ACEITA_GZIP = re.compile(r'\bgzip\b')
+
 APP_KEY = os.getenv('APP_KEY')
 APP_SECRET = os.getenv('APP_SECRET')
 
 
+def _omie_indisponivel():
+    """
+    Resposta imediata para as rotas que dependem da Omie enquanto o circuit breaker está aberto.
+    """
+    status = circuito_omie.status()
+    response = JsonResponse(
+        {"message": "Omie indisponível no momento, tente novamente mais tarde", "circuito": status}, status=503)
+    if status["reabre_em"] is not None:
+        response['Retry-After'] = max(1, int(status["reabre_em"]))
+    return response
+
+
+def _sincronizacao_em_andamento():
+    response = JsonResponse(
+        {"message": "Sincronização com a Omie em andamento, tente novamente em instantes"}, status=503)
+    response['Retry-After'] = 5
+    return response
+
+
+def _idade_vendas(sincronizado_em):
+    """
+    :return: Os segundos desde a última sincronização, ou None se nunca houve.
+    :rtype: int ou None
+    """
+    return None if sincronizado_em is None else int(
+        (timezone.now() - sincronizado_em).total_seconds())
+
+
+def _atualizar_se_antigo(idade):
+    """
+    Dispara a atualização em segundo plano se os dados estiverem antigos e a Omie disponível.
+
+    :return: True se a atualização foi disparada.
+    :rtype: bool
+    """
+    if (idade is None or idade > VENDAS_IDADE_MAXIMA) and circuito_omie.disponivel():
+        return atualizar_em_segundo_plano()
+    return False
+
+
+def _parametro_invalido(e):
+    return JsonResponse({"message": str(e)}, status=400)
+
+
+def _validadores(estado):
+    """
+    ETag e Last-Modified da listagem de vendas, derivados da versão dos dados, que muda apenas
+    quando alguma venda é gravada ou excluída: uma sincronização sem alterações os preserva.
+
+    :param estado: O retorno do estado_vendas.
+    :type estado: dict
+    :return: O ETag e o instante da última modificação (timestamp), ou None se desconhecido.
+    :rtype: tuple[str, int ou None]
+    """
+    momento = estado['alterado_em'] or estado['ultima_sincronizacao']
+    modificado_em = int(momento.timestamp()) if momento is not None else None
+    return f'"{estado["versao"] or 0}-{modificado_em or 0}"', modificado_em
+
+
+def _cabecalhos_vendas(response, estado, idade, atualizando):
+    sincronizado_em = estado['ultima_sincronizacao']
+    if sincronizado_em is not None:
+        response['X-Vendas-Idade'] = idade
+        response['X-Vendas-Sincronizado-Em'] = sincronizado_em.isoformat()
+    response['X-Vendas-Atualizando'] = 'true' if atualizando else 'false'
+    etag, modificado_em = _validadores(estado)
+    response['ETag'] = etag
+    if modificado_em is not None:
+        response['Last-Modified'] = http_date(modificado_em)
+    return response
+
+
+def _nao_modificado(request, estado, idade, atualizando):
+    """
+    Responde If-None-Match / If-Modified-Since com a versão dos dados, antes da consulta das vendas.
+
+    :return: Uma resposta 304 se o cliente já tem a versão atual; senão None.
+    :rtype: HttpResponseNotModified ou None
+    """
+    etag, modificado_em = _validadores(estado)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=modificado_em)
+    if response is None:
+        return None
+    return _cabecalhos_vendas(response, estado, idade, atualizando)
+
+
+def _resposta_vendas(vendas_data, estado, idade, atualizando, proximo_cursor=None):
+    """
+    :param vendas_data: As vendas serializadas, ou um iterador com o JSON das vendas em pedaços,
+                        que é enviado com uma StreamingHttpResponse.
+    """
+    if isinstance(vendas_data, list):
+        response = JsonResponse(vendas_data, safe=False, status=200)
+    else:
+        response = StreamingHttpResponse(
+            vendas_data, content_type='application/json', status=200)
+    if proximo_cursor is not None:
+        response['X-Vendas-Proximo-Cursor'] = proximo_cursor
+    return _cabecalhos_vendas(response, estado, idade, atualizando)
+
+
+def _resposta_snapshot(request, snapshot, estado, idade, atualizando):
+    """
+    Envia os bytes do snapshot da listagem, na variante gzip se o cliente a aceitar.
+    """
+    _, conteudo, conteudo_gzip = snapshot
+    aceita_gzip = ACEITA_GZIP.search(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    response = HttpResponse(conteudo_gzip if aceita_gzip else conteudo,
+                            content_type='application/json', status=200)
+    patch_vary_headers(response, ('Accept-Encoding',))
+    _cabecalhos_vendas(response, estado, idade, atualizando)
+    if aceita_gzip:
+        response['Content-Encoding'] = 'gzip'
+        # Variante comprimida: ETag fraco, como no GZipMiddleware, que continua valendo no If-None-Match
+        response['ETag'] = 'W/' + response['ETag']
+    return response
+
+
+def _resposta_adiantamentos(resultado):
+    if 'erros' in resultado:
+        return JsonResponse({'message': resultado['message'], 'erros': resultado['erros']}, status=resultado['status_code'])
+    return JsonResponse({'message': resultado['message']}, status=resultado['status_code'])
+
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def get_vendas_view(request):
     try:
+        consulta = ConsultaVendas(request.GET)
         # Primeiro, tente buscar vendas no banco de dados
-        vendas = Venda.objects.all()
-        if not vendas.exists():
+        if not Venda.objects.exists():
             # Se não houver vendas, chame a API da Omie
-            omie_vendas = OmieVendas(APP_KEY, APP_SECRET)
-            vendas_nao_faturadas = omie_vendas.get_vendas()
-            print(vendas_nao_faturadas)
-
-            for dados_venda in vendas_nao_faturadas:
-
-                try:
-
-                    venda = Venda.criar_de_api(dados_venda)
-                    venda.save()
-                except Exception as e:
+            if not circuito_omie.disponivel():
+                return _omie_indisponivel()
+            # Apenas uma sincronização completa por vez; as demais requisições aguardam o resultado
+            if not sincronizacao_inicial():
+                return _sincronizacao_em_andamento()
 
-                    logger.error(
-                        f"Erro ao salvar venda do pedido {e}", exc_info=True)
-                    continue
+        # Dados antigos são servidos na hora e atualizados em segundo plano
+        estado = estado_vendas()
+        idade = _idade_vendas(estado['ultima_sincronizacao'])
+        atualizando = _atualizar_se_antigo(idade)
 
-            # Atualize a lista de vendas após salvá-las no banco de dados
-            vendas = Venda.objects.all()
+        # Se o cliente já tem a versão atual, nem consulta as vendas
+        nao_modificado = _nao_modificado(request, estado, idade, atualizando)
+        if nao_modificado is not None:
+            return nao_modificado
 
-        # Preparar os dados para resposta
-        vendas_data = [{
-            'numero_pedido': venda.numero_pedido,
-            'numero_pedido_cliente': venda.numero_pedido_cliente,
-            'data_vencimento': venda.data_vencimento.strftime('%d/%m/%Y') if venda.data_vencimento else None,
-            'data_emissao': venda.data_emissao.strftime('%d/%m/%Y'),
-            'valor_total_pedido': venda.valor_total_pedido,
-            'produtos': venda.produtos
-        } for venda in vendas]
+        # A listagem completa sai pronta do snapshot; as demais são montadas com os campos pedidos.
+        # Enquanto o snapshot da última gravação é gerado, a listagem completa é lida na hora,
+        # para que quem acabou de gravar (um adiantamento, por exemplo) já veja o resultado
+        if consulta.padrao:
+            snapshot = obter_snapshot(estado['versao'] or 0)
+            if snapshot[0] >= (estado['versao'] or 0):
+                return _resposta_snapshot(request, snapshot, estado, idade, atualizando)
+            return _resposta_vendas(consulta.json_em_fluxo(), estado, idade, atualizando)
+        if consulta.streaming:
+            return _resposta_vendas(consulta.json_em_fluxo(), estado, idade, atualizando)
+        # Só a página vai ao banco de leitura: a sincronização inicial e o snapshot podem gravar,
+        # e o estado precisa refletir a última gravação; a exportação em streaming é lida depois
+        # que a view retorna, já fora do leitura_replica(), e por isso vem do banco principal
+        with leitura_replica():
+            vendas_data, proximo_cursor = consulta.pagina(
+                list(consulta.queryset()))
 
-        return JsonResponse(vendas_data, safe=False, status=200)
+        return _resposta_vendas(vendas_data, estado, idade, atualizando, proximo_cursor)
 
+    except ParametroInvalidoError as e:
+        return _parametro_invalido(e)
+    except CircuitoAbertoError:
+        return _omie_indisponivel()
     except Exception as e:
         logger.critical(f'Erro na rota de buscar vendas: {e}', exc_info=True)
         return HttpResponse(str(e), status=500)
@@ -67,11 +214,15 @@ def get_vendas_view(request):
 def alterar_pedido_view(request):
     try:
         pedido = json.loads(request.body)
+        if not circuito_omie.disponivel():
+            return _omie_indisponivel()
         omie_vendas = OmieVendas(APP_KEY, APP_SECRET)
         try:
             resposta = omie_vendas.alterar_pedido(pedido)
             return JsonResponse(resposta, status=200)
 
+        except CircuitoAbertoError:
+            return _omie_indisponivel()
         except Exception as e:
             logger.error(
                 f'Erro na resposta do serviço de alterar pedidos: {e}', exc_info=True)
@@ -87,18 +238,12 @@ def set_adiantamentos_view(request):
     try:
         vendas_a_adiantar = json.loads(request.body)
 
+        if not circuito_omie.disponivel():
+            return _omie_indisponivel()
         omie_vendas = OmieVendas(APP_KEY, APP_SECRET)
         resultado = omie_vendas.set_adiantamentos(vendas_a_adiantar)
 
-        if resultado['status_code'] == 200:
-            return JsonResponse({'message': resultado['message']}, status=200)
-        elif resultado['status_code'] == 404:
-            return JsonResponse({'message': resultado['message']}, status=404)
-        else:
-            if 'erros' in resultado:
-                return JsonResponse({'message': resultado['message'], 'erros': resultado['erros']}, status=resultado['status_code'])
-            else:
-                return JsonResponse({'message': resultado['message']}, status=resultado['status_code'])
+        return _resposta_adiantamentos(resultado)
 
     except Exception as e:
         logger.critical(
@@ -107,6 +252,10 @@ def set_adiantamentos_view(request):
 
 
 def webhook_omie(request):
+    """
+    Recebe o webhook da Omie e apenas enfileira o evento; a consulta do pedido e a gravação
+    na Venda são feitas pelo comando processar_webhooks.
+    """
     try:
         data = json.loads(request.body)
         numero_pedido = data.get('numero_pedido')
@@ -114,14 +263,80 @@ def webhook_omie(request):
         if numero_pedido is None:
             raise ValueError("Número do pedido não fornecido")
 
-        omie_vendas = OmieVendas(APP_KEY, APP_SECRET)
-        dados_pedido = omie_vendas.consultar_pedido(numero_pedido)
-
-        venda = Venda.criar_de_api(dados_pedido)
-        venda.save()
+        enfileirar_evento(numero_pedido, data.get('messageId'))
 
-        return JsonResponse({"message": "Pedido salvo com sucesso"}, status=200)
+        return JsonResponse({"message": "Evento recebido"}, status=200)
     except Exception as e:
         logger.critical(
             f'Erro no webhook de vendas: {e}', exc_info=True)
         return JsonResponse({"status": "error", "message": str(e)}, status=500)
+
+
+@require_http_methods(["GET"])
+@somente_leitura
+def buscar_vendas_view(request):
+    """
+    Busca de vendas pelo número do pedido do cliente e pela descrição e código dos produtos.
+    """
+    try:
+        return JsonResponse(buscar_vendas(request.GET), safe=False, status=200)
+    except ParametroInvalidoError as e:
+        return _parametro_invalido(e)
+    except Exception as e:
+        logger.critical(f'Erro na rota de busca de vendas: {e}', exc_info=True)
+        return HttpResponse(str(e), status=500)
+
+
+@require_http_methods(["GET"])
+@somente_leitura
+def resumo_vendas_view(request):
+    """
+    Totais das vendas em aberto por mês de vencimento e por adiantamento (das parcelas) e por
+    produto (unidades, itens de pedido e valor dos itens), lidos do ResumoVendas, que é mantido
+    a cada gravação de vendas.
+    """
+    try:
+        etag, modificado_em = _validadores(estado_vendas())
+        nao_modificado = get_conditional_response(
+            request, etag=etag, last_modified=modificado_em)
+        if nao_modificado is not None:
+            return nao_modificado
+
+        resumo = {"por_mes": [], "por_adiantamento": [], "por_produto": []}
+        for linha in ResumoVendas.objects.order_by('dimensao', 'chave'):
+            totais = {"quantidade": linha.quantidade, "valor": linha.valor}
+            if linha.dimensao == ResumoVendas.MES:
+                resumo["por_mes"].append({"mes": linha.chave or None, **totais})
+            elif linha.dimensao == ResumoVendas.ADIANTAMENTO:
+                resumo["por_adiantamento"].append(
+                    {"adiantada": linha.chave == 'S', **totais})
+            else:
+                # Nos produtos, a quantidade é de unidades vendidas e o valor, a soma dos itens
+                unidades = linha.unidades.normalize()
+                resumo["por_produto"].append({
+                    "codigo": linha.chave, "descricao": linha.descricao,
+                    "quantidade": int(unidades) if unidades == unidades.to_integral_value() else float(unidades),
+                    "itens": linha.quantidade, "valor": linha.valor})
+        resumo["por_produto"].sort(key=lambda produto: produto["valor"], reverse=True)
+
+        response = JsonResponse(resumo, status=200)
+        response['ETag'] = etag
+        if modificado_em is not None:
+            response['Last-Modified'] = http_date(modificado_em)
+        return response
+    except Exception as e:
+        logger.critical(f'Erro na rota de resumo de vendas: {e}', exc_info=True)
+        return HttpResponse(str(e), status=500)
+
+
+@require_http_methods(["GET"])
+def status_omie_view(request):
+    """
+    Estado da integração com a Omie (circuit breaker e cache de pedidos), para monitoramento e para o frontend.
+    """
+    status = circuito_omie.status()
+    return JsonResponse({
+        "disponivel": status["estado"] != circuito_omie.ABERTO,
+        "circuito": status,
+        "cache_pedidos": cache_pedidos.estatisticas(),
+    }, status=200)